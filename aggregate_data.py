@@ -1,7 +1,26 @@
 import pandas as pd
-from functools import reduce
+import argparse
+import importlib.util
 import os
-import matplotlib.pyplot as plt
+import sys
+import time
+from pipeline import CACHE_DIR, Pipeline, Stage
+import asn_tables
+import bootstrap
+import bravo
+import cost_model
+import dataframe_backend
+import streaming_ingest
+import partitioned_writer
+import instrumentation
+import margin_index
+import plotting
+import schema
+import results_parser
+import sweep
+from state_registry import get_registry
+import state_year_cube
+from state_year_cube import StateYearCube
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_colwidth', None)
@@ -25,122 +44,80 @@ UNF:6:Ky5FkettbvohjTSN/IVldA== [fileUNF]
 # function that transforms raw 2024 results
 def transform_2024_results():
     # 2024 House totals - based on presidential totals. Transform appropriately
-    house24 = pd.read_csv("presidential/dataverse_files/2024_votes.tsv", sep="\t")
+    # only the state, party and vote count columns are parsed
+    house24 = pd.DataFrame(results_parser.read_tsv("presidential/dataverse_files/2024_votes.tsv",
+                                                   {"State": "text", "Party": "text", "Votes": "count"}))
     house24['State'] = house24['State'].str.upper()
     house24 = house24[(house24["Party"].str.contains("Democrat")) | (house24["Party"].str.contains("Republican"))]
-    house24["Votes"] = house24["Votes"].str.replace(",","").astype(int)
-    house24['year'] = [2024]*len(house24)
-    house24.rename(mapper={'State':'state','Votes':'totalvotes'}, inplace=True, axis=1)
-    h24cols = house24.columns.to_list()
-    for hcl in h24cols:
-        if hcl not in ['state', 'totalvotes','year']:
-            house24.drop(columns=[hcl], inplace=True)    
+    house24 = pd.DataFrame({"state": house24["State"], "totalvotes": house24["Votes"], "year": 2024})
     house24 = house24.groupby(by=['state','year']).sum()
     house24.to_csv("intermediate_data/2024_votes_transformed.csv")
     return 
 
 # function that obtains total number of votes cast per year per state
-def get_total_votes_cast():
-    # read the data, and get relevant years.
-    house_data = pd.read_csv("house/dataverse_files/1976-2022-house.csv")
-    house_data = house_data[house_data['year'].between(2000,2022)]
-    # drop any unnecessary columns
-    house_data_cols = house_data.columns.tolist()
-    for hccol in house_data_cols:
-        if hccol not in ['year', 'state', 'state_po', 'district', 'totalvotes']:
-            house_data.drop(columns=[hccol], inplace=True)
-    # drop duplicate rows
-    house_data.drop_duplicates(inplace=True)
-    house_data.drop(columns=['district'], inplace=True)
-    # obtain 2024 data, and add state abbreviation data
-    transform_2024_results()
+# (with a chunksize, the source is streamed in bounded chunks instead of read whole;
+# otherwise the scan, de-duplication and sums run on the given dataframe backend)
+def get_total_votes_cast(chunksize: int = None, backend: str = None):
+    if chunksize:
+        # every district's total is counted once while streaming
+        house_data = streaming_ingest.house_totals("house/dataverse_files/1976-2022-house.csv",
+                                                   years=(2000, 2022), chunksize=chunksize).reset_index()
+    else:
+        # read only the relevant years and columns from the columnar cache
+        be = dataframe_backend.get_backend(backend)
+        house_data = be.scan("house/dataverse_files/1976-2022-house.csv",
+                             columns=['year', 'state', 'state_po', 'district', 'totalvotes'], years=(2000, 2022))
+        # every district's total is counted once
+        house_data = be.to_pandas(be.group_agg(be.distinct(house_data), ['year', 'state', 'state_po'],
+                                               {'totalvotes': "sum"}))
+    # obtain 2024 data (written by transform_2024_results), and add state abbreviation data
     h24 = pd.read_csv("intermediate_data/2024_votes_transformed.csv")
-    h24['state_po'] = h24['state'].apply(lambda st: set(house_data[house_data.state==st].state_po).pop())
+    h24['state_po'] = get_registry().convert(h24['state'], "name", "postal")
     # stack with current data
     house_data = pd.concat(objs=[house_data,h24],axis=0)
     # get the total number of votes
     totals = house_data.groupby(by=['year','state','state_po']).sum()
-    totals.to_csv("intermediate_data/totals.csv")
+    schema.write_csv(totals, "intermediate_data/totals.csv", schema.TOTALS)
     return
 
-# get all the 3 dataframes
-def compute_totals():
-    house = pd.read_csv("house/house_margins.csv")
-    senate = pd.read_csv("senate/senate_margins.csv")
-    president = pd.read_csv("presidential/presidential_margins.csv")
-    # perform a full-outer join on them
-    allHSP = reduce(lambda L,R: pd.merge(L,R,on=['year','state','state_po'],
-                                        how='outer'),[house,senate,president])
-    allHSP_cols = allHSP.columns.tolist()
-    # drop irrelevant columns
-    for acol in allHSP_cols:
-        if acol.startswith("margin") or acol.startswith("Unnamed"):
-            allHSP.drop(columns=[acol], inplace=True)
-    # rename the columns appropriately {'_x': '_house', '_y':'_senate'}
-    mapper = {'num_ballots_x':'num_ballots_house',
-            'num_ballots_y':'num_ballots_senate',
-            'num_ballots':'num_ballots_president',
-            'procedural_cost_x':'procedural_cost_house',
-            'procedural_cost_y':'procedural_cost_senate',
-            'procedural_cost':'procedural_cost_president'}
-    allHSP.rename(mapper=mapper, axis=1, inplace=True)
-    # any NAs are indicative of an election not existing 
-    # for that year in that state, so replace with 0
-    allHSP.fillna(value=0.0,inplace=True)
-    # compute totals
-    allHSP["num_ballots_total"] = allHSP['num_ballots_house'] + \
-                                    allHSP['num_ballots_senate'] + \
-                                    allHSP['num_ballots_president']
-    allHSP["procedural_cost_total"] = allHSP['procedural_cost_house'] + \
-                                        allHSP['procedural_cost_senate'] + \
-                                        allHSP['procedural_cost_president']
-    allHSP["procedural_cost_excl_pres"] = allHSP['procedural_cost_house'] + allHSP['procedural_cost_senate']
-    # typecast columns to the proper type
-    allHSP_cols = allHSP.columns.to_list()
-    for col in allHSP_cols:
-        if col.startswith("num_ballots"):
-            allHSP[col] = allHSP[col].astype(int)
-    # attach total votes data
-    get_total_votes_cast()
-    totHSP = pd.read_csv("intermediate_data/totals.csv")
-    allHSP = pd.merge(left=allHSP, right=totHSP, how='outer', on=['year','state','state_po'])
-    allHSP.fillna(0.0, inplace=True)
-    return allHSP
+# get all the 3 dataframes, placed into one (office x year x state) cube
+# together with the vote totals (written by get_total_votes_cast). The office
+# results are taken as returned by the office pipelines; an office without a
+# frame is read from its margins file. With the BRAVO simulations of
+# simulate_bravo, the sample sizes (and procedural costs) of every office they
+# cover are the simulated statistic stat instead of 7/margin.
+def compute_totals(president: pd.DataFrame = None, house: pd.DataFrame = None, senate: pd.DataFrame = None,
+                   sims: pd.DataFrame = None, stat: str = "asn_mean"):
+    frames = {"house": house, "senate": senate, "president": president}
+    margins = StateYearCube.read_margins({office: path for office, path in state_year_cube.MARGIN_FILES.items()
+                                          if frames[office] is None})
+    margins.update({office: f.reset_index() for office, f in frames.items() if f is not None})
+    if sims is not None:
+        for office in sims["office"].unique():
+            margins[office] = bravo.with_simulated_sample_sizes(margins[office], sims, office, stat)
+    cube = StateYearCube.from_frames(margins, schema.read_csv("intermediate_data/totals.csv", schema.TOTALS,
+                                                              usecols=["year", "state", "totalvotes"]))
+    # any state-year without a contest of an office has 0 ballots and cost for that office
+    return cube.to_frame()
 
-# function that will calculate total prep costs
-# Prep Total (for each state): 8 * clerk_wage/hr * num_counties + num_ballots_cast/500 * time_to_index
-def add_prep_costs(tot: pd.DataFrame):
-    # number of counties by state, transform appropriately.
-    counties = pd.read_csv("counties_by_state.tsv", sep="\t")
-    counties['State'] = counties['State'].str.upper()
-    counties.drop(columns=["#"], inplace=True)
-    # apply number of counties data to each states
-    tot["num_counties"] = tot["state"].apply(lambda st: counties[counties.State==st]["Total Number of Counties"].item())
-    clerk_wage_hr = 21.23
-    hrs_to_idx = 2
-    # add prep total
-    tot["prep_cost_total"] = (8*clerk_wage_hr*tot["num_counties"]) + ((tot['totalvotes']/500)*hrs_to_idx)
-    return tot
-
-# function that will add central costs
-# constant value of 33580
-def add_central_costs(tot: pd.DataFrame):
-    centrals = [33580]*len(tot)
-    tot["central_cost_total"] = centrals
-    return tot
+# function that simulates the BRAVO audits of every contest (see bravo.py) for
+# compute_totals. The house is audited per district, so only when its district
+# table was written (house_districts); otherwise it keeps 7/margin.
+def simulate_bravo(trials: int = bravo.TRIALS, house_districts: bool = False):
+    contests = bravo.load_contests(district_file=bravo.DISTRICT_FILE if house_districts else None)
+    return bravo.simulate_all(contests, trials)
 
-# function that adds all 3 costs together
-def add_all3_costs():
-    totals_data = compute_totals()
-    totals_data = add_prep_costs(tot=totals_data)
-    totals_data = add_central_costs(tot=totals_data)
-    totals_data["cost_total"] = totals_data['central_cost_total'] + \
-                                totals_data['prep_cost_total'] + \
-                                totals_data['procedural_cost_total']
-    totals_data["cost_total_excl_pres"] = totals_data['central_cost_total'] + \
-                                        totals_data['prep_cost_total'] + \
-                                        totals_data['procedural_cost_excl_pres']
-    return totals_data
+# function that adds all 3 costs together, with the cost model's all_costs:
+# Prep Total (for each state): 8 * clerk_wage/hr * num_counties + num_ballots_cast/500 * time_to_index
+# Central Total: constant value of 33580
+def add_all3_costs(totals_data: pd.DataFrame):
+    # number of counties by state, mapped onto every row in one lookup
+    totals_data["num_counties"] = get_registry().convert(totals_data["state"], "name", "num_counties")
+    costs = cost_model.all_costs(totals_data[[f"num_ballots_{o}" for o in cost_model.OFFICES]].to_numpy().T,
+                                 totals_data["num_counties"].to_numpy(), totals_data["totalvotes"].to_numpy())
+    for col in ["prep_cost_total", "central_cost_total", "cost_total", "cost_total_excl_pres"]:
+        totals_data[col] = costs[col]
+    return schema.apply(totals_data, schema.STATE_YEAR)
 
 # function that would give the total cost of the RLA (national) by year, as well as average
 def calculate_national_rla_cost(totData: pd.DataFrame):
@@ -159,7 +136,7 @@ def calculate_national_rla_cost(totData: pd.DataFrame):
     natl_rla_cost_nopres.to_csv("important-data/total_yearly_cost_(no_president).csv")
     print("National Avg. RLA cost (president):", natl_rla_cost_wpres['cost_total'].mean())
     print("National Avg. RLA cost (no-president):", natl_rla_cost_nopres['cost_total_excl_pres'].mean())
-    return
+    return natl_rla_cost_wpres, natl_rla_cost_nopres
 
 # function that will calculate state-by-state averages
 def calculate_state_by_state_rla_cost(totData: pd.DataFrame):
@@ -167,8 +144,8 @@ def calculate_state_by_state_rla_cost(totData: pd.DataFrame):
     state_rla_cost_nopres = pd.concat([totData["state"], totData["state_po"],totData["cost_total_excl_pres"]], axis=1)
     state_rla_cost_wpres = state_rla_cost_wpres[state_rla_cost_wpres['year']%4==0]
     state_rla_cost_wpres.drop(columns=['year'], inplace=True)
-    state_rla_cost_wpres = state_rla_cost_wpres.groupby(by=['state','state_po']).mean()
-    state_rla_cost_nopres = state_rla_cost_nopres.groupby(by=['state','state_po']).mean()
+    state_rla_cost_wpres = state_rla_cost_wpres.groupby(by=['state','state_po'], observed=True).mean()
+    state_rla_cost_nopres = state_rla_cost_nopres.groupby(by=['state','state_po'], observed=True).mean()
     if not os.path.exists("important-data"):
         os.mkdir("important-data")
     # 1. cost for elections that include president
@@ -179,108 +156,214 @@ def calculate_state_by_state_rla_cost(totData: pd.DataFrame):
     state_rla_cost_nopres.to_csv("important-data/avg_state_cost_(no_president).csv")    
     return 
 
-# function that writes results
-def write_results(all_data: pd.DataFrame):
+# function that writes the confidence intervals of the yearly national and
+# average state costs next to their tables, from bootstrap and perturbation replicates
+def calculate_cost_intervals(all_data: pd.DataFrame, replicates: int = bootstrap.REPLICATES,
+                             seed: int = bootstrap.SEED):
+    base = sweep.load_base(all_data)
+    tables, national = bootstrap.intervals(base, bootstrap.replicate(base, replicates, seed))
+    bootstrap.write_intervals(tables, "important-data")
+    for name, (est, low, high) in national.items():
+        print(f"National Avg. RLA cost ({name.replace('_', '-')}) {100*bootstrap.LEVEL:g}% interval:", low, high)
+    return
+
+# function that writes results, one file per state in a single partitioned pass
+# (optionally also as a parquet dataset partitioned by state_po)
+def write_results(all_data: pd.DataFrame, dataset: bool = False):
     if not os.path.exists("important-data"):
         os.mkdir("important-data")
     all_data['cost_total'] = all_data['cost_total'].round(2)
-    all_data.to_csv("important-data/all_data_by_state_yr.csv")
-    if not os.path.exists("important-data/state-by-state"):
-        os.mkdir("important-data/state-by-state")
-    for st in set(all_data['state_po']):
-        ssp = all_data[all_data.state_po == st].reset_index(drop=True)
-        ssp.to_csv(f"important-data/state-by-state/all_data_{st}.csv")
+    schema.write_csv(all_data, "important-data/all_data_by_state_yr.csv", schema.STATE_YEAR)
+    partitioned_writer.write_partitions(all_data, "state_po", "important-data/state-by-state/all_data_{}.csv",
+                                        index=False)
+    if dataset:
+        partitioned_writer.write_dataset(all_data, "important-data/all_data_by_state_yr", key="state_po")
 
-# function that generates a line plot showing the combined total cost of an RLA
-# for presidential years
-def graph_total_cost():
-    # get the correct data
-    data = pd.read_csv("important-data/total_yearly_cost_(president).csv")
-    years = data.year
-    cost = data.cost_total
-    plt.plot(years, cost, color='orange')
-    # create directory
-    if not os.path.exists("plots"):
-        os.mkdir('plots')
-    plt.xticks(ticks=years)
-    plt.xlabel("Year")
-    plt.ylabel("Cost (Millions of $)")
-    for yr in range(2000, 2025, 4):
-        y,c = data[data.year==yr].year.item(), data[data.year==yr].cost_total
-        dispc = (c/1e6).round(2).item()
-        plt.annotate(text=f"${dispc}M", xy=(y,c.item()))
-    plt.title("Combined Total Cost for Presidential Election Years")
-    plt.savefig('plots/total_presidential_plot_1.png')
-    return 
+# function that renders the summary plots, and with state_plots one plot per
+# state, from the in-memory yearly costs, state-year table and presidential
+# results; every figure is drawn in its own worker process
+def graph_results(national: tuple, all_data: pd.DataFrame, president: pd.DataFrame = None,
+                  house: pd.DataFrame = None, senate: pd.DataFrame = None, state_plots: bool = False):
+    natl_rla_cost_wpres, natl_rla_cost_nopres = national
+    # the margins of every office (read from the office script's file without a frame)
+    frames = {office: frame if frame is not None else schema.read_csv(margin_index.MARGIN_FILES[office],
+                                                                       schema.MARGINS)
+              for office, frame in [("president", president), ("senate", senate), ("house", house)]}
+    index = margin_index.MarginIndex.from_frames(frames)
+    # the 5 closest and the 5 least close 2024 presidential contests
+    top5 = index.closest(5, "president", 2024)
+    bottom5 = index.widest(5, "president", 2024).iloc[::-1]
+    jobs = [(plotting.total_cost_figure, {"data": natl_rla_cost_wpres.reset_index()}),
+            (plotting.total_cost_non_presidential_figure, {"data": natl_rla_cost_nopres.reset_index()}),
+            (plotting.swing_vs_nonswing_figure, {"avgtop5": top5['procedural_cost'].mean(),
+                                                 "avgbottom5": bottom5['procedural_cost'].mean()}),
+            (plotting.swing_vs_nonswing_by_year_figure, {"table": index.swing_vs_nonswing(5)})]
+    if state_plots:
+        jobs += plotting.state_jobs(all_data, "plots/state-by-state")
+    plotting.render(jobs)
+    print(top5.drop(columns=['office', 'year', 'num_ballots', 'procedural_cost']))
+    print(bottom5.drop(columns=['office', 'year', 'num_ballots', 'procedural_cost']))
+    return
 
+# function that imports one of the office scripts and runs its pipeline on the
+# sources next to it; returns the office results. options that are not set
+# (e.g. no chunksize) are left to the script's defaults.
+def run_office(path: str, **options):
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.run(directory=os.path.dirname(os.path.abspath(path)),
+                      **{k: v for k, v in options.items() if v})
 
-# function that generates a line plot showing the combined total cost of an RLA
-# for presidential years
-def graph_total_cost_non_presidential():
-    plt.clf()
-    # get the correct data
-    data = pd.read_csv("important-data/total_yearly_cost_(no_president).csv")
-    years = data.year
-    cost = data.cost_total_excl_pres
-    plt.plot(years, cost, color='lightblue')
-    # create directory
-    if not os.path.exists("plots"):
-        os.mkdir('plots')
-    plt.xticks(ticks=years)
-    plt.xlabel("Year")
-    plt.ylabel("Cost (Millions of $)")
-    for yr in range(2000, 2025, 2):
-        y,c = data[data.year==yr].year.item(), data[data.year==yr].cost_total_excl_pres
-        dispc = (c/1e6).round(2).item()
-        plt.annotate(text=f"${dispc}M", xy=(y,c.item()))
-    plt.title("Combined Total Cost for Election Years")
-    plt.savefig('plots/total_allyr_plot_2.png')
-    return
+# function that declares the stage graph of the whole pipeline. Every stage
+# lists the files it reads and writes (the partitioned ones as glob patterns),
+# so that it is only rerun when one of its inputs, its code or an upstream
+# value changed, or one of its outputs is gone.
+def build_pipeline(chunksize: int = None, dataset: bool = False, state_plots: bool = False,
+                   intervals: int = None, house_districts: bool = False, backend: str = None,
+                   bravo_stat: str = None, bravo_trials: int = bravo.TRIALS, audit: str = None):
+    # modules shared by the office scripts
+    shared = ["cost_model.py", "dataverse_cache.py", "dataframe_backend.py", "streaming_ingest.py",
+              "partitioned_writer.py", "results_store.py", "results_parser.py", "schema.py"]
+    # with an audit, the office scripts look its sample sizes up in the ASN tables,
+    # and the senate and presidential ones cost escalations with the 2024 ballots cast
+    votes = []
+    if audit:
+        shared += ["asn_tables.py", os.path.relpath(asn_tables.TABLE_PATH)]
+        votes = ["presidential/dataverse_files/2024_votes.tsv"]
+    registry = ["state_registry.py", "state_abbr.tsv", "counties_by_state.tsv"]
+    house_src = shared + registry + ["house/calculateHouseCosts.py",
+                          "house/dataverse_files/house_election_chart.xlsx"]
+    # per district, the house margins come from the MEDSL returns (and the workbook after 2022)
+    if house_districts:
+        house_src += ["house/dataverse_files/1976-2022-house.csv"]
+    senate_src = shared + registry + ["senate/getSenateData.py",
+                           "senate/dataverse_files/1976-2020-senate.csv",
+                           "senate/dataverse_files/2022_senate.tsv", "senate/dataverse_files/2024_senate.txt"] + votes
+    pres_src = shared + registry + ["presidential/getPresidentialData.py",
+                         "presidential/dataverse_files/1976-2020-president.csv",
+                         "presidential/dataverse_files/2024_US_President.txt"] + votes
+    # the office pipelines run side by side in worker processes and pass their results back
+    stages = [
+        Stage("presidential", run_office, category="script", concurrent=True,
+              params={"path": "presidential/getPresidentialData.py", "chunksize": chunksize, "backend": backend,
+                      "audit": audit},
+              inputs=pres_src, outputs=["presidential/presidential_margins.csv",
+                                        "presidential/state-by-state/presidential_margins_*.csv"]),
+        # the house stage takes no chunksize, its sources are read whole
+        Stage("house", run_office, category="script", concurrent=True,
+              params={"path": "house/calculateHouseCosts.py", "districts": house_districts, "backend": backend,
+                      "audit": audit},
+              inputs=house_src,
+              outputs=(["house/house_district_margins.csv"] if house_districts
+                       else ["house/house_margins.csv", "house/state-by-state/house_margins_*.csv"])),
+        Stage("senate", run_office, category="script", concurrent=True,
+              params={"path": "senate/getSenateData.py", "chunksize": chunksize, "backend": backend,
+                      "audit": audit},
+              inputs=senate_src, outputs=["senate/senate_margins.csv", "senate/state-by-state/senate_margins_*.csv"]),
+        Stage("transform_2024_results", transform_2024_results, category="transform",
+              inputs=["results_parser.py", "presidential/dataverse_files/2024_votes.tsv"],
+              outputs=["intermediate_data/2024_votes_transformed.csv"]),
+        Stage("get_total_votes_cast", get_total_votes_cast, category="load",
+              params={"chunksize": chunksize, "backend": backend},
+              inputs=["dataverse_cache.py", "dataframe_backend.py", "streaming_ingest.py",
+                      "house/dataverse_files/1976-2022-house.csv",
+                      "intermediate_data/2024_votes_transformed.csv"] + registry,
+              outputs=["intermediate_data/totals.csv"]),
+        Stage("compute_totals", compute_totals, category="merge",
+              deps=["presidential", "house", "senate"] + (["simulate_bravo"] if bravo_stat else []),
+              params={"stat": bravo_stat} if bravo_stat else {},
+              inputs=["intermediate_data/totals.csv", "state_year_cube.py"] + registry),
+        Stage("add_all3_costs", add_all3_costs, category="transform", deps=["compute_totals"],
+              inputs=["cost_model.py"] + registry),
+        Stage("calculate_national_rla_cost", calculate_national_rla_cost, category="transform",
+              deps=["add_all3_costs"],
+              outputs=["important-data/total_yearly_cost_(president).csv",
+                       "important-data/total_yearly_cost_(no_president).csv"]),
+        Stage("calculate_state_by_state_rla_cost", calculate_state_by_state_rla_cost, category="transform",
+              deps=["add_all3_costs"],
+              outputs=["important-data/avg_state_cost_(president).csv",
+                       "important-data/avg_state_cost_(no_president).csv"]),
+        Stage("write_results", write_results, category="write", deps=["add_all3_costs"],
+              params={"dataset": dataset},
+              outputs=["important-data/all_data_by_state_yr.csv", "important-data/state-by-state/all_data_*.csv"]
+                      + (["important-data/all_data_by_state_yr/*/*.parquet"] if dataset else [])),
+        Stage("graph_results", graph_results, category="plot",
+              deps=["calculate_national_rla_cost", "add_all3_costs", "presidential", "house", "senate"],
+              params={"state_plots": state_plots}, inputs=["plotting.py", "margin_index.py"],
+              outputs=["plots/total_presidential_plot_1.png", "plots/total_allyr_plot_2.png",
+                       "plots/top5_bottom5_plot_5.png", "plots/swing_vs_nonswing_by_year_plot_6.png"]
+                      + (["plots/state-by-state/cost_*.png"] if state_plots else [])),
+    ]
+    # the ASN tables are built once, before the office pipelines look them up side by side
+    if audit:
+        stages.append(Stage("asn_tables", asn_tables.load_tables, category="load", inputs=["asn_tables.py"],
+                            outputs=[os.path.relpath(asn_tables.TABLE_PATH)]))
+    # with a BRAVO statistic, the simulated sample sizes replace 7/margin
+    if bravo_stat:
+        stages.append(Stage("simulate_bravo", simulate_bravo, category="transform",
+                            params={"trials": bravo_trials, "house_districts": house_districts},
+                            inputs=["intermediate_data/totals.csv"] + list(bravo.MARGIN_FILES.values())
+                                   + ([bravo.DISTRICT_FILE] if house_districts else [])))
+    if intervals:
+        stages.append(Stage("calculate_cost_intervals", calculate_cost_intervals, category="transform",
+                            deps=["add_all3_costs"], params={"replicates": intervals},
+                            inputs=["bootstrap.py", "sweep.py", "cost_model.py"],
+                            outputs=[f"important-data/{name}_ci.csv" for name in bootstrap.TABLES]))
+    return Pipeline(stages)
 
-# function that compares the average procedural costs for 
-# top 5 closest contests vs bottom 5. This is only for 2024
-# presidential contests.
-def graph_diff_in_swing_vs_nonswing():
-    plt.clf()
-    data = pd.read_csv("presidential/presidential_margins.csv")
-    data = data[data.year == 2024].reset_index(drop=True)
-    data.drop(columns=["Unnamed: 0"], inplace=True)
-    data = data.sort_values(axis=0, by="margin", ascending=True)
-    top5 = data.head(5)
-    bottom5 = data.tail(5)
-    avgtop5 = top5['procedural_cost'].mean()
-    avgbottom5 = bottom5['procedural_cost'].mean()
-    fig, ax = plt.subplots()
-    fig.set_figheight(9)
-    fig.set_figwidth(8)
-    bars = ax.bar(["Top 5", "Bottom 5"],[avgtop5, avgbottom5], color='seagreen')
-    ax.set_ylabel("Average Procedural Cost ($)")
-    ax.set_title("Avg. Cost of Top 5 vs. Bottom 5 Closest Contests in 2024 President Election")
-    for bar in bars:
-        plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height(),
-             f'${bar.get_height():.2f}', ha='center', va='bottom', fontsize=12)
-    if not os.path.exists("plots"):
-        os.mkdir('plots')
-    plt.savefig("plots/top5_bottom5_plot_5.png")
-    print(top5.drop(columns=['year', 'num_ballots', 'procedural_cost']))
-    print(bottom5.drop(columns=['year', 'num_ballots', 'procedural_cost']))
-    return
-    
 ### main procedure
 if __name__ == '__main__':
-    # as a precautionary check, generate all data first
-    for dt in ['presidential/getPresidentialData.py', 
-               'house/calculateHouseCosts.py', 
-               'senate/getSenateData.py']:
-        dir, script = dt.split('/')
-        os.chdir(f"{dir}")
-        os.system(f"python3 {script}")
-        os.chdir("..")
-    totals_data = add_all3_costs()
-    calculate_national_rla_cost(totData=totals_data)
-    calculate_state_by_state_rla_cost(totData=totals_data)
-    write_results(totals_data)
-    # generate plots
-    graph_total_cost()
-    graph_total_cost_non_presidential()
-    graph_diff_in_swing_vs_nonswing()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Compute the national RLA cost model.")
+    parser.add_argument("--force", action="store_true", help="rerun every stage, ignoring the cache")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="stream the election-return CSVs in chunks of this many rows")
+    parser.add_argument("--dataset", action="store_true",
+                        help="also write the state-year table as a parquet dataset partitioned by state_po")
+    parser.add_argument("--state-plots", action="store_true",
+                        help="also plot every state's yearly cost under plots/state-by-state")
+    parser.add_argument("--intervals", type=int, default=None, metavar="REPLICATES",
+                        help="also write bootstrap confidence intervals of the yearly and state costs")
+    parser.add_argument("--house-districts", action="store_true",
+                        help="run the house cost model per district, with margins from the MEDSL returns")
+    parser.add_argument("--backend", choices=dataframe_backend.BACKENDS, default=None,
+                        help="dataframe engine of the scans and aggregations of the sources (default: pandas)")
+    parser.add_argument("--audit", choices=cost_model.AUDITS, default=None,
+                        help="use the average sample numbers of this audit (from the ASN tables) instead of 7/margin")
+    parser.add_argument("--bravo", choices=bravo.STATS, default=None, metavar="STAT",
+                        help="use this statistic of simulated BRAVO audits as the sample sizes instead of "
+                             "7/margin (the house only with --house-districts)")
+    parser.add_argument("--bravo-trials", type=int, default=bravo.TRIALS,
+                        help="trials per contest of the BRAVO simulations")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for the office pipelines (0 runs them one after another)")
+    parser.add_argument("--report", default=os.path.join(CACHE_DIR, "run_report.json"),
+                        help="where to write the JSON run report")
+    parser.add_argument("--trace", default=None, help="also write the run as a Chrome trace to this file")
+    parser.add_argument("--profile", action="store_true",
+                        help="sample the Python stack of the stages that run (folded stacks next to the report)")
+    parser.add_argument("--profile-stage", action="append", default=None,
+                        help="with --profile, only sample this stage (can be repeated)")
+    parser.add_argument("stages", nargs="*", help="only bring these stages (and their inputs) up to date")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    recorder = instrumentation.start(profile=args.profile or bool(args.profile_stage), profile_only=args.profile_stage)
+    recorder.share_with_children()
+    pipe = build_pipeline(chunksize=args.chunksize, dataset=args.dataset, state_plots=args.state_plots,
+                          intervals=args.intervals, house_districts=args.house_districts, backend=args.backend,
+                          bravo_stat=args.bravo, bravo_trials=args.bravo_trials, audit=args.audit)
+    try:
+        pipe.run(targets=args.stages or None, force=args.force, workers=args.workers)
+    finally:
+        # the report is written for failed runs too
+        recorder.collect_children()
+        instrumentation.stop()
+        elapsed = time.perf_counter() - start
+        recorder.write_report(args.report, wall_seconds=elapsed, argv=sys.argv[1:],
+                              ran=pipe.ran, skipped=pipe.skipped)
+        if args.trace:
+            recorder.write_chrome_trace(args.trace)
+        if recorder.profile:
+            recorder.write_profile(os.path.splitext(args.report)[0] + ".folded")
+    print(f"ran {len(pipe.ran)} stage(s), skipped {len(pipe.skipped)} in {elapsed:.2f}s")
@@ -0,0 +1,182 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import cost_model
+
+# precomputed average sample numbers (ASN) and sample-size quantiles for
+# ballot-polling (BRAVO) and ballot-comparison (Kaplan-Markov) audits.
+#
+# Both audits stop the first time a statistic of the form
+#   n*a - k*b >= log(1/alpha)
+# holds, where n is the number of ballots drawn and k the number of "bad"
+# draws, each drawn independently with probability q:
+#   BRAVO:  a = log(2p), b = log(2p) - log(2(1-p)), q = 1-p, p = (1+margin)/2
+#   KM:     a = -log(1 - margin/(2*gamma)), b = -log(1 - 1/(2*gamma)),
+#           q = rate of 1-vote overstatements
+# so the exact distribution of the stopping time follows from a dynamic
+# program over k. Tables are built once over a margin x risk-limit grid,
+# stored under the repository's intermediate_data/ (wherever the scripts run
+# from) and rebuilt only when the grid spec changes.
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intermediate_data", "asn_tables.npz")
+GAMMA = 1.03905               # error inflation factor for ballot comparison
+OVERSTATEMENT_RATE = 0.001    # expected rate of 1-vote overstatements
+METHODS = ("bravo", "comparison")
+STATS = ("mean", "p50", "p90", "p99", "p_escalate")
+SPEC = {"margins": {"start": 0.002, "stop": 1.0, "num": 160},
+        "alphas": [0.01, 0.05, 0.1, 0.2],
+        "max_draws": 10_000,
+        "gamma": GAMMA,
+        "overstatement_rate": OVERSTATEMENT_RATE}
+
+_TABLES = {}
+
+# function that returns the parameters (a, b, q) of an audit for one margin
+def walk_params(margin: float, method: str, gamma: float = GAMMA, overstatement_rate: float = OVERSTATEMENT_RATE):
+    if method == "bravo":
+        p = min((1 + margin)/2, 1.0)
+        a = np.log(2*p)
+        b = a - np.log(2*(1 - p)) if p < 1 else np.inf
+        return a, b, 1 - p
+    if method == "comparison":
+        a = -np.log(1 - min(margin, 1.0)/(2*gamma))
+        b = -np.log(1 - 1/(2*gamma))
+        return a, b, overstatement_rate
+    raise ValueError(f"unknown audit method '{method}', expected one of {METHODS}")
+
+# function that computes the exact distribution of the stopping time (in draws).
+# returns the probability of stopping at each n in 1..max_draws and the
+# probability of not stopping by then (i.e. escalating to a full hand count)
+def stopping_distribution(a: float, b: float, q: float, alpha: float, max_draws: int, tol: float = 1e-15):
+    t = np.log(1/alpha)
+    pmf = np.zeros(max_draws + 1)
+    if q == 0 or not np.isfinite(b):
+        n_stop = int(np.ceil(t/a))
+        if n_stop <= max_draws:
+            pmf[n_stop] = 1.0
+            return pmf, 0.0
+        return pmf, 1.0
+    # alive mass over k = lo, lo+1, ...
+    alive = np.array([1.0])
+    lo = 0
+    for n in range(1, max_draws + 1):
+        nxt = np.empty(len(alive) + 1)
+        nxt[:-1] = alive*(1 - q)
+        nxt[-1] = 0.0
+        nxt[1:] += alive*q
+        alive = nxt
+        # every k at or below the boundary has stopped
+        k_stop = int(np.floor((n*a - t)/b))
+        cut = k_stop - lo + 1
+        if cut > 0:
+            pmf[n] = alive[:cut].sum()
+            alive = alive[cut:]
+            lo += cut
+        # drop the far tail of k that carries no mass
+        if n % 64 == 0 and len(alive) > 1:
+            tail = np.cumsum(alive[::-1])
+            keep = len(alive) - np.searchsorted(tail, tol)
+            alive = alive[:max(keep, 1)]
+        if len(alive) == 0 or alive.sum() < tol:
+            return pmf, 0.0
+    return pmf, float(alive.sum())
+
+# function that summarizes a stopping-time distribution; escalated audits count as max_draws
+def summarize(pmf: np.ndarray, p_escalate: float):
+    n = np.arange(len(pmf))
+    max_draws = len(pmf) - 1
+    cdf = np.cumsum(pmf)
+    def quantile(level):
+        i = np.searchsorted(cdf, level - 1e-12)
+        return float(min(i, max_draws))
+    return {"mean": float((n*pmf).sum() + p_escalate*max_draws),
+            "stopped_mean": float((n*pmf).sum()),
+            "p50": quantile(0.5), "p90": quantile(0.9), "p99": quantile(0.99),
+            "p_escalate": p_escalate}
+
+def _margin_grid(spec: dict):
+    m = spec["margins"]
+    return np.geomspace(m["start"], m["stop"], m["num"])
+
+def spec_hash(spec: dict):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+# function that builds every table of a grid spec
+def build_tables(spec: dict = SPEC):
+    margins = _margin_grid(spec)
+    alphas = np.asarray(spec["alphas"], dtype=float)
+    fields = STATS + ("stopped_mean",)
+    tables = {f: np.zeros((len(METHODS), len(alphas), len(margins))) for f in fields}
+    for mi, method in enumerate(METHODS):
+        for ai, alpha in enumerate(alphas):
+            for gi, margin in enumerate(margins):
+                a, b, q = walk_params(margin, method, spec["gamma"], spec["overstatement_rate"])
+                summary = summarize(*stopping_distribution(a, b, q, alpha, spec["max_draws"]))
+                for f in fields:
+                    tables[f][mi, ai, gi] = summary[f]
+    return {"margins": margins, "alphas": alphas, **tables}
+
+# function that loads the tables for a spec, building and saving them first if
+# the stored ones were built from a different spec
+def load_tables(spec: dict = SPEC, path: str = TABLE_PATH):
+    key = spec_hash(spec)
+    if key in _TABLES:
+        return _TABLES[key]
+    tables = None
+    if os.path.exists(path):
+        with np.load(path) as stored:
+            if str(stored["spec_hash"]) == key:
+                tables = {f: stored[f] for f in stored.files if f != "spec_hash"}
+    if tables is None:
+        tables = build_tables(spec)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, spec_hash=key, **tables)
+    _TABLES[key] = tables
+    return tables
+
+# function that interpolates one table row in log-margin space
+def _interp(tables: dict, stat: str, mi: int, ai: int, log_margin: np.ndarray):
+    return np.interp(log_margin, np.log(tables["margins"]), tables[stat][mi, ai])
+
+# function that looks up the sample size of whole arrays of margins in O(1) per contest.
+# alpha is a scalar; between two grid risk limits the result is interpolated
+# linearly in log(alpha). margins at or below zero escalate outright. when
+# ballots_cast is given, escalated audits count as a full hand count for the
+# mean instead of max_draws.
+def asn(margin, alpha: float = cost_model.RISK_LIMIT, method: str = "bravo", stat: str = "mean",
+        ballots_cast=None, spec: dict = SPEC):
+    if method not in METHODS:
+        raise ValueError(f"unknown audit method '{method}', expected one of {METHODS}")
+    if stat not in STATS:
+        raise ValueError(f"unknown statistic '{stat}', expected one of {STATS}")
+    tables = load_tables(spec)
+    mi = METHODS.index(method)
+    margin = np.asarray(margin, dtype=float)
+    grid = tables["margins"]
+    log_margin = np.log(np.clip(margin, grid[0], grid[-1]))
+    alphas = tables["alphas"]
+    if not alphas[0] <= alpha <= alphas[-1]:
+        raise ValueError(f"risk limit {alpha} is outside the table range [{alphas[0]}, {alphas[-1]}]")
+    hi = min(int(np.searchsorted(alphas, alpha)), len(alphas) - 1)
+    lo = max(hi - 1, 0)
+    w = 0.0 if hi == lo else (np.log(alpha) - np.log(alphas[lo]))/(np.log(alphas[hi]) - np.log(alphas[lo]))
+    def lookup(s):
+        return (1 - w)*_interp(tables, s, mi, lo, log_margin) + w*_interp(tables, s, mi, hi, log_margin)
+    cap = spec["max_draws"]
+    if ballots_cast is not None and stat == "mean":
+        full = np.asarray(ballots_cast, dtype=float)
+        out = lookup("stopped_mean") + lookup("p_escalate")*full
+        return np.where(margin > 0, out, full)
+    out = lookup(stat)
+    return np.where(margin > 0, out, 1.0 if stat == "p_escalate" else cap)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the ASN lookup tables.")
+    parser.add_argument("--path", default=TABLE_PATH)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    load_tables(SPEC, args.path)
+    print(f"ASN tables ready at {args.path} in {time.perf_counter() - start:.1f}s")
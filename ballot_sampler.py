@@ -0,0 +1,239 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import cost_model
+from bravo import DISTRICT_FILE, MARGIN_FILES, load_contests
+from state_registry import get_registry
+
+# reproducible audit samples drawn from ballot manifests, with the SHA-256
+# pseudo-random sampler of Rivest's sampler.py that the VV methods paper
+# assumes: the ticket-th draw is SHA-256("<seed>,<ticket>") read as an
+# integer, mod the number of ballots, plus one. Without replacement, tickets
+# that hit a ballot already drawn are skipped. A sample is the first tickets of
+# its seed, so an escalation round continues from the last ticket drawn and
+# never redraws (or changes) the ballots of the earlier rounds.
+#
+# A manifest lists the ballots of every batch (county, batch, ballots). It is
+# turned once into an index of cumulative ballot counts per batch, stored as
+# .npy files and memory-mapped, so a ballot number is located by binary search
+# over the batches and no per-ballot array is ever built. States without a
+# manifest get a synthetic one: their ballots cast, split evenly over their
+# counties, in batches of cost_model.BALLOTS_PER_BATCH. House contests are the
+# districts (see bravo.load_contests), each with a synthetic manifest of its
+# own ballots cast unless a manifest is given for the district ("CA-13").
+#
+#   .manifest_index/<name>/cumulative.npy, county.npy, batch.npy, counties.json
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".manifest_index")
+SEED = "2024"
+CHUNKSIZE = 1_000_000
+OVERDRAW = 16               # tickets hashed beyond the expected need of a round
+
+# function that draws the ballot numbers (1..population) of tickets start..start+count-1
+def draw_tickets(seed: str, population: int, start: int, count: int):
+    prefix = hashlib.sha256(f"{seed},".encode())
+    out = np.empty(count, dtype=np.int64)
+    for i, t in enumerate(range(start, start + count)):
+        h = prefix.copy()
+        h.update(str(t).encode())
+        out[i] = int.from_bytes(h.digest(), "big") % population + 1
+    return out
+
+# function that draws a sample of n ballots out of population, or extends a
+# previous sample (its tickets and ballots) to n ballots without redrawing it.
+# returns the tickets and ballots of the whole sample, in the order drawn.
+def draw(seed: str, population: int, n: int, replace: bool = False, previous: tuple = None):
+    tickets, ballots = previous if previous is not None else (np.empty(0, np.int64), np.empty(0, np.int64))
+    need = n - len(ballots)
+    if need <= 0:
+        return tickets, ballots
+    if not replace and n > population:
+        raise ValueError(f"cannot draw {n} distinct ballots out of {population}")
+    start = int(tickets[-1]) + 1 if len(tickets) else 1
+    if replace:
+        new = np.arange(start, start + need, dtype=np.int64)
+        return np.concatenate([tickets, new]), np.concatenate([ballots, draw_tickets(seed, population, start, need)])
+    # every pass hashes the tickets the round still needs, grown by the share
+    # expected to repeat a ballot drawn before, and keeps the first draw of
+    # every new ballot, in ticket order
+    while need:
+        count = math.ceil(need*population/(population - len(ballots))) + OVERDRAW
+        block = draw_tickets(seed, population, start, count)
+        values, first = np.unique(block, return_index=True)
+        first = np.sort(first[~np.isin(values, ballots)])[:need]
+        tickets = np.concatenate([tickets, start + first.astype(np.int64)])
+        ballots = np.concatenate([ballots, block[first]])
+        need -= len(first)
+        start += count
+    return tickets, ballots
+
+class ManifestIndex:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.cumulative = np.load(os.path.join(directory, "cumulative.npy"), mmap_mode="r")
+        self.county = np.load(os.path.join(directory, "county.npy"), mmap_mode="r")
+        self.batch = np.load(os.path.join(directory, "batch.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "counties.json")) as f:
+            self.counties = np.array(json.load(f), dtype=object)
+
+    # the number of ballots in the manifest
+    @property
+    def total(self):
+        return int(self.cumulative[-1]) if len(self.cumulative) else 0
+
+    @staticmethod
+    def _save(directory: str, cumulative: np.ndarray, county: np.ndarray, batch: np.ndarray, counties: list):
+        os.makedirs(directory, exist_ok=True)
+        for name, arr in [("cumulative", cumulative), ("county", county), ("batch", batch)]:
+            np.save(os.path.join(directory, f"{name}.npy"), arr)
+        with open(os.path.join(directory, "counties.json"), "w") as f:
+            json.dump(list(counties), f)
+        return ManifestIndex(directory)
+
+    # function that indexes a manifest CSV (county, batch and ballots columns),
+    # streaming it in chunks; the index is reused while the manifest is unchanged
+    @classmethod
+    def build(cls, path: str, root: str = None, chunksize: int = CHUNKSIZE):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        name = f"{os.path.splitext(os.path.basename(path))[0]}-{h.hexdigest()[:16]}"
+        directory = os.path.join(root or INDEX_DIR, name)
+        if os.path.exists(os.path.join(directory, "counties.json")):
+            return cls(directory)
+        counts, county, batch, codes = [], [], [], {}
+        for chunk in pd.read_csv(path, usecols=["county", "batch", "ballots"], dtype={"county": str, "batch": str},
+                                 chunksize=chunksize):
+            counts.append(chunk["ballots"].to_numpy(np.int64))
+            county.append(np.array([codes.setdefault(c, len(codes)) for c in chunk["county"]], dtype=np.int32))
+            batch.append(chunk["batch"].to_numpy(str))
+        counts = np.concatenate(counts) if counts else np.empty(0, np.int64)
+        if (counts < 0).any():
+            raise ValueError(f"{path}: negative ballot counts")
+        return cls._save(directory, np.cumsum(counts), np.concatenate(county) if county else np.empty(0, np.int32),
+                         np.concatenate(batch) if batch else np.empty(0, str), list(codes))
+
+    # function that indexes a synthetic manifest: ballots split evenly over the
+    # counties, and every county's ballots in batches of batch_size
+    @classmethod
+    def synthetic(cls, name: str, ballots: int, num_counties: int, batch_size: int = cost_model.BALLOTS_PER_BATCH,
+                  root: str = None):
+        directory = os.path.join(root or INDEX_DIR, f"synthetic-{name}-{ballots}-{num_counties}-{batch_size}")
+        if os.path.exists(os.path.join(directory, "counties.json")):
+            return cls(directory)
+        num_counties = max(int(num_counties), 1)
+        per_county = np.full(num_counties, ballots//num_counties, dtype=np.int64)
+        per_county[:ballots % num_counties] += 1
+        batches = -(-per_county//batch_size)
+        county = np.repeat(np.arange(num_counties, dtype=np.int32), batches)
+        first = np.cumsum(batches) - batches
+        within = np.arange(len(county)) - np.repeat(first, batches)
+        counts = np.minimum(batch_size, per_county[county] - within*batch_size)
+        return cls._save(directory, np.cumsum(counts), county, (within + 1).astype(str),
+                         [f"county {c + 1}" for c in range(num_counties)])
+
+    # function that locates ballot numbers (1..total): the county, batch and
+    # position within the batch of every ballot, by binary search over the batches
+    def locate(self, ballots: np.ndarray):
+        county, batch, position = self._locate(ballots)
+        return pd.DataFrame({"county": county, "batch": batch, "position": position})
+
+    def _locate(self, ballots: np.ndarray):
+        ballots = np.asarray(ballots, dtype=np.int64)
+        if len(ballots) and (ballots.min() < 1 or ballots.max() > self.total):
+            raise ValueError(f"ballot numbers outside 1..{self.total}")
+        i = np.searchsorted(self.cumulative, ballots, side="left")
+        before = np.where(i > 0, np.asarray(self.cumulative)[np.maximum(i - 1, 0)], 0)
+        return self.counties[np.asarray(self.county)[i]], np.asarray(self.batch)[i].astype(object), ballots - before
+
+# function that draws the sample of one contest, round by round: every round
+# extends the sample of the previous one to its size. A round whose sample is
+# as large as its manifest (without replacement) is a full hand count: it gets
+# no draws but one row with full_hand_count set, and ends the contest.
+def sample_contest(args: tuple):
+    office, year, contest, state_po, sizes, manifest, seed, replace = args
+    index = ManifestIndex(manifest)
+    contest_seed = f"{seed},{office},{year},{contest}"
+    tickets, ballots = np.empty(0, np.int64), np.empty(0, np.int64)
+    drawn, full = [], []
+    for round_, n in enumerate(sizes, start=1):
+        if not replace and n >= index.total:
+            full = [round_]
+            break
+        tickets, ballots = draw(contest_seed, index.total, n, replace, (tickets, ballots))
+        drawn.append(len(ballots))
+    # every round's ballots are located at once; the full hand count row has no draw
+    county, batch, position = index._locate(ballots)
+    rounds = np.repeat(np.arange(1, len(drawn) + 1), np.diff(drawn, prepend=0))
+    missing = np.concatenate([np.zeros(len(ballots), dtype=bool), np.ones(len(full), dtype=bool)])
+    def nullable(values):
+        return pd.arrays.IntegerArray(np.concatenate([values, np.zeros(len(full), np.int64)]), missing)
+    return pd.DataFrame({"office": office, "year": year, "state_po": state_po, "contest": contest,
+                         "round": np.concatenate([rounds, full]).astype(np.int64),
+                         "ticket": nullable(tickets), "ballot": nullable(ballots),
+                         "county": np.concatenate([county, [None]*len(full)]).astype(object),
+                         "batch": np.concatenate([batch, [None]*len(full)]).astype(object),
+                         "position": nullable(position), "full_hand_count": missing},
+                        index=pd.RangeIndex(len(missing)))
+
+# function that draws the samples of every contest with ballots to audit:
+# num_ballots (times every factor of rounds) ballots out of the ballots cast
+# (or out of the contest's manifest in manifests, keyed by state or
+# state-district), spread over a process pool (in this process with workers=0)
+def sample_all(contests: pd.DataFrame, seed: str = SEED, replace: bool = False, rounds: tuple = (1,),
+               manifests: dict = None, workers: int = None):
+    manifests = {name: ManifestIndex.build(path).directory for name, path in (manifests or {}).items()}
+    held = contests[(contests["num_ballots"] > 0) & (contests["totalvotes"] > 0)]
+    if "contest" not in held:
+        held = held.assign(contest=held["state_po"])
+    counties = get_registry().convert(held["state_po"], "postal", "num_counties")
+    # every manifest is indexed in this process, so that workers only read them
+    jobs = [(r.office, int(r.year), r.contest, r.state_po, [math.ceil(r.num_ballots*f) for f in rounds],
+             manifests.get(r.contest) or ManifestIndex.synthetic(r.contest, int(r.totalvotes), int(c)).directory,
+             seed, replace)
+            for r, c in zip(held.itertuples(index=False), counties)]
+    if workers == 0:
+        frames = list(map(sample_contest, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(sample_contest, jobs, chunksize=8))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Draw reproducible audit samples from ballot manifests.")
+    parser.add_argument("--office", choices=list(MARGIN_FILES) + ["house"], action="append", default=None,
+                        help="the house is sampled per district, from the table of the house pipeline's --districts")
+    parser.add_argument("--year", type=int, action="append", default=None)
+    parser.add_argument("--state", action="append", default=None, help="postal code")
+    parser.add_argument("--seed", default=SEED)
+    parser.add_argument("--replace", action="store_true", help="draw with replacement")
+    parser.add_argument("--rounds", type=float, nargs="+", default=[1.0],
+                        help="sample size of every round, as a multiple of num_ballots (escalation rounds)")
+    parser.add_argument("--manifest", nargs=2, action="append", default=[], metavar=("CONTEST", "PATH"),
+                        help="manifest CSV (county, batch, ballots) of a state (or house district, e.g. CA-13); "
+                             "others get synthetic manifests")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="intermediate_data/audit_samples.csv")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    house = args.office is None or "house" in args.office
+    if args.office and house and not os.path.exists(DISTRICT_FILE):
+        parser.error(f"no {DISTRICT_FILE}; run house/calculateHouseCosts.py --districts first")
+    contests = load_contests({o: p for o, p in MARGIN_FILES.items() if args.office is None or o in args.office},
+                             district_file=DISTRICT_FILE if house else None)
+    if args.year:
+        contests = contests[contests["year"].isin(args.year)]
+    if args.state:
+        contests = contests[contests["state_po"].isin([s.upper() for s in args.state])]
+    samples = sample_all(contests, args.seed, args.replace, tuple(args.rounds),
+                         {name.upper(): path for name, path in args.manifest}, args.workers)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    samples.to_csv(args.out, index=False)
+    print(f"drew {len(samples)} ballots for {len(contests)} contests in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,291 @@
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+import numpy as np
+import pandas as pd
+import synthetic
+
+# benchmark harness of the pipeline stages. A synthetic input tree of the
+# requested scale is written to a scratch directory and every stage runs on it
+# in the directory the stage expects, timed (median of --repeat runs: wall and
+# CPU seconds) and, in one further run, memory-profiled with tracemalloc (peak
+# MB of Python and numpy allocations). Results are stored as JSON baselines
+# under benchmarks/baselines/, together with the machine they were measured
+# on; with --compare the run is checked against the stored baseline.
+#
+# A baseline is only meaningful for the machine it was measured on, so it is
+# saved on purpose (--save), in a commit of its own, and not re-saved along
+# with feature changes: those are checked with --compare.
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+THRESHOLD = 1.25
+# growths smaller than these (seconds, MB) are too noisy to flag
+NOISE_FLOOR = {"seconds": 0.05, "peak_mb": 1.0}
+
+# function that imports a script of the repository (e.g. senate/getSenateData.py) as a module
+def load_script(relpath: str):
+    name = os.path.splitext(os.path.basename(relpath))[0]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relpath))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@contextlib.contextmanager
+def working_directory(path: str):
+    prev = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(prev)
+
+# function that times one call: median wall and CPU seconds over repeat runs,
+# then the peak traced memory of one more run. setup() returns the call's
+# arguments and is not timed.
+def measure(func, setup, repeat: int, memory: bool = True):
+    wall, cpu = [], []
+    for _ in range(repeat):
+        args = setup()
+        w, c = time.perf_counter(), time.process_time()
+        func(*args)
+        wall.append(time.perf_counter() - w)
+        cpu.append(time.process_time() - c)
+    out = {"seconds": statistics.median(wall), "cpu_seconds": statistics.median(cpu)}
+    if memory:
+        args = setup()
+        tracemalloc.start()
+        try:
+            func(*args)
+            out["peak_mb"] = tracemalloc.get_traced_memory()[1]/2**20
+        finally:
+            tracemalloc.stop()
+    return out
+
+# function that declares the benchmarks: (name, directory relative to the tree, function, setup)
+def benchmarks(tree: str):
+    import ballot_sampler
+    import bootstrap
+    import dataverse_cache
+    import margin_index
+    import results_parser
+    import results_store
+    import schema
+    import sweep
+    # the parsed-source caches live in the scratch tree, not in the repository
+    dataverse_cache.CACHE_DIR = os.path.join(tree, ".dataverse_cache")
+    ballot_sampler.INDEX_DIR = os.path.join(tree, ".manifest_index")
+    house = load_script("house/calculateHouseCosts.py")
+    senate = load_script("senate/getSenateData.py")
+    aggregate = load_script("aggregate_data.py")
+    state = {}
+    def keep(key, func):
+        def run(*args):
+            state[key] = func(*args)
+        return run
+    def none():
+        return ()
+    def copy_of(key):
+        return lambda: (state[key].copy(),)
+    # the office scripts read from and write to their directory of the scratch tree
+    def in_tree(*parts):
+        return os.path.join(tree, *parts)
+    def senate_full():
+        return (senate.add_procedural_cost(pd.concat([
+            senate.calculate_margins_and_num_ballots_from_2000_to_2020(path=in_tree("senate", senate.MEDSL_CSV)),
+            senate.prepare_2022_senate_data(in_tree("senate", senate.TABLE_2022)),
+            senate.prepare_2024_senate_data(in_tree("senate", senate.TEXT_2024))], ignore_index=True)),)
+    # a fresh store in the scratch tree, holding the senate results once read_results runs
+    def senate_store():
+        store = results_store.ResultsStore(tempfile.mkdtemp(prefix="store-", dir=tree))
+        return (store, senate_full()[0])
+    def filled_store():
+        store, frame = senate_store()
+        store.ingest(frame, "senate", "dataverse_files/1976-2020-senate.csv")
+        return (store,)
+    def fresh_store():
+        return (results_store.ResultsStore(tempfile.mkdtemp(prefix="store-", dir=tree)),)
+    marks = [
+        ("dataverse_cache.build_cache[house]", ".", dataverse_cache.build_cache,
+         lambda: ("house/dataverse_files/1976-2022-house.csv",)),
+        ("dataverse_cache.build_cache[senate]", ".", dataverse_cache.build_cache,
+         lambda: ("senate/dataverse_files/1976-2020-senate.csv",)),
+        ("senate.calculate_margins_and_num_ballots_from_2000_to_2020", "senate",
+         senate.calculate_margins_and_num_ballots_from_2000_to_2020,
+         lambda: (None, in_tree("senate", senate.MEDSL_CSV))),
+        ("senate.calculate_margins_and_num_ballots_from_2000_to_2020[streamed]", "senate",
+         senate.calculate_margins_and_num_ballots_from_2000_to_2020,
+         lambda: (100_000, in_tree("senate", senate.MEDSL_CSV))),
+        ("senate.calculate_margins_and_num_ballots_from_2000_to_2020[arrow]", "senate",
+         senate.calculate_margins_and_num_ballots_from_2000_to_2020,
+         lambda: (None, in_tree("senate", senate.MEDSL_CSV), "arrow")),
+        ("senate.prepare_2024_senate_data", "senate", senate.prepare_2024_senate_data,
+         lambda: (in_tree("senate", senate.TEXT_2024),)),
+        ("senate.prepare_2022_senate_data", "senate", senate.prepare_2022_senate_data,
+         lambda: (in_tree("senate", senate.TABLE_2022),)),
+        ("results_parser.read_text_results[president]", ".", results_parser.read_text_results,
+         lambda: ("presidential/dataverse_files/2024_US_President.txt",)),
+        ("results_parser.read_tsv[votes]", ".", results_parser.read_tsv,
+         lambda: ("presidential/dataverse_files/2024_votes.tsv", {"State": "text", "Party": "text", "Votes": "count"})),
+        ("senate.write_results", "senate", senate.write_results, lambda: senate_full() + (in_tree("senate"),)),
+        ("results_store.ingest", "senate",
+         lambda store, frame: store.ingest(frame, "senate", "dataverse_files/1976-2020-senate.csv"), senate_store),
+        ("results_store.read", "senate", lambda store: store.read("senate"), filled_store),
+        ("senate.run", "senate", lambda store: senate.run(in_tree("senate"), store=store), fresh_store),
+        ("house.parse_workbook", "house", keep("house_raw", house.parse_workbook),
+         lambda: (in_tree("house", house.WORKBOOK),)),
+        ("house.transform_data", "house", keep("house", house.transform_data), copy_of("house_raw")),
+        ("house.write_results", "house", house.write_results, lambda: copy_of("house")() + (in_tree("house"),)),
+        ("house.run", "house", lambda store: house.run(in_tree("house"), store=store), fresh_store),
+        ("house.district_margins_from_returns", "house", house.district_margins_from_returns,
+         lambda: (in_tree("house", house.MEDSL_CSV),)),
+        ("house.run[districts]", "house", lambda: house.run(in_tree("house"), districts=True), none),
+        ("aggregate.transform_2024_results", ".", aggregate.transform_2024_results, none),
+        ("aggregate.get_total_votes_cast", ".", aggregate.get_total_votes_cast, none),
+        ("aggregate.get_total_votes_cast[streamed]", ".",
+         lambda: aggregate.get_total_votes_cast(chunksize=100_000), none),
+    ]
+    pres = load_script("presidential/getPresidentialData.py")
+    def pres_margins():
+        return pres.calculate_procedural_costs(pd.concat([
+            pres.calculate_margins_and_num_ballots_from_2000_to_2020(path=in_tree("presidential", pres.MEDSL_CSV)),
+            pres.extract_textfile_data(in_tree("presidential", pres.TEXT_2024))], ignore_index=True))
+    marks += [
+        ("dataverse_cache.build_cache[president]", ".", dataverse_cache.build_cache,
+         lambda: ("presidential/dataverse_files/1976-2020-president.csv",)),
+        ("presidential.calculate_margins_and_num_ballots_from_2000_to_2020", "presidential",
+         pres.calculate_margins_and_num_ballots_from_2000_to_2020,
+         lambda: (None, in_tree("presidential", pres.MEDSL_CSV))),
+        ("presidential.extract_textfile_data", "presidential", pres.extract_textfile_data,
+         lambda: (in_tree("presidential", pres.TEXT_2024),)),
+        ("presidential.write_results", "presidential", pres.write_results,
+         lambda: (pres_margins(), in_tree("presidential"))),
+        ("presidential.run", "presidential", lambda store: pres.run(in_tree("presidential"), store=store),
+         fresh_store),
+        ("aggregate.compute_totals", ".", keep("totals", aggregate.compute_totals), none),
+        ("aggregate.add_all3_costs", ".", keep("all_data", aggregate.add_all3_costs), copy_of("totals")),
+        ("aggregate.calculate_national_rla_cost", ".", keep("national", aggregate.calculate_national_rla_cost),
+         copy_of("all_data")),
+        ("aggregate.calculate_state_by_state_rla_cost", ".", aggregate.calculate_state_by_state_rla_cost,
+         copy_of("all_data")),
+        ("aggregate.write_results", ".", aggregate.write_results, copy_of("all_data")),
+        ("schema.read_csv[state_year]", ".", schema.read_csv,
+         lambda: ("important-data/all_data_by_state_yr.csv", schema.STATE_YEAR)),
+        ("bootstrap.replicate", ".", lambda base: bootstrap.replicate(base, 2_000, workers=0),
+         lambda: (sweep.load_base(state["all_data"]),)),
+        ("ballot_sampler.sample_all", ".",
+         lambda contests: ballot_sampler.sample_all(contests, rounds=(1, 2), workers=0),
+         lambda: (ballot_sampler.load_contests({"senate": ballot_sampler.MARGIN_FILES["senate"]},
+                                               district_file=None),)),
+        # one statewide contest of 10 million ballots, escalated twice
+        ("ballot_sampler.sample_contest[10M]", ".", ballot_sampler.sample_contest,
+         lambda: (("senate", 2024, "XX", "XX", [1_000, 10_000, 100_000],
+                   ballot_sampler.ManifestIndex.synthetic("XX", 10_000_000, 60, root=tree).directory,
+                   ballot_sampler.SEED, False),)),
+        ("margin_index.swing_vs_nonswing", ".", lambda index: index.swing_vs_nonswing(5),
+         lambda: (margin_index.MarginIndex.from_files(),)),
+        ("aggregate.graph_results", ".", aggregate.graph_results, lambda: (state["national"], state["all_data"])),
+        ("aggregate.graph_results[state_plots]", ".", lambda *args: aggregate.graph_results(*args, state_plots=True),
+         lambda: (state["national"], state["all_data"])),
+    ]
+    return marks
+
+# function that runs every benchmark matching only (substrings of names) on a fresh synthetic tree
+def run(scale: dict, repeat: int = 3, memory: bool = True, only: list = None, seed: int = 0):
+    tree = tempfile.mkdtemp(prefix="rla-bench-")
+    results = {}
+    try:
+        rows = synthetic.write_tree(tree, scale, seed)
+        with open(os.devnull, "w") as devnull:
+            with working_directory(tree), contextlib.redirect_stdout(devnull):
+                marks = benchmarks(tree)
+            for name, where, func, setup in marks:
+                if only and not any(o in name for o in only):
+                    continue
+                with working_directory(os.path.join(tree, where)), contextlib.redirect_stdout(devnull):
+                    try:
+                        results[name] = measure(func, setup, repeat, memory)
+                    except Exception as e:
+                        results[name] = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        shutil.rmtree(tree, ignore_errors=True)
+    return {"scale": scale, "rows": rows, "repeat": repeat, "machine": machine(),
+            "python": platform.python_version(), "pandas": pd.__version__, "results": results}
+
+# function that describes the machine a run is measured on
+def machine():
+    return {"platform": platform.platform(), "processor": platform.processor() or platform.machine(),
+            "cpu_count": os.cpu_count(), "numpy": np.__version__}
+
+# function that compares a run against a baseline; returns the names that got
+# slower (or bigger) than threshold. A measure is only flagged when it also
+# grew by more than its NOISE_FLOOR.
+def compare(current: dict, baseline: dict, threshold: float = THRESHOLD):
+    if baseline.get("machine") != current.get("machine"):
+        print(f"note: the baseline was measured on another machine ({baseline.get('machine')}), "
+              "its timings are not comparable")
+    regressions = []
+    for name, now in current["results"].items():
+        then = baseline["results"].get(name)
+        if then is None or "error" in now or "error" in then:
+            print(f"{name:75s} {'(no comparison)':>20s}")
+            continue
+        parts = []
+        for key in ["seconds", "peak_mb"]:
+            if key in now and key in then and then[key] > 0:
+                ratio = now[key]/then[key]
+                parts.append(f"{key} x{ratio:.2f}")
+                if ratio > threshold and now[key] - then[key] > NOISE_FLOOR[key]:
+                    regressions.append(f"{name} ({key} x{ratio:.2f})")
+        print(f"{name:75s} {', '.join(parts):>20s}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic inputs.")
+    parser.add_argument("--scale", default="small", choices=sorted(synthetic.SCALES))
+    for dim in ["states", "years", "districts", "candidates", "precincts"]:
+        parser.add_argument(f"--{dim}", type=int, default=None, help=f"override the scale's {dim}")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--only", nargs="*", default=None, help="run only benchmarks whose name contains one of these")
+    parser.add_argument("--save", action="store_true", help="store the results as the scale's baseline")
+    parser.add_argument("--compare", action="store_true", help="compare the results with the scale's baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+    scale = dict(synthetic.SCALES[args.scale])
+    for dim in scale:
+        if getattr(args, dim) is not None:
+            scale[dim] = getattr(args, dim)
+    report = run(scale, args.repeat, not args.no_memory, args.only)
+    for name, res in report["results"].items():
+        if "error" in res:
+            print(f"{name:75s} ERROR {res['error']}")
+        else:
+            print(f"{name:75s} {res['seconds']:9.4f}s {res['cpu_seconds']:9.4f}s cpu"
+                  + (f" {res['peak_mb']:9.1f} MB" if "peak_mb" in res else ""))
+    path = os.path.join(BASELINE_DIR, f"{args.scale}.json")
+    status = 0
+    if args.compare:
+        with open(path) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print("regressions:\n  " + "\n  ".join(regressions))
+            status = 1
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("baseline written to", path)
+    sys.exit(status)
@@ -0,0 +1,184 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# the state registry lives at the top level of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from state_registry import get_registry
+
+# generators of synthetic inputs shaped like the real ones: MEDSL-style
+# president/senate/house CSVs, house_election_chart-style workbooks, the 2022
+# and 2024 senate tables, the 2024 presidential text dump and 2024 vote
+# counts. write_tree lays them out in a scratch directory with the same paths
+# as the repository, so every pipeline function runs on them unchanged.
+#
+# A scale is (states x years x districts x candidates x precincts). With
+# precincts > 1 every candidate's votes are split across that many rows, which
+# gives precinct-level row counts. States are real states (the registry and
+# county counts must know them), so at most 51.
+
+SCALES = {"small": {"states": 51, "years": 12, "districts": 4, "candidates": 4, "precincts": 1},
+          "medium": {"states": 51, "years": 24, "districts": 9, "candidates": 6, "precincts": 10},
+          "large": {"states": 51, "years": 24, "districts": 9, "candidates": 8, "precincts": 200}}
+PARTIES = ["REPUBLICAN", "DEMOCRAT", "LIBERTARIAN", "OTHER"]
+
+# function that returns the names, short forms and postal codes of the first n states with county counts
+def states(n: int = 51):
+    registry = get_registry()
+    ids = np.flatnonzero(registry.num_counties >= 0)
+    if n > len(ids):
+        raise ValueError(f"at most {len(ids)} states can be generated, not {n}")
+    ids = ids[:n]
+    return pd.DataFrame({"state": registry.take(ids, "name"), "standard": registry.take(ids, "standard"),
+                         "state_po": registry.take(ids, "postal"), "state_fips": registry.take(ids, "fips")})
+
+# function that returns the election years of a MEDSL file ending in last, every step years
+def election_years(count: int, last: int, step: int = 2):
+    return np.arange(last - step*(count - 1), last + 1, step)
+
+# function that generates MEDSL-style returns for one office. Each contest has
+# one row per candidate (and precinct); the first two candidates are the
+# republican and the democrat, the rest libertarians or others.
+def medsl_returns(office: str, scale: dict, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    st = states(scale["states"])
+    step = 4 if office == "president" else 2
+    last = 2022 if office == "house" else 2020
+    years = election_years(scale["years"]//(step//2), last, step)
+    districts = scale["districts"] if office == "house" else 1
+    candidates = max(scale["candidates"], 2)
+    precincts = scale["precincts"]
+    # one contest per (year, state, district); a third of the states sit out each senate cycle
+    yi, si, di = [a.ravel() for a in np.meshgrid(np.arange(len(years)), np.arange(len(st)),
+                                                 np.arange(districts), indexing="ij")]
+    if office == "senate":
+        keep = (si + years[yi]//2) % 3 != 0
+        yi, si, di = yi[keep], si[keep], di[keep]
+    contests = len(yi)
+    shares = rng.dirichlet(np.r_[8.0, 8.0, np.ones(candidates - 2)], size=contests)
+    totals = rng.integers(50_000, 3_000_000, size=contests)
+    votes = np.floor(shares*totals[:, None]).astype(np.int64)
+    # every candidate row, then split across precincts
+    ci = np.tile(np.arange(candidates), contests)
+    row = np.repeat(np.arange(contests), candidates)
+    cand_votes = votes.ravel()
+    if precincts > 1:
+        ci, row = np.repeat(ci, precincts), np.repeat(row, precincts)
+        cand_votes = np.repeat(cand_votes, precincts)//precincts
+    party = np.array(PARTIES)[np.minimum(ci, 3) if office != "president" else np.where(ci < 2, ci, 3)]
+    frame = pd.DataFrame({
+        "year": years[yi[row]], "state": st["state"].to_numpy()[si[row]], "state_po": st["state_po"].to_numpy()[si[row]],
+        "state_fips": st["state_fips"].to_numpy()[si[row]], "state_cen": 0, "state_ic": 0,
+        "office": f"US {office.upper()}"})
+    if office == "house":
+        frame["district"] = di[row] + (1 if districts > 1 else 0)
+        frame["stage"] = "GEN"
+        frame["runoff"] = False
+        frame["special"] = False
+    elif office == "senate":
+        frame["district"] = "statewide"
+        frame["stage"] = "gen"
+        frame["special"] = False
+    frame["candidate"] = [f"CANDIDATE {c}" for c in ci]
+    frame["party_detailed" if office != "house" else "party"] = party
+    frame["writein"] = False
+    if office != "president":
+        frame["mode"] = "TOTAL" if precincts == 1 else "PRECINCT"
+    frame["candidatevotes"] = cand_votes
+    frame["totalvotes"] = totals[row]
+    if office == "house":
+        frame["unofficial"] = False
+    frame["version"] = 20230706
+    if office == "house":
+        frame["fusion_ticket"] = False
+    else:
+        frame["party_simplified"] = party
+    return frame
+
+# function that generates a house_election_chart-style workbook: one sheet per
+# year 2024..2000, one row per district with the winner's and runner-up's
+# vote shares and the statewide-style sample size 7/(winner - runner-up)
+def house_workbook(path: str, scale: dict, seed: int = 0):
+    import openpyxl
+    rng = np.random.default_rng(seed)
+    st = states(scale["states"])
+    wb = openpyxl.Workbook(write_only=True)
+    for year in range(2024, 1999, -2):
+        ws = wb.create_sheet(str(year))
+        ws.append(["State and District", "Winner (Percentage of Votes)", "1st Runner-Up (Percentage of Votes)", None])
+        for name in st["state"].str.title():
+            for d in range(1, scale["districts"] + 1):
+                winner = round(float(rng.uniform(0.5, 0.95)), 3)
+                runner = round(float(rng.uniform(0.02, 1 - winner)), 3)
+                label = f"{name} {d}" if scale["districts"] > 1 else f"{name} at-large"
+                ws.append([label, winner, runner, 7/(winner - runner)])
+    wb.save(path)
+
+# function that generates the 2024 presidential text dump: five title lines,
+# then short form, electoral votes, Harris %, Trump % and % in for every
+# state, with the odd "Flip" line
+def president_2024_text(path: str, scale: dict, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    lines = ["State", "E.V.", "Harris", "Trump", "% in"]
+    for i, short in enumerate(states(scale["states"])["standard"]):
+        dem = rng.uniform(25, 75)
+        rep = min(100 - dem, rng.uniform(20, 75))
+        lines += [short, str(rng.integers(3, 55)), f"{dem:.1f}%", f"{rep:.1f}%", f"{rng.integers(90, 100)}% in"]
+        if i % 9 == 4:
+            lines.append("Flip")
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+# function that generates the 2024 senate text dump: state, then three percentages
+def senate_2024_text(path: str, scale: dict, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    lines = []
+    for name in states(scale["states"])["state"].iloc[::3].str.title():
+        first = rng.uniform(40, 70)
+        lines += [name, f"{first:.1f}%", f"{rng.uniform(20, 100 - first):.1f}%", f"{rng.uniform(90, 100):.1f}%"]
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+# function that generates the 2022 senate table
+def senate_2022_table(path: str, scale: dict, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    names = states(scale["states"])["state"].iloc[1::3].str.title()
+    cast = rng.integers(200_000, 10_000_000, size=len(names))
+    margin = rng.uniform(0.005, 0.6, size=len(names))
+    frame = pd.DataFrame({"State": "U.S. Senate, " + names.to_numpy(), "Votes-cast": [f"{v:,}" for v in cast],
+                          "Winner-party Winner": "Party A", "Winner-votes": "", "Runner-up-party Runner-up": "Party B",
+                          "Runner-up votes": "", "Margin": [f"{int(v*m):,}" for v, m in zip(cast, margin)],
+                          "Margin(%)": [f"{100*m:.2f}%" for m in margin]})
+    frame.to_csv(path, sep="\t", index=False)
+
+# function that generates the 2024 vote counts by state, candidate and party
+def votes_2024_table(path: str, scale: dict, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for name in states(scale["states"])["state"].str.title():
+        for c in range(max(scale["candidates"], 2)):
+            party = ["Republican", "Democrat"][c] if c < 2 else "Independent"
+            rows.append([name, f"Candidate {c}", party, f"{int(rng.integers(1_000, 5_000_000)):,}", "", 0, "99%"])
+    pd.DataFrame(rows, columns=["State", "Candidate", "Party", "Votes", "Vote share", "Electoral votes",
+                                "Expected votes counted (%)"]).to_csv(path, sep="\t", index=False)
+
+# function that writes a full synthetic input tree under root and returns the row counts written
+def write_tree(root: str, scale: dict, seed: int = 0):
+    for d in ["house/dataverse_files", "senate/dataverse_files", "presidential/dataverse_files",
+              "intermediate_data", "important-data", "plots"]:
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+    rows = {}
+    for office, path in [("house", "house/dataverse_files/1976-2022-house.csv"),
+                         ("senate", "senate/dataverse_files/1976-2020-senate.csv"),
+                         ("president", "presidential/dataverse_files/1976-2020-president.csv")]:
+        frame = medsl_returns(office, scale, seed)
+        frame.to_csv(os.path.join(root, path), index=False)
+        rows[office] = len(frame)
+    house_workbook(os.path.join(root, "house/dataverse_files/house_election_chart.xlsx"), scale, seed)
+    president_2024_text(os.path.join(root, "presidential/dataverse_files/2024_US_President.txt"), scale, seed)
+    senate_2024_text(os.path.join(root, "senate/dataverse_files/2024_senate.txt"), scale, seed)
+    senate_2022_table(os.path.join(root, "senate/dataverse_files/2022_senate.tsv"), scale, seed)
+    votes_2024_table(os.path.join(root, "presidential/dataverse_files/2024_votes.tsv"), scale, seed)
+    rows["workbook"] = 13*scale["states"]*scale["districts"]
+    return rows
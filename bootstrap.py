@@ -0,0 +1,152 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import cost_model
+import sweep
+
+# bootstrap and perturbation uncertainty bands for the yearly national and
+# the average per-state RLA costs. Every replicate perturbs the inputs of the
+# cost model:
+#   - margins: every contest's margin is scaled by a lognormal factor
+#     (MARGIN_SD on the log scale), which scales its 7/margin sample size by
+#     the inverse factor;
+#   - sample sizes: the ballots an audit actually draws vary around the
+#     expected sample size, so each is also scaled by a gamma factor of mean 1
+#     and coefficient of variation SAMPLE_CV;
+#   - wages: the hourly clerk wage and the per-minute wage are scaled by
+#     lognormal factors of mean 1 (WAGE_SD on the log scale);
+# and resamples the election years behind every average (Bayesian bootstrap:
+# the years get Dirichlet(1, ..., 1) weights). Replicates are evaluated in
+# blocks of (replicate x office x year x state) arrays, the blocks are spread
+# over a process pool, and the intervals are percentiles over the replicates.
+# Every block draws from its own seed, so the replicates do not depend on the
+# number of workers.
+
+REPLICATES = 10_000
+SEED = 2024
+LEVEL = 0.95
+MARGIN_SD = 0.05
+SAMPLE_CV = 0.5
+WAGE_SD = 0.1
+BLOCK = 500                 # replicates evaluated at once per worker
+
+# the tables the intervals are written next to, and the column each one reports
+TABLES = {"total_yearly_cost_(president)": "cost_total",
+          "total_yearly_cost_(no_president)": "cost_total_excl_pres",
+          "avg_state_cost_(president)": "cost_total",
+          "avg_state_cost_(no_president)": "cost_total_excl_pres"}
+
+# function that reduces replicate costs to the yearly national totals, the
+# national averages and the per-state averages. ballots is (replicate x office
+# x year x state), clerk_wage_hr and minutes_wage hold one value per
+# replicate and weights one weight per replicate and year.
+def _reduce(base: dict, ballots: np.ndarray, clerk_wage_hr: np.ndarray, minutes_wage: np.ndarray,
+            weights: np.ndarray):
+    present = base["present"].astype(float)
+    is_pres = base["years"] % 4 == 0
+    costs = cost_model.all_costs(ballots, base["num_counties"], base["totalvotes"], present=present, axis=1,
+                                 minutes_wage=minutes_wage[:, None, None, None],
+                                 clerk_wage_hr=clerk_wage_hr[:, None, None])
+    cost_nopres = costs["cost_total_excl_pres"]*present
+    cost_all = costs["cost_total"]*present
+    held = base["present"].any(axis=1)
+    out = {"total_yearly_cost_(president)": cost_all.sum(axis=-1)[:, is_pres & held],
+           "total_yearly_cost_(no_president)": cost_nopres.sum(axis=-1)[:, held]}
+    # averages over the (weighted) years: nationally over the years with an
+    # election, per state over the years the state appears in
+    for name, cost, years in [("president", cost_all, is_pres), ("no_president", cost_nopres, np.ones_like(is_pres))]:
+        w = weights*(held & years)
+        out[f"national_avg_({name})"] = (w*cost.sum(axis=-1)).sum(axis=-1)/w.sum(axis=-1)
+        mask = present*years[:, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[f"avg_state_cost_({name})"] = ((weights[:, :, None]*mask*cost).sum(axis=1)
+                                               /(weights[:, :, None]*mask).sum(axis=1))
+    return out
+
+# function that evaluates one block of replicates
+def _replicate_block(args: tuple):
+    base, n, seed, margin_sd, sample_cv, wage_sd = args
+    rng = np.random.default_rng(seed)
+    nb = base["num_ballots"][None]
+    scale = np.exp(-margin_sd*rng.standard_normal((n,) + nb.shape[1:]))
+    if sample_cv > 0:
+        scale *= rng.gamma(1/sample_cv**2, sample_cv**2, size=scale.shape)
+    ballots = np.ceil(nb*scale)
+    wages = np.exp(wage_sd*rng.standard_normal((2, n)) - wage_sd**2/2)
+    weights = rng.standard_exponential((n, len(base["years"])))
+    return _reduce(base, ballots, cost_model.CLERK_WAGE_HR*wages[0], cost_model.MINUTES_WAGE*wages[1], weights)
+
+# function that evaluates every replicate, block by block over a process pool
+# (in this process with workers=0); returns the reductions of _reduce, one row per replicate
+def replicate(base: dict, replicates: int = REPLICATES, seed: int = SEED, margin_sd: float = MARGIN_SD,
+              sample_cv: float = SAMPLE_CV, wage_sd: float = WAGE_SD, workers: int = None, block: int = BLOCK):
+    sizes = [min(block, replicates - i) for i in range(0, replicates, block)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(base, n, s, margin_sd, sample_cv, wage_sd) for n, s in zip(sizes, seeds)]
+    if workers == 0:
+        parts = list(map(_replicate_block, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_replicate_block, jobs))
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+# function that evaluates the model without perturbation (the costs the existing tables report)
+def point(base: dict):
+    ones = np.ones(1)
+    return {k: v[0] for k, v in _reduce(base, base["num_ballots"][None], cost_model.CLERK_WAGE_HR*ones,
+                                        cost_model.MINUTES_WAGE*ones, np.ones((1, len(base["years"])))).items()}
+
+# function that turns the replicates into interval tables, shaped like the
+# tables they go with: the cost, and the lower and upper bounds of its interval
+def intervals(base: dict, reps: dict, level: float = LEVEL):
+    est = point(base)
+    q = 100*np.array([(1 - level)/2, (1 + level)/2])
+    is_pres = base["years"] % 4 == 0
+    held = base["present"].any(axis=1)
+    index = {"total_yearly_cost_(president)": pd.Index(base["years"][is_pres & held], name="year"),
+             "total_yearly_cost_(no_president)": pd.Index(base["years"][held], name="year")}
+    tables = {}
+    for name, column in TABLES.items():
+        low, high = np.nanpercentile(reps[name], q, axis=0)
+        if name in index:
+            idx, keep = index[name], slice(None)
+        else:
+            keep = ~np.isnan(est[name])
+            idx = pd.MultiIndex.from_arrays([base["state"][keep], base["state_po"][keep]], names=["state", "state_po"])
+        tables[name] = pd.DataFrame({column: est[name][keep], f"{column}_low": low[keep],
+                                     f"{column}_high": high[keep]}, index=idx).round(2)
+    national = {}
+    for name in ("president", "no_president"):
+        low, high = np.percentile(reps[f"national_avg_({name})"], q)
+        national[name] = (float(est[f"national_avg_({name})"]), float(low), float(high))
+    return tables, national
+
+# function that writes every interval table next to its table, as <table>_ci.csv
+def write_intervals(tables: dict, directory: str = "important-data"):
+    os.makedirs(directory, exist_ok=True)
+    for name, table in tables.items():
+        table.to_csv(os.path.join(directory, f"{name}_ci.csv"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bootstrap confidence intervals of the national and state RLA costs.")
+    parser.add_argument("--replicates", type=int, default=REPLICATES)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--level", type=float, default=LEVEL)
+    parser.add_argument("--margin-sd", type=float, default=MARGIN_SD)
+    parser.add_argument("--sample-cv", type=float, default=SAMPLE_CV)
+    parser.add_argument("--wage-sd", type=float, default=WAGE_SD)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--data", default="important-data/all_data_by_state_yr.csv")
+    parser.add_argument("--out", default="important-data")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    base = sweep.load_base_from_csv(args.data)
+    reps = replicate(base, args.replicates, args.seed, args.margin_sd, args.sample_cv, args.wage_sd, args.workers)
+    tables, national = intervals(base, reps, args.level)
+    write_intervals(tables, args.out)
+    for name, (est, low, high) in national.items():
+        print(f"National Avg. RLA cost ({name.replace('_', '-')}): {est:.2f} [{low:.2f}, {high:.2f}]")
+    print(f"evaluated {args.replicates} replicates in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,175 @@
+import argparse
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import cost_model
+
+# Monte Carlo simulator for the BRAVO ballot-polling audit (Lindeman, Stark & Yates,
+# see VV-Risk-Limiting-Audit-Methods-11.22.19-1.pdf), used in place of the
+# 7/margin rule of thumb.
+#
+# Each contest is treated as a two-candidate race whose reported (and true)
+# winner share among the two is p = (1 + margin)/2. Every draw multiplies the
+# test statistic T by 2p for a winner ballot and 2(1-p) for a loser ballot; the
+# audit stops as soon as T >= 1/alpha. With k loser ballots among n draws,
+#   log T = n*log(2p) - k*(log(2p) - log(2(1-p)))
+# so the audit stops at the first n where k <= (n*log(2p) - log(1/alpha))/b.
+# An audit that has not stopped after max_draws escalates to a full hand count
+# of every ballot cast.
+#
+# The senate and presidential contests are state-wide; the house is audited
+# per district (from house_district_margins.csv, written by the house pipeline
+# run per district) and left out when there is no district table, since its
+# state-year margins are no contest's margin.
+
+MAX_DRAWS = 10_000          # draws before a BRAVO audit escalates to a full hand count
+TRIALS = 10_000
+SEED = 2024
+BLOCK_ELEMS = 1 << 22       # draws held in memory at once per worker
+
+MARGIN_FILES = {"senate": "senate/senate_margins.csv",
+                "president": "presidential/presidential_margins.csv"}
+DISTRICT_FILE = "house/house_district_margins.csv"
+STATS = ("asn_mean", "asn_p90", "asn_p99")
+
+# function that derives a reproducible seed for a contest (its state, or
+# state-district), independent of how contests are spread over worker processes
+def contest_seed(seed: int, office: str, year: int, contest: str):
+    return np.random.SeedSequence([seed, zlib.crc32(f"{office}|{year}|{contest}".encode())])
+
+# function that simulates BRAVO for one contest and returns the sample size of
+# every trial together with a mask of the trials that escalated
+def simulate_contest(margin: float, ballots_cast: int, trials: int = TRIALS, alpha: float = cost_model.RISK_LIMIT,
+                     max_draws: int = MAX_DRAWS, rng: np.random.Generator = None):
+    rng = rng if rng is not None else np.random.default_rng()
+    cap = int(min(max_draws, ballots_cast)) if ballots_cast > 0 else int(max_draws)
+    sizes = np.full(trials, ballots_cast if ballots_cast > 0 else cap, dtype=np.int64)
+    escalated = np.ones(trials, dtype=bool)
+    if not margin > 0:
+        return sizes, escalated
+    p = min((1 + margin)/2, 1.0)
+    q = 1 - p
+    a = np.log(2*p)
+    t = np.log(1/alpha)
+    if q == 0:
+        # only winner ballots: every trial stops after the same number of draws
+        n_stop = int(np.ceil(t/a))
+        if n_stop <= cap:
+            sizes[:], escalated[:] = n_stop, False
+        return sizes, escalated
+    b = a - np.log(2*q)
+    active = np.arange(trials)
+    k = np.zeros(trials, dtype=np.int32)
+    n = 0
+    while len(active) and n < cap:
+        block = int(max(1, min(cap - n, BLOCK_ELEMS // len(active))))
+        steps = n + np.arange(1, block + 1)
+        bound = (steps*a - t)/b
+        losers = (rng.random((len(active), block), dtype=np.float32) < q).cumsum(axis=1, dtype=np.int32)
+        losers += k[active, None]
+        stopped = losers <= bound
+        done = stopped.any(axis=1)
+        first = stopped.argmax(axis=1)
+        sizes[active[done]] = steps[first[done]]
+        escalated[active[done]] = False
+        k[active[~done]] = losers[~done, -1]
+        active = active[~done]
+        n += block
+    return sizes, escalated
+
+# function that summarizes the simulated sample sizes of one contest
+def summarize(sizes: np.ndarray, escalated: np.ndarray):
+    return {"asn_mean": sizes.mean(), "asn_p90": np.percentile(sizes, 90),
+            "asn_p99": np.percentile(sizes, 99), "p_escalate": escalated.mean()}
+
+def _simulate_row(args: tuple):
+    office, year, contest, margin, ballots_cast, trials, alpha, max_draws, seed = args
+    rng = np.random.default_rng(contest_seed(seed, office, year, contest))
+    sizes, escalated = simulate_contest(margin, ballots_cast, trials, alpha, max_draws, rng)
+    return summarize(sizes, escalated)
+
+# function that gathers the contests of the state-wide offices (with the
+# ballots cast in the state) and, when district_file exists, of every house
+# district (with the ballots cast in the district). contest names the contest
+# within its office and year: the state, or the state and district.
+def load_contests(margin_files: dict = MARGIN_FILES, totals_path: str = "intermediate_data/totals.csv",
+                  district_file: str = DISTRICT_FILE):
+    frames = []
+    for office, path in margin_files.items():
+        df = pd.read_csv(path, usecols=["year", "state", "state_po", "margin", "num_ballots"])
+        df.insert(0, "office", office)
+        frames.append(df)
+    contests = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+        columns=["office", "year", "state", "state_po", "margin", "num_ballots"])
+    totals = pd.read_csv(totals_path, usecols=["year", "state_po", "totalvotes"])
+    contests = pd.merge(contests, totals, on=["year", "state_po"], how="left")
+    contests["totalvotes"] = contests["totalvotes"].fillna(0).astype(np.int64)
+    contests["contest"] = contests["state_po"]
+    if district_file and os.path.exists(district_file):
+        house = pd.read_csv(district_file, usecols=["year", "state", "state_po", "district", "margin",
+                                                    "num_ballots", "totalvotes"])
+        house.insert(0, "office", "house")
+        # districts without reported ballots cast have none, like states without totals
+        house["totalvotes"] = house["totalvotes"].fillna(0).astype(np.int64)
+        house["contest"] = house["state_po"] + "-" + house["district"].astype(str)
+        contests = pd.concat([contests, house.drop(columns=["district"])], ignore_index=True)
+    return contests
+
+# function that simulates every contest, spread over a process pool. contests
+# with num_ballots == 0 (no contest held) are left out of the audit entirely.
+def simulate_all(contests: pd.DataFrame, trials: int = TRIALS, alpha: float = cost_model.RISK_LIMIT,
+                 max_draws: int = MAX_DRAWS, seed: int = SEED, workers: int = None):
+    held = contests[contests["num_ballots"] > 0].reset_index(drop=True)
+    jobs = [(r.office, int(r.year), r.contest, float(r.margin), int(r.totalvotes), trials, alpha, max_draws, seed)
+            for r in held.itertuples(index=False)]
+    # hand the closest contests out first, they take the longest
+    order = np.argsort(held["margin"].to_numpy(), kind="stable")
+    results = [None]*len(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i, res in zip(order, pool.map(_simulate_row, [jobs[i] for i in order], chunksize=4)):
+            results[i] = res
+    stats = pd.DataFrame(results, columns=["asn_mean", "asn_p90", "asn_p99", "p_escalate"])
+    out = pd.concat([held, stats], axis=1)
+    skipped = contests[contests["num_ballots"] <= 0].assign(asn_mean=0.0, asn_p90=0.0, asn_p99=0.0, p_escalate=0.0)
+    return pd.concat([out, skipped], ignore_index=True).sort_values(["office", "year", "state", "contest"]) \
+             .reset_index(drop=True)
+
+# function that replaces the 7/margin sample sizes of one office's state-year
+# margins with a simulated statistic (asn_mean, asn_p90 or asn_p99), summed
+# over the contests of every state-year (e.g. the house districts), and
+# recomputes its procedural cost. state-years without a simulated contest get none.
+def with_simulated_sample_sizes(margins: pd.DataFrame, sims: pd.DataFrame, office: str, stat: str = "asn_mean"):
+    sim = sims[sims["office"] == office]
+    ballots = pd.Series(np.ceil(sim[stat].to_numpy(dtype=float)).astype(np.int64),
+                        index=pd.MultiIndex.from_arrays([sim["year"].astype(int), sim["state_po"].astype(str)]))
+    ballots = ballots.groupby(level=[0, 1]).sum()
+    out = margins.drop(columns=[c for c in margins.columns if c.startswith("Unnamed")])
+    keys = pd.MultiIndex.from_arrays([out["year"].astype(int), out["state_po"].astype(str)])
+    out["num_ballots"] = ballots.reindex(keys, fill_value=0).to_numpy()
+    out["procedural_cost"] = cost_model.procedural_cost(out["num_ballots"]).round(2)
+    return out
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate BRAVO ballot-polling audits for every contest.")
+    parser.add_argument("--trials", type=int, default=TRIALS)
+    parser.add_argument("--alpha", type=float, default=cost_model.RISK_LIMIT)
+    parser.add_argument("--max-draws", type=int, default=MAX_DRAWS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--stat", default="asn_mean", choices=STATS)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    sims = simulate_all(load_contests(), args.trials, args.alpha, args.max_draws, args.seed, args.workers)
+    if not os.path.exists("intermediate_data"):
+        os.mkdir("intermediate_data")
+    sims.to_csv("intermediate_data/bravo_sample_sizes.csv", index=False)
+    # margins files in the office scripts' schema, with the simulated sample
+    # sizes (aggregate_data.py --bravo puts them in the cost model directly)
+    offices = dict(MARGIN_FILES, house="house/house_margins.csv")
+    for office in sims["office"].unique():
+        margins = with_simulated_sample_sizes(pd.read_csv(offices[office]), sims, office, args.stat)
+        margins.to_csv(f"intermediate_data/bravo_{office}_margins.csv", index=False)
+    print(f"simulated {len(sims)} contests x {args.trials} trials in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,109 @@
+import numpy as np
+
+# the RLA cost model shared by the house, senate and presidential scripts
+# and by aggregate_data.py. Every formula works on whole arrays (or Series),
+# so one call covers every office, state and year at once.
+#
+# Procedural Total: # of ballots needed for RLA * "minutely" wage of county clerk * time per ballot
+# Prep Total (for each state): 8 * clerk_wage/hr * num_counties + num_ballots_cast/500 * time_to_index
+# Central Total: constant value per state
+
+# constants of the model
+MINUTES_WAGE = 0.35          # "minutely" wage of a county clerk (USD)
+MINUTES_BAL_TIME = 2         # minutes spent on each sampled ballot
+CLERK_WAGE_HR = 21.23        # hourly wage of a county clerk (USD)
+HRS_TO_IDX = 2               # hours to index one batch of ballots
+PREP_HRS_PER_COUNTY = 8      # hours of prep work per county
+BALLOTS_PER_BATCH = 500      # ballots per indexed batch
+CENTRAL_COST = 33580         # central cost per state (USD)
+RISK_LIMIT = 0.05            # risk limit behind the 7/margin sample size
+SAMPLE_SIZE_FACTOR = 7       # ballots needed ~= SAMPLE_SIZE_FACTOR/margin at RISK_LIMIT
+
+OFFICES = ("house", "senate", "president")
+# audits whose average sample numbers (see asn_tables.py) can replace 7/margin
+AUDITS = ("bravo", "comparison")
+
+# function that returns the constants of the model by name (e.g. to tell
+# whether stored results were computed with the current ones)
+def constants():
+    return {name: value for name, value in globals().items() if name.isupper()}
+
+# function that applies the procedural cost model to any number of ballot counts
+def procedural_cost(nbals, minutes_wage: float = MINUTES_WAGE, minutes_bal_time: float = MINUTES_BAL_TIME):
+    return nbals*minutes_wage*minutes_bal_time
+
+# function that returns the 7/margin sample sizes (SAMPLE_SIZE_FACTOR/margin) of
+# an office at any number of margins, rounded to whole ballots the way the
+# office scripts always have: the presidential one adds a ballot to the whole
+# part, the others round up
+def margin_sample_sizes(margin, office: str, factor: float = SAMPLE_SIZE_FACTOR):
+    if office not in OFFICES:
+        raise ValueError(f"unknown office '{office}', expected one of {OFFICES}")
+    ballots = factor/margin
+    if office == "president":
+        return (ballots + 1).astype(int)
+    return np.ceil(ballots).astype(int)
+
+# function that returns the sample sizes of an audit at the given margins:
+# num_ballots (the 7/margin rule) without an audit, otherwise the average
+# sample number of the audit ("bravo" or "comparison") at the risk limit,
+# rounded up. With ballots_cast, audits that escalate count as a full hand count
+# (contests whose ballots cast are unknown, NaN, escalate to the tables' max_draws).
+def audit_sample_sizes(margin, num_ballots, audit: str = None, risk_limit: float = RISK_LIMIT, ballots_cast=None):
+    if audit is None:
+        return num_ballots
+    # asn_tables imports this module
+    import asn_tables
+    sizes = asn_tables.asn(margin, risk_limit, audit)
+    if ballots_cast is not None:
+        ballots_cast = np.asarray(ballots_cast, dtype=float)
+        known = ~np.isnan(ballots_cast)
+        sizes = np.where(known, asn_tables.asn(margin, risk_limit, audit, ballots_cast=np.nan_to_num(ballots_cast)),
+                         sizes)
+    return np.ceil(sizes).astype(np.int64)
+
+# function that returns how much the 7/margin sample sizes grow (or shrink) at another
+# risk limit. The super-simple ballot-level bound is proportional to log(1/alpha).
+def sample_size_scale(risk_limit):
+    return np.log(1/np.asarray(risk_limit, dtype=float))/np.log(1/RISK_LIMIT)
+
+# function that rescales sample sizes computed at RISK_LIMIT to another risk limit
+def rescale_num_ballots(num_ballots, risk_limit):
+    return np.ceil(np.asarray(num_ballots, dtype=float)*sample_size_scale(risk_limit))
+
+# function that applies the prep cost model to arrays of county counts and total votes
+def prep_cost(num_counties, totalvotes, clerk_wage_hr: float = CLERK_WAGE_HR, hrs_to_idx: float = HRS_TO_IDX):
+    return (PREP_HRS_PER_COUNTY*clerk_wage_hr*num_counties) + ((totalvotes/BALLOTS_PER_BATCH)*hrs_to_idx)
+
+# function that returns the central cost for n state-year rows
+def central_cost(n: int, central: float = CENTRAL_COST):
+    return np.full(n, central)
+
+# function that computes every cost component in one pass.
+# num_ballots holds the sample sizes of every office along axis (ordered like
+# OFFICES); the other axes are rows: state-years, counties or precincts, or a
+# (year x state) grid, optionally with leading axes (e.g. replicates). With a
+# present mask, cells without an election get no prep or central cost. The
+# parameters broadcast against the rows. Returns a dict of arrays.
+def all_costs(num_ballots, num_counties, totalvotes, present=None, axis: int = 0,
+              minutes_wage: float = MINUTES_WAGE, minutes_bal_time: float = MINUTES_BAL_TIME,
+              clerk_wage_hr: float = CLERK_WAGE_HR, hrs_to_idx: float = HRS_TO_IDX,
+              central: float = CENTRAL_COST):
+    num_ballots = np.asarray(num_ballots, dtype=float)
+    procedural = np.round(procedural_cost(num_ballots, minutes_wage, minutes_bal_time), 2)
+    procedural_total = procedural.sum(axis=axis)
+    nonpres = [i for i, o in enumerate(OFFICES) if o != "president"]
+    procedural_excl_pres = np.take(procedural, nonpres, axis=axis).sum(axis=axis)
+    num_counties = np.asarray(num_counties, dtype=float)
+    centrals = central*np.ones(np.shape(procedural_total))
+    if present is not None:
+        num_counties = num_counties*present
+        centrals = centrals*present
+    prep = prep_cost(num_counties, np.asarray(totalvotes, dtype=float), clerk_wage_hr, hrs_to_idx)
+    return {"procedural_cost": procedural,
+            "procedural_cost_total": procedural_total,
+            "procedural_cost_excl_pres": procedural_excl_pres,
+            "prep_cost_total": prep,
+            "central_cost_total": centrals,
+            "cost_total": centrals + prep + procedural_total,
+            "cost_total_excl_pres": centrals + prep + procedural_excl_pres}
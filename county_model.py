@@ -0,0 +1,131 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import cost_model
+import streaming_ingest
+
+# county-granularity RLA cost model. The statewide sample of every contest
+# (num_ballots in the office margins files) is allocated across the state's
+# counties in proportion to their ballots cast; prep and procedural costs are
+# then computed per county and rolled up to the state-year table
+# (all_data_by_state_yr.csv schema) and from there to the national figures.
+# Prep cost splits exactly across counties:
+#   8*clerk_wage_hr*num_counties + totalvotes/500*hrs_to_idx
+#     = sum over counties of (8*clerk_wage_hr + county_ballots/500*hrs_to_idx)
+# Every step is a vectorized group operation over all counties, years and offices.
+
+MARGIN_FILES = {"house": "house/house_margins.csv",
+                "senate": "senate/senate_margins.csv",
+                "president": "presidential/presidential_margins.csv"}
+# MEDSL office labels of county and precinct returns
+OFFICE_NAMES = {"US HOUSE": "house", "US SENATE": "senate", "US PRESIDENT": "president"}
+KEYS = ["year", "state", "state_po"]
+
+# function that reads the statewide sample size of every contest, one row per (office, year, state)
+def load_state_samples(margin_files: dict = MARGIN_FILES):
+    frames = [pd.read_csv(path, usecols=KEYS + ["num_ballots"]).assign(office=office)
+              for office, path in margin_files.items()]
+    return pd.concat(frames, ignore_index=True)
+
+# function that reads county returns (MEDSL county or precinct files) into
+# (year, state, state_po, office, county, ballots) rows
+def load_county_votes(path: str, jurisdiction: str = "county_name", votes: str = "votes", chunksize: int = None):
+    totals = streaming_ingest.jurisdiction_totals(path, jurisdiction=jurisdiction, votes=votes,
+                                                  chunksize=chunksize or streaming_ingest.CHUNKSIZE).reset_index()
+    totals["office"] = totals["office"].astype(str).map(OFFICE_NAMES)
+    totals = totals[totals["office"].notna()]
+    out = totals[KEYS + ["office", jurisdiction, "totalvotes"]].rename(columns={jurisdiction: "county",
+                                                                              "totalvotes": "ballots"})
+    for col in ["state", "state_po", "county"]:
+        out[col] = out[col].astype(str)
+    return out.reset_index(drop=True)
+
+# function that splits integer totals across the rows of each group in proportion
+# to weights, using largest remainders so that every group sums exactly to its total.
+# a group whose weights sum to zero (e.g. counties without reported ballots) is
+# split evenly across its rows instead of losing its total
+def allocate(totals: pd.Series, weights: pd.Series, groups: list):
+    weights = weights.astype(np.float64)
+    weights = weights.where(weights.groupby(groups).transform("sum") > 0, 1.0)
+    share = weights/weights.groupby(groups).transform("sum")
+    exact = (totals*share).fillna(0.0)
+    base = np.floor(exact)
+    leftover = (totals - base.groupby(groups).transform("sum")).fillna(0).astype(np.int64)
+    rank = (exact - base).groupby(groups).rank(method="first", ascending=False)
+    return (base + (rank <= leftover)).astype(np.int64)
+
+# function that computes the per-county sample sizes and costs. county_votes has
+# one row per (year, state, office, county) with the county's ballots for that
+# contest; manifests (optional) holds one row per (year, state, county) with
+# the ballots in the county's manifest, which then drive allocation and indexing.
+def county_costs(county_votes: pd.DataFrame, state_samples: pd.DataFrame, manifests: pd.DataFrame = None,
+                 clerk_wage_hr: float = cost_model.CLERK_WAGE_HR, hrs_to_idx: float = cost_model.HRS_TO_IDX,
+                 minutes_wage: float = cost_model.MINUTES_WAGE, minutes_bal_time: float = cost_model.MINUTES_BAL_TIME):
+    contests = pd.merge(county_votes, state_samples[["office", "year", "state_po", "num_ballots"]],
+                        on=["office", "year", "state_po"], how="inner")
+    if manifests is not None:
+        contests = pd.merge(contests.drop(columns=["ballots"]),
+                            manifests[["year", "state_po", "county", "ballots"]],
+                            on=["year", "state_po", "county"], how="inner")
+    contests["num_ballots"] = allocate(contests["num_ballots"], contests["ballots"],
+                                       [contests["office"], contests["year"], contests["state_po"]])
+    contests["procedural_cost"] = cost_model.procedural_cost(contests["num_ballots"], minutes_wage,
+                                                             minutes_bal_time).round(2)
+    # one row per county-year: one sample column and one cost column per office
+    wide = contests.pivot_table(index=KEYS + ["county"], columns="office",
+                                values=["num_ballots", "procedural_cost"], aggfunc="sum", fill_value=0)
+    wide.columns = [f"{val}_{office}" for val, office in wide.columns]
+    for office in cost_model.OFFICES:
+        for val in ["num_ballots", "procedural_cost"]:
+            if f"{val}_{office}" not in wide.columns:
+                wide[f"{val}_{office}"] = 0
+    wide = wide.reset_index()
+    # ballots cast in the county: the manifest, or else the largest contest on the ballot
+    if manifests is not None:
+        ballots = manifests[["year", "state_po", "county", "ballots"]]
+    else:
+        ballots = county_votes.groupby(["year", "state_po", "county"], as_index=False)["ballots"].max()
+    wide = pd.merge(wide, ballots, on=["year", "state_po", "county"], how="left")
+    wide["ballots"] = wide["ballots"].fillna(0)
+    wide["prep_cost"] = cost_model.prep_cost(1, wide["ballots"], clerk_wage_hr, hrs_to_idx)
+    wide["procedural_cost_total"] = sum(wide[f"procedural_cost_{o}"] for o in cost_model.OFFICES)
+    wide["procedural_cost_excl_pres"] = sum(wide[f"procedural_cost_{o}"] for o in cost_model.OFFICES
+                                            if o != "president")
+    return wide
+
+# function that rolls the county table up to the state-year table used by the rest of the pipeline
+def roll_up_to_states(counties: pd.DataFrame, central: float = cost_model.CENTRAL_COST):
+    cols = ([f"{v}_{o}" for o in cost_model.OFFICES for v in ["num_ballots", "procedural_cost"]]
+            + ["procedural_cost_total", "procedural_cost_excl_pres", "ballots", "prep_cost"])
+    states = counties.groupby(KEYS, as_index=False)[cols].sum()
+    states["num_counties"] = counties.groupby(KEYS)["county"].nunique().to_numpy()
+    states["num_ballots_total"] = sum(states[f"num_ballots_{o}"] for o in cost_model.OFFICES)
+    states = states.rename(columns={"ballots": "totalvotes", "prep_cost": "prep_cost_total"})
+    states["central_cost_total"] = cost_model.central_cost(len(states), central)
+    states["cost_total"] = states["central_cost_total"] + states["prep_cost_total"] + states["procedural_cost_total"]
+    states["cost_total_excl_pres"] = (states["central_cost_total"] + states["prep_cost_total"]
+                                      + states["procedural_cost_excl_pres"])
+    order = KEYS + [f"{v}_{o}" for o in cost_model.OFFICES for v in ["num_ballots", "procedural_cost"]] + \
+        ["num_ballots_total", "procedural_cost_total", "procedural_cost_excl_pres", "totalvotes",
+         "num_counties", "prep_cost_total", "central_cost_total", "cost_total", "cost_total_excl_pres"]
+    return states[order]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="County-level RLA cost model.")
+    parser.add_argument("returns", help="MEDSL county- or precinct-level returns CSV")
+    parser.add_argument("--jurisdiction", default="county_name")
+    parser.add_argument("--votes", default="votes", help="column holding candidate votes")
+    parser.add_argument("--manifests", default=None,
+                        help="CSV of ballot manifests with year, state_po, county, ballots")
+    parser.add_argument("--out", default="important-data/county-level")
+    args = parser.parse_args()
+    cvotes = load_county_votes(args.returns, args.jurisdiction, args.votes)
+    mans = pd.read_csv(args.manifests, dtype={"county": str}) if args.manifests else None
+    per_county = county_costs(cvotes, load_state_samples(), mans)
+    per_state = roll_up_to_states(per_county)
+    os.makedirs(args.out, exist_ok=True)
+    per_county.to_csv(os.path.join(args.out, "county_costs.csv"), index=False)
+    per_state.to_csv(os.path.join(args.out, "all_data_by_state_yr.csv"), index=False)
+    print("National avg. county-level RLA cost (no-president):",
+          per_state.groupby("year")["cost_total_excl_pres"].sum().mean())
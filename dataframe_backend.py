@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import dataverse_cache
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = pc = ds = None
+
+# thin dataframe interface for the heavy steps of the office scripts and of
+# aggregate_data.py: scanning a MEDSL source (only some columns, years and
+# rows), grouped aggregations and de-duplication. The scripts express those
+# steps through a backend and only bring the (small) aggregated result into
+# pandas for the rest of their work, so the same code runs on either engine:
+#
+#   - "pandas" (the default): eager pandas over the columnar dataverse cache;
+#   - "arrow": pyarrow's multithreaded compute engine, which scans the parquet
+#     cache as a dataset with the column selection and the row filters pushed
+#     down into the scan (only the row groups of the years asked for are read,
+#     only the columns asked for are decoded), and aggregates with
+#     Table.group_by on every core.
+#
+# Both return their aggregations sorted by the group keys, with null keys
+# dropped (as pandas' groupby does), so both give the same outputs.
+#
+# A filter (where) is a list of (column, op, value) conditions that all hold:
+# op is "==", "!=", "in" or "notnull" (value ignored).
+
+BACKENDS = ("pandas", "arrow")
+DEFAULT = "pandas"
+
+class PandasBackend:
+    name = "pandas"
+
+    # function that reads the columns of a MEDSL source, for some years
+    # ((lo, hi) range or list) and the rows that pass where
+    def scan(self, path: str, columns: list, years=None, where: list = ()):
+        extra = [col for col, _, _ in where if col not in columns]
+        df = dataverse_cache.read_dataverse(path, columns=columns + extra, years=years, categorical=False)
+        mask = np.ones(len(df), dtype=bool)
+        for col, op, value in where:
+            if op == "==":
+                mask &= (df[col] == value).to_numpy()
+            elif op == "!=":
+                mask &= (df[col] != value).to_numpy()
+            elif op == "in":
+                mask &= df[col].isin(value).to_numpy()
+            elif op == "notnull":
+                mask &= df[col].notna().to_numpy()
+            else:
+                raise ValueError(f"unknown filter operator '{op}'")
+        return df.loc[mask, columns].reset_index(drop=True)
+
+    # function that aggregates columns per group of keys, aggs maps a column to "sum" or "max"
+    def group_agg(self, frame: pd.DataFrame, keys: list, aggs: dict):
+        return frame.groupby(keys, sort=True)[list(aggs)].agg(aggs).reset_index()
+
+    # function that turns a pandas DataFrame into a frame of the backend
+    def from_pandas(self, frame: pd.DataFrame):
+        return frame
+
+    # function that drops duplicate rows
+    def distinct(self, frame: pd.DataFrame):
+        return frame.drop_duplicates().reset_index(drop=True)
+
+    # function that returns a frame of the backend as a pandas DataFrame
+    def to_pandas(self, frame: pd.DataFrame):
+        return frame
+
+class ArrowBackend:
+    name = "arrow"
+
+    def __init__(self):
+        if pa is None:
+            raise ImportError("the arrow backend requires pyarrow")
+
+    @staticmethod
+    def _expression(col: str, op: str, value):
+        field = ds.field(col)
+        if op == "==":
+            return field == value
+        if op == "!=":
+            return field != value
+        if op == "in":
+            return field.isin(list(value))
+        if op == "notnull":
+            return field.is_valid()
+        raise ValueError(f"unknown filter operator '{op}'")
+
+    def scan(self, path: str, columns: list, years=None, where: list = ()):
+        if not dataverse_cache.is_fresh(path):
+            dataverse_cache.build_cache(path)
+        conditions = [self._expression(*w) for w in where]
+        if isinstance(years, tuple):
+            conditions += [ds.field("year") >= years[0], ds.field("year") <= years[1]]
+        elif years is not None:
+            conditions.append(ds.field("year").isin(list(years)))
+        flt = None
+        for cond in conditions:
+            flt = cond if flt is None else flt & cond
+        table = ds.dataset(dataverse_cache.cache_path(path), format="parquet").to_table(columns=columns, filter=flt,
+                                                                                         use_threads=True)
+        # text columns are compared and grouped as plain strings, like pandas' object columns
+        return pa.table({name: col.cast(col.type.value_type) if pa.types.is_dictionary(col.type) else col
+                         for name, col in zip(table.column_names, table.columns)})
+
+    def group_agg(self, frame, keys: list, aggs: dict):
+        valid = None
+        for key in keys:
+            cond = pc.is_valid(frame[key])
+            valid = cond if valid is None else pc.and_(valid, cond)
+        frame = frame.filter(valid)
+        out = frame.group_by(keys, use_threads=True).aggregate([(col, agg) for col, agg in aggs.items()])
+        # the aggregates come back as <column>_<agg>
+        names = {f"{col}_{agg}": col for col, agg in aggs.items()}
+        out = out.rename_columns([names.get(c, c) for c in out.column_names]).select(keys + list(aggs))
+        return out.sort_by([(k, "ascending") for k in keys])
+
+    def from_pandas(self, frame: pd.DataFrame):
+        return pa.Table.from_pandas(frame, preserve_index=False)
+
+    def distinct(self, frame):
+        return frame.group_by(frame.column_names, use_threads=True).aggregate([])
+
+    def to_pandas(self, frame):
+        return frame.to_pandas()
+
+# function that returns a backend by name (None for the default)
+def get_backend(name: str = None):
+    name = name or DEFAULT
+    if name == "pandas":
+        return PandasBackend()
+    if name == "arrow":
+        return ArrowBackend()
+    raise ValueError(f"unknown dataframe backend '{name}', expected one of {BACKENDS}")
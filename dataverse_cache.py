@@ -0,0 +1,129 @@
+import hashlib
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# typed, columnar cache of the MIT Election Data and Science Lab CSVs
+# (1976-2022-house.csv, 1976-2020-senate.csv, 1976-2020-president.csv).
+# Each source is converted once into a parquet file with one row group per
+# year, categorical state/party columns and integer vote counts. Readers load
+# only the columns and years they ask for; the cache is rebuilt automatically
+# whenever the source CSV changes. Without pyarrow the readers fall back to
+# reading the CSV with the same column and year selection.
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".dataverse_cache")
+
+# high-cardinality text columns stay plain strings; every other text column is categorical
+STRING_COLUMNS = {"candidate"}
+INT_DTYPES = {"year": "int16", "state_fips": "int8", "state_cen": "int8", "state_ic": "int16",
+              "district": "int16", "version": "int32",
+              "candidatevotes": "int64", "totalvotes": "int64"}
+
+# function that returns where the cache of a source CSV lives
+def cache_path(csv_path: str):
+    src = os.path.abspath(csv_path)
+    tag = hashlib.sha256(src.encode()).hexdigest()[:10]
+    return os.path.join(CACHE_DIR, f"{os.path.splitext(os.path.basename(src))[0]}-{tag}.parquet")
+
+def _sha256(path: str):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# function that gives every column of a raw source frame its cached type
+def apply_types(df: pd.DataFrame):
+    for col in df.columns:
+        if col in INT_DTYPES and pd.api.types.is_integer_dtype(df[col]):
+            df[col] = df[col].astype(INT_DTYPES[col])
+        elif col == "writein":
+            # the office scripts read writein with astype(bool), so missing values count as write-ins
+            df[col] = df[col].astype(bool)
+        elif df[col].dtype == object and col not in STRING_COLUMNS:
+            df[col] = df[col].astype("category")
+    return df
+
+# function that converts a source CSV into the cache, one row group per year.
+# The cache is written to a temporary file of its own and moved into place,
+# so processes that build the same cache at the same time never write into
+# each other's file; the last one to finish wins, with identical content.
+def build_cache(csv_path: str):
+    if pq is None:
+        raise ImportError("building the dataverse cache requires pyarrow")
+    df = apply_types(pd.read_csv(csv_path))
+    df = df.sort_values("year", kind="stable").reset_index(drop=True)
+    st = os.stat(csv_path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = dict(table.schema.metadata or {})
+    meta.update({b"source_sha256": _sha256(csv_path).encode(),
+                 b"source_stamp": f"{st.st_size}:{st.st_mtime_ns}".encode()})
+    table = table.replace_schema_metadata(meta)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    out = cache_path(csv_path)
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=os.path.basename(out) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(tmp, table.schema) as writer:
+            years = df["year"].to_numpy()
+            bounds = np.flatnonzero(np.diff(years)) + 1
+            for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(years)]):
+                writer.write_table(table.slice(lo, hi - lo))
+        os.replace(tmp, out)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return out
+
+# function that checks whether the cache of a source CSV is still valid
+def is_fresh(csv_path: str):
+    out = cache_path(csv_path)
+    if not os.path.exists(out):
+        return False
+    meta = pq.read_schema(out).metadata or {}
+    st = os.stat(csv_path)
+    if meta.get(b"source_stamp") == f"{st.st_size}:{st.st_mtime_ns}".encode():
+        return True
+    return meta.get(b"source_sha256") == _sha256(csv_path).encode()
+
+# function that turns a year selection ((lo, hi) range or list of years) into a parquet filter
+def _year_filter(years):
+    if years is None:
+        return None
+    if isinstance(years, tuple):
+        return [("year", ">=", years[0]), ("year", "<=", years[1])]
+    return [("year", "in", list(years))]
+
+# function that reads a dataverse CSV through the cache. columns limits the
+# columns loaded, years is an inclusive (lo, hi) range or a list of years.
+# categorical=False returns text columns as plain strings.
+def read_dataverse(csv_path: str, columns: list = None, years=None, categorical: bool = True):
+    if pq is None:
+        df = apply_types(pd.read_csv(csv_path, usecols=columns))
+        if isinstance(years, tuple):
+            df = df[df["year"].between(*years)]
+        elif years is not None:
+            df = df[df["year"].isin(list(years))]
+    else:
+        if not is_fresh(csv_path):
+            build_cache(csv_path)
+        df = pq.read_table(cache_path(csv_path), columns=columns, filters=_year_filter(years)).to_pandas()
+    if not categorical:
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype(object)
+    return df.reset_index(drop=True)
+
+if __name__ == "__main__":
+    for src in ["house/dataverse_files/1976-2022-house.csv",
+                "senate/dataverse_files/1976-2020-senate.csv",
+                "presidential/dataverse_files/1976-2020-president.csv"]:
+        if not is_fresh(src):
+            print("cached", build_cache(src))
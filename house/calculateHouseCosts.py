@@ -1,81 +1,334 @@
 import pandas as pd
-import math
+import numpy as np
+import argparse
+import hashlib
 import os
-import re
+import sys
+
+# the shared cost model lives at the top level of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asn_tables
+import cost_model
+import dataverse_cache
+import dataframe_backend
+import partitioned_writer
+import instrumentation
+import results_store
+import schema
+import state_registry
+from state_registry import get_registry
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_colwidth', None)
 pd.set_option('display.max_rows', None)
 
-# read all dataframes from 2022-2000
-def read_data():
-    data = pd.read_excel("dataverse_files/house_election_chart.xlsx", sheet_name="2022")
-    data.rename(mapper={"Unnamed: 3":'num_ballots'}, axis=1, inplace=True)
-    cols = data.columns.to_list()
-    data["year"] = [2022]*len(data)
-    for yr in range(2024,1999,-2):
-        if yr != 2022:
-            hec = pd.read_excel("dataverse_files/house_election_chart.xlsx", 
-                                sheet_name=str(yr), names=cols)
-            hec["year"] = [yr]*len(hec)
-            data = pd.concat([data, hec], axis=0)
+# the house pipeline reads its workbook from and writes its results to one
+# directory (by default, the one of this script)
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKBOOK = "dataverse_files/house_election_chart.xlsx"
+MEDSL_CSV = "dataverse_files/1976-2022-house.csv"
+# the code that turns the workbook into results: this script and the modules its loaders use
+LOADER_CODE = [os.path.abspath(__file__)] + [m.__file__ for m in (asn_tables, cost_model, dataframe_backend,
+                                                                   dataverse_cache, state_registry)] \
+              + [state_registry.ABBR_PATH]
+COLUMNS = ["State and District", "Winner (Percentage of Votes)",
+           "1st Runner-Up (Percentage of Votes)", "num_ballots"]
+# Excel error values and the strings pandas reads as missing
+NA_STRINGS = {"", "N/A", "NA", "#N/A", "n/a", "NaN", "nan", "NULL", "null",
+              "#VALUE!", "#DIV/0!", "#REF!", "#NAME?", "#NUM!", "#NULL!"}
+# misspelled state names of the workbook
+STATE_ALIASES = {"Tennesse": "Tennessee"}
+# the workbook's vote shares have three decimals, so a margin below this is
+# rounding noise (e.g. 0.50001 vs 0.49999) and the race too close to call from them
+SHARE_RESOLUTION = 0.001
+
+# function that hashes the workbook, so that its parsed cache can be reused
+def workbook_hash(path: str):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# function that walks every year sheet of the workbook in one streaming pass.
+# only the 2022 sheet has a header row, which is skipped; the first row of the
+# sheets without one is flagged in first_row (read_excel took it for a header).
+def parse_workbook(path: str = os.path.join(HERE, WORKBOOK)):
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = ["2022"] + [str(yr) for yr in range(2024,1999,-2) if yr != 2022]
+        # preallocate for every row of every sheet, then trim to what was read
+        size = sum(wb[s].max_row or 0 for s in sheets)
+        columns = [np.empty(size, dtype=object) for _ in COLUMNS]
+        years = np.empty(size, dtype=np.int64)
+        first = np.zeros(size, dtype=bool)
+        n = 0
+        for sheet in sheets:
+            start, header = n, False
+            for row in wb[sheet].iter_rows(values_only=True):
+                if n == start and not header and row and row[0] == COLUMNS[0]:
+                    header = True
+                    continue
+                if n == size:
+                    # sheets without stored dimensions report no rows up front
+                    grow = max(size, 1024)
+                    columns = [np.concatenate([c, np.empty(grow, dtype=object)]) for c in columns]
+                    years = np.concatenate([years, np.empty(grow, dtype=np.int64)])
+                    first = np.concatenate([first, np.zeros(grow, dtype=bool)])
+                    size += grow
+                for col, val in zip(columns, row[:len(COLUMNS)]):
+                    col[n] = None if isinstance(val, str) and val in NA_STRINGS else val
+                years[n] = int(sheet)
+                first[n] = n == start and not header
+                n += 1
+    finally:
+        wb.close()
+    data = pd.DataFrame({c: col[:n] for c, col in zip(COLUMNS, columns)})
+    # numeric columns get numeric dtypes; columns holding text stay object
+    for c in COLUMNS:
+        try:
+            data[c] = pd.to_numeric(data[c])
+        except (ValueError, TypeError):
+            pass
+    data["year"] = years[:n]
+    data["first_row"] = first[:n]
     return data
 
-# transform the data
-def transform_data(data: pd.DataFrame):
+# read all dataframes from 2022-2000, reusing the parsed workbook when it did not change
+@instrumentation.step("load")
+def read_data(path: str = os.path.join(HERE, WORKBOOK)):
+    cache = os.path.join(dataverse_cache.CACHE_DIR, f"house_election_chart-v2-{workbook_hash(path)[:16]}.pkl")
+    if os.path.exists(cache):
+        return pd.read_pickle(cache)
+    data = parse_workbook(path)
+    os.makedirs(dataverse_cache.CACHE_DIR, exist_ok=True)
+    data.to_pickle(cache)
+    return data
+
+# transform the data (the per-state sums run on the given dataframe backend).
+# with an audit (see cost_model.AUDITS), every district's ballots are the
+# audit's average sample number at its winner's lead instead of 7/margin
+@instrumentation.step("transform")
+def transform_data(data: pd.DataFrame, backend: str = None, audit: str = None):
+    # the state table leaves out the first row of every sheet, as it always has
+    # (the per-district pipeline keeps them)
+    data = data[~data["first_row"]].reset_index(drop=True)
     # function to resolve any values that are unusual
-    data["num_ballots"] = data["num_ballots"].fillna(0.0)
-    data["num_ballots"] = data["num_ballots"].apply(func=math.ceil)
+    data["num_ballots"] = np.ceil(data["num_ballots"].fillna(0.0).to_numpy(dtype=float)).astype(np.int64)
     data["Winner (Percentage of Votes)"] = data["Winner (Percentage of Votes)"].fillna(0.0)
     data["1st Runner-Up (Percentage of Votes)"] = data["1st Runner-Up (Percentage of Votes)"].fillna(0.0)
-    # function to extract the state from State and District
-    def get_state(snd: str):
-        pat = r".(\d+|at-large)\s*"
-        e = re.search(pattern=pat, string=snd)
-        if type(e) == re.Match:
-            info = snd.split(e.group())
-            return info[0].strip()
-        else:
-            return snd.strip()
-    data["State"] = data["State and District"].apply(get_state)
+    lead = pd.to_numeric(data["Winner (Percentage of Votes)"], errors="coerce") \
+        - pd.to_numeric(data["1st Runner-Up (Percentage of Votes)"], errors="coerce")
+    sizes = cost_model.audit_sample_sizes(lead.fillna(0.0).to_numpy(), data["num_ballots"].to_numpy(), audit)
+    # districts without ballots (no race) stay without
+    data["num_ballots"] = np.where(data["num_ballots"] > 0, sizes, 0)
+    # extract the state from State and District
+    data["State"] = parse_districts(data["State and District"])["state"]
     # apply our procedural cost model: 
     # num_ballots * 1.5min/ballot * 0.35USD/min
-    data["procedural_cost"] = data["num_ballots"].apply(lambda nb: procedural_cost(nbals=nb)).round(2)
+    data["procedural_cost"] = cost_model.procedural_cost(data["num_ballots"]).round(2)
     # add state abbr. data
-    abbr = pd.read_csv("state_abbr.tsv", sep="\t")
-    data = pd.merge(left=data, right=abbr, on=['State'], how='inner')
-    data.drop(columns=['Standard'], inplace=True)
-    data.rename(mapper={"State": "state","Postal": "state_po"}, inplace=True, axis=1)
-    data['state'] = data['state'].str.upper()
+    # (districts of states missing from the registry are dropped)
+    ids = get_registry().ids(data["State"], "name", missing="ignore")
+    data = data[ids >= 0].reset_index(drop=True)
+    data["state"] = get_registry().take(ids[ids >= 0], "name")
+    data["state_po"] = get_registry().take(ids[ids >= 0], "postal")
     # we ignore the districts and simply look at states and years
-    for col in data.columns.tolist():
-        if col not in ["year", "state", "procedural_cost", "state_po", "num_ballots"]:
-            data.drop(columns=[col], inplace=True)
-    data = data.groupby(by=['year', 'state', 'state_po']).sum()
-    data["margin"] = data["num_ballots"].apply(lambda nb: 7/nb if nb != 0.0 else 0.0)
+    be = dataframe_backend.get_backend(backend)
+    keys = ["year", "state", "state_po"]
+    data = be.from_pandas(data[keys + ["num_ballots", "procedural_cost"]])
+    data = be.to_pandas(be.group_agg(data, keys, {"num_ballots": "sum", "procedural_cost": "sum"})).set_index(keys)
+    # the districts' costs are in cents, and so is their sum
+    data["procedural_cost"] = data["procedural_cost"].round(2)
+    nb = data["num_ballots"].to_numpy(dtype=float)
+    data["margin"] = np.divide(7, nb, out=np.zeros(len(nb)), where=nb != 0)
+    return data
+
+# function that splits "State and District" labels ("Alabama 1", "Alaska
+# at-large", "Vermont") into the state and the district number (0 for
+# at-large seats), all labels at once
+def parse_districts(labels: pd.Series):
+    labels = labels.astype(str)
+    parts = labels.str.extract(r"^(?P<state>.*?).(?P<district>\d+|at-large)")
+    return pd.DataFrame({"state": parts["state"].str.strip().fillna(labels.str.strip()),
+                         "district": pd.to_numeric(parts["district"].replace("at-large", "0")).fillna(0)})
+
+# function that computes the margin of every district's general election from
+# the MEDSL candidate votes: the winner's lead over the runner-up, as a share
+# of the ballots cast. Fusion tickets are summed per candidate; write-ins and
+# blank, void and scattering rows are left out, as are special elections. A
+# seat where only one candidate got votes is unopposed. Some states leave
+# unopposed candidates off the ballot and only report a placeholder total (1, 0
+# or -1): those seats have no ballots cast (NaN) and a margin of 1. The
+# scan and the per-candidate and per-district aggregations run on the given
+# dataframe backend.
+@instrumentation.step("load")
+def district_margins_from_returns(path: str = os.path.join(HERE, MEDSL_CSV), years: tuple = (2000, 2022),
+                                  backend: str = None):
+    keys = ["year", "state_po", "district"]
+    be = dataframe_backend.get_backend(backend)
+    df = be.scan(path, columns=keys + ["candidate", "candidatevotes", "totalvotes"], years=years,
+                 where=[("stage", "==", "GEN"), ("special", "==", False), ("writein", "==", False),
+                        ("party", "notnull", None)])
+    votes = be.to_pandas(be.group_agg(df, keys + ["candidate"], {"candidatevotes": "sum"}))
+    # the two largest candidate totals of every district
+    votes = votes.sort_values(keys + ["candidatevotes"], ascending=[True]*len(keys) + [False], kind="stable")
+    rank = votes.groupby(keys, sort=False).cumcount().to_numpy()
+    first = votes[rank == 0].set_index(keys)["candidatevotes"]
+    second = votes[rank == 1].set_index(keys)["candidatevotes"].reindex(first.index, fill_value=0)
+    totals = be.to_pandas(be.group_agg(df, keys, {"totalvotes": "max"})).set_index(keys)["totalvotes"]
+    totals = totals.reindex(first.index)
+    out = first.index.to_frame(index=False)
+    unopposed = (second == 0).to_numpy()
+    reported = (totals > 1).to_numpy() & (first > 0).to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = np.where(reported, (first - second).to_numpy()/totals.to_numpy(), np.nan)
+    out["margin"] = np.where(reported | ~unopposed, margin, 1.0)
+    out["totalvotes"] = np.where(reported, totals.to_numpy(), np.nan)
+    out["rounded"] = False
+    out["unopposed"] = unopposed
+    return out
+
+# function that computes the margin of every district from the workbook's
+# winner and runner-up shares (for the years the MEDSL returns do not cover).
+# The shares carry no vote counts, so every district gets the ballots cast in
+# it in the latest year of returns (or, for a district without a reported
+# total there, the state's average district with one) as its cap. A district
+# without a runner-up is unopposed. Margins the shares cannot resolve are
+# flagged as rounded. Rows of unknown states are dropped, and both those and
+# district counts that differ from the returns' are reported.
+def district_margins_from_workbook(data: pd.DataFrame, years: list, returns: pd.DataFrame):
+    data = data[data["year"].isin(years)].reset_index(drop=True)
+    parsed = parse_districts(data["State and District"])
+    registry = get_registry()
+    states = parsed["state"].replace(STATE_ALIASES)
+    ids = registry.ids(states.str.upper(), "name", missing="ignore")
+    keep = ids >= 0
+    for label in data["State and District"][~keep]:
+        print(f"house: dropped workbook district '{label}' (unknown state)")
+    winner = pd.to_numeric(data["Winner (Percentage of Votes)"], errors="coerce")
+    runner_up = pd.to_numeric(data["1st Runner-Up (Percentage of Votes)"], errors="coerce").fillna(0.0)
+    out = pd.DataFrame({"year": data["year"][keep].to_numpy(), "state_po": registry.take(ids[keep], "postal"),
+                        "district": parsed["district"][keep].astype(int).to_numpy(),
+                        "margin": (winner - runner_up)[keep].to_numpy()})
+    latest = returns[returns["year"] == returns["year"].max()]
+    reported = latest[latest["totalvotes"].notna()]
+    by_district = reported.set_index(["state_po", "district"])["totalvotes"]
+    by_state = reported.groupby("state_po")["totalvotes"].mean()
+    totals = by_district.reindex(pd.MultiIndex.from_frame(out[["state_po", "district"]])).to_numpy()
+    out["totalvotes"] = np.where(np.isnan(totals), out["state_po"].map(by_state).to_numpy(dtype=float), totals)
+    out["totalvotes"] = np.round(out["totalvotes"])
+    out["rounded"] = (out["margin"] < SHARE_RESOLUTION).to_numpy()
+    out["unopposed"] = (runner_up[keep] == 0).to_numpy()
+    seats = latest.groupby("state_po").size()
+    for year, part in out.groupby("year"):
+        counts = part.groupby("state_po").size()
+        for state_po in sorted(set(seats.index) | set(counts.index)):
+            if counts.get(state_po, 0) != seats.get(state_po, 0):
+                print(f"house: {year} has {counts.get(state_po, 0)} district(s) in {state_po}, "
+                      f"the {latest['year'].max()} returns {seats.get(state_po, 0)}")
+    return out
+
+# function that applies the cost model to every district: 7/margin ballots
+# (or, with an audit, its average sample number; never more than the ballots
+# cast, where known), a full hand count where the margin is rounded away, none
+# where there is no margin. Unopposed seats are costed at a margin of 1, as in
+# the state table
+@instrumentation.step("transform")
+def district_costs(districts: pd.DataFrame, audit: str = None):
+    registry = get_registry()
+    ids = registry.ids(districts["state_po"], "postal")
+    margin = districts["margin"].to_numpy(dtype=float)
+    totalvotes = districts["totalvotes"].to_numpy(dtype=float)
+    rounded = districts["rounded"].to_numpy(dtype=bool)
+    unopposed = districts["unopposed"].to_numpy(dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nb = np.where(margin > 0, cost_model.margin_sample_sizes(margin, "house"), np.inf)
+    if audit is not None:
+        # districts without a vote total escalate to max_draws instead of a full count
+        lead = np.where(margin > 0, margin, 1.0)
+        nb = np.where(margin > 0, cost_model.audit_sample_sizes(lead, nb, audit, ballots_cast=totalvotes), nb)
+    nb = np.fmin(np.where(rounded, totalvotes, nb), totalvotes)
+    nb = np.where(np.isfinite(nb) & ~np.isnan(margin), nb, 0).astype(np.int64)
+    out = pd.DataFrame({"year": districts["year"].to_numpy(), "state": registry.take(ids, "name"),
+                        "state_po": districts["state_po"].to_numpy(),
+                        "district": districts["district"].to_numpy(), "margin": margin, "num_ballots": nb,
+                        "totalvotes": pd.array(totalvotes, dtype="Int64"), "rounded": rounded,
+                        "unopposed": unopposed})
+    out["procedural_cost"] = cost_model.procedural_cost(out["num_ballots"]).round(2)
+    return out.sort_values(["year", "state", "district"], kind="stable").reset_index(drop=True)
+
+# function that rolls the districts up to the state table: the ballots and
+# costs of every district, and the margin of the closest one
+@instrumentation.step("merge")
+def roll_up_districts(districts: pd.DataFrame):
+    data = districts.groupby(["year", "state", "state_po"], observed=True).agg(
+        num_ballots=("num_ballots", "sum"), procedural_cost=("procedural_cost", "sum"), margin=("margin", "min"))
+    data["procedural_cost"] = data["procedural_cost"].round(2)
     return data
 
-# function that applies the procedural cost model
-# Procedural Total: (# of ballots needed for RLA *  "minutely" wage of county clerk * time per ballot)
-def procedural_cost(nbals: int):
-    minutesWage = 0.35
-    minutes_balTime = 2
-    return nbals*minutesWage*minutes_balTime
+# function that runs the house pipeline per district: the 2000-2022 margins
+# come from the MEDSL returns and later ones from the workbook; the district
+# table is written to house_district_margins.csv and the state table it rolls
+# up to is returned (indexed by year, state and state_po)
+def run_districts(directory: str = HERE, backend: str = None, audit: str = None):
+    returns = district_margins_from_returns(os.path.join(directory, MEDSL_CSV), backend=backend)
+    workbook = read_data(os.path.join(directory, WORKBOOK))
+    later = sorted(set(workbook["year"].unique()) - set(returns["year"].unique()))
+    districts = district_costs(pd.concat([returns, district_margins_from_workbook(workbook, later, returns)],
+                                         ignore_index=True), audit)
+    schema.write_csv(districts, os.path.join(directory, "house_district_margins.csv"), schema.MARGINS)
+    return roll_up_districts(districts)
+
+# function that adds the workbook to the results store unless it was already
+# ingested with the same loader code, cost model and options; only new or
+# changed state-years are appended. returns the keys appended.
+@instrumentation.step("load")
+def ingest_sources(store: results_store.ResultsStore, path: str = os.path.join(HERE, WORKBOOK), backend: str = None,
+                   audit: str = None):
+    fingerprint = results_store.fingerprint(LOADER_CODE, {"backend": backend, "audit": audit,
+                                                          "cost_model": cost_model.constants()})
+    return store.ingest_file("house", path, lambda: transform_data(read_data(path), backend, audit), fingerprint)
+
+# function that reads the latest house results of every year from the results store
+@instrumentation.step("merge")
+def read_results(store: results_store.ResultsStore):
+    data = schema.apply(store.read("house"), schema.MARGINS).set_index(["year", "state", "state_po"])
+    return data[["num_ballots", "procedural_cost", "margin"]]
 
 # write the final data to csv
-def write_results(data: pd.DataFrame):
-    data.to_csv("house_margins.csv")
-    new_data = pd.read_csv('house_margins.csv')
-    states = set(new_data.state_po)
-    if not os.path.exists("state-by-state"):
-        os.mkdir("state-by-state")
-    for st in states:
-        stsp = new_data[new_data.state_po==st].reset_index(drop=True)
-        stsp.to_csv(f"state-by-state/house_margins_{st}.csv")
+# (with states, only the files of those states, and of states without a file, are rewritten)
+@instrumentation.step("write")
+def write_results(data: pd.DataFrame, directory: str = HERE, states: list = None):
+    schema.write_csv(data, os.path.join(directory, "house_margins.csv"), schema.MARGINS)
+    # the state files hold the columns of house_margins.csv, taken from the frame instead of re-reading it
+    partitioned_writer.write_partitions(data.reset_index(), "state_po",
+                                        os.path.join(directory, "state-by-state/house_margins_{}.csv"), only=states,
+                                        index=False)
     return 
 
+# function that runs the whole house pipeline on the workbook under directory,
+# writes its results there and returns them (indexed by year, state and state_po).
+# with districts, the pipeline runs per district instead (see run_districts).
+def run(directory: str = HERE, store: results_store.ResultsStore = None, districts: bool = False,
+        backend: str = None, audit: str = None):
+    if districts:
+        return run_districts(directory, backend, audit)
+    # the workbook is parsed only when it changed
+    store = store or results_store.ResultsStore()
+    appended = ingest_sources(store, os.path.join(directory, WORKBOOK), backend, audit)
+    hdata = read_results(store)
+    write_results(hdata, directory, states=appended["state_po"].unique().tolist())
+    return hdata
+
 if __name__ == "__main__":
-    # main procedure
-    hdata = read_data()
-    hdata = transform_data(hdata)
-    write_results(hdata)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--districts", action="store_true",
+                        help="run the cost model per district, with margins from the MEDSL returns")
+    parser.add_argument("--backend", choices=dataframe_backend.BACKENDS, default=None,
+                        help="dataframe engine of the heavy steps (default: pandas)")
+    parser.add_argument("--audit", choices=cost_model.AUDITS, default=None,
+                        help="use the average sample numbers of this audit instead of 7/margin")
+    args = parser.parse_args()
+    run(districts=args.districts, backend=args.backend, audit=args.audit)
\ No newline at end of file
@@ -0,0 +1,289 @@
+import atexit
+import contextlib
+import functools
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# run instrumentation. Every pipeline stage and every load, transform, merge,
+# write and plot step decorated with @step is recorded as a span with its wall
+# and CPU time, peak RSS, rows in and out and bytes read and written. Spans of
+# child processes (the office scripts run as scripts, or the stages run in a
+# worker pool) are written to a directory passed down in the environment and
+# merged into the parent's report. The
+# report is JSON; the same spans can be written as a Chrome trace
+# (chrome://tracing, Perfetto). With profiling on, a sampling thread records
+# the Python stack of every profiled span as folded stacks (flamegraph.pl,
+# speedscope).
+#
+# Peak RSS is the high-water mark during the span where Linux lets it be reset
+# (/proc/self/clear_refs), and the process-lifetime peak elsewhere. Bytes are
+# the rchar/wchar counters of /proc/self/io, and are missing where it does not exist.
+
+ENV_DIR = "RLA_TRACE_DIR"
+ENV_PROFILE = "RLA_PROFILE"
+INTERVAL = 0.005
+
+_RECORDER = None
+
+def _read_io():
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _read_hwm_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    if resource is not None:
+        # kilobytes on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale/2**20
+    return None
+
+def _reset_hwm():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+# function that counts the rows of a frame, series or array (None for anything else)
+def rows_of(value):
+    if hasattr(value, "shape") and len(getattr(value, "shape", ())) > 0:
+        return int(value.shape[0])
+    return None
+
+class Recorder:
+    def __init__(self, profile: bool = False, profile_only: list = None, interval: float = INTERVAL):
+        self.spans = []
+        self.open = []
+        self.profile = profile
+        self.profile_only = set(profile_only or [])
+        self.interval = interval
+        self.stacks = Counter()
+        self.child_dir = None
+        self._lock = threading.Lock()
+        self._sampled = {}
+        self._sampler = None
+
+    # function that decides whether a span is profiled
+    def _profiles(self, name: str):
+        return self.profile and (not self.profile_only or name in self.profile_only)
+
+    def _sample(self):
+        while self._sampled:
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, names in list(self._sampled.items()):
+                    frame = frames.get(ident)
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                        frame = frame.f_back
+                    if stack:
+                        self.stacks[";".join(names + stack[::-1])] += 1
+            time.sleep(self.interval)
+
+    # context manager that records one span. The yielded dict can be given
+    # rows_in/rows_out (or any other field) by the caller.
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "step"):
+        rec = {"name": name, "category": category, "pid": os.getpid(), "tid": threading.get_ident(),
+               "rows_in": None, "rows_out": None}
+        hwm = _read_hwm_mb()
+        for outer in self.open:
+            outer["_peak"] = max(outer["_peak"] or 0, hwm or 0)
+        rec["_peak"] = None if _reset_hwm() else hwm
+        io = _read_io()
+        profiled = self._profiles(name)
+        if profiled:
+            with self._lock:
+                self._sampled.setdefault(threading.get_ident(), []).append(name)
+            # child processes started during a profiled span profile themselves
+            if self.child_dir is not None:
+                os.environ[ENV_PROFILE] = "1"
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+        self.open.append(rec)
+        rec["start"] = time.time()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield rec
+            rec["status"] = rec.get("status", "ok")
+        except BaseException as e:
+            rec["status"] = f"error: {type(e).__name__}"
+            raise
+        finally:
+            rec["wall_seconds"] = time.perf_counter() - wall
+            rec["cpu_seconds"] = time.process_time() - cpu
+            self.open.remove(rec)
+            if profiled:
+                with self._lock:
+                    names = self._sampled.get(threading.get_ident(), [])
+                    if names:
+                        names.pop()
+                    if not names:
+                        self._sampled.pop(threading.get_ident(), None)
+                if self.child_dir is not None:
+                    os.environ[ENV_PROFILE] = ""
+            end = _read_io()
+            if io is not None and end is not None:
+                rec["bytes_read"], rec["bytes_written"] = end[0] - io[0], end[1] - io[1]
+            known = [x for x in [rec.pop("_peak"), _read_hwm_mb()] if x is not None]
+            peak = max(known) if known else None
+            rec["peak_rss_mb"] = peak
+            for outer in self.open:
+                outer["_peak"] = max(outer["_peak"] or 0, peak or 0)
+            self.spans.append(rec)
+
+    # function that lets child processes record into a directory this recorder collects
+    def share_with_children(self):
+        self.child_dir = tempfile.mkdtemp(prefix="rla-trace-")
+        os.environ[ENV_DIR] = self.child_dir
+        os.environ[ENV_PROFILE] = ""
+        return self.child_dir
+
+    # function that merges the spans and stacks written by child processes
+    def collect_children(self):
+        if self.child_dir is None:
+            return
+        for path in sorted(glob.glob(os.path.join(self.child_dir, "*.json"))):
+            with open(path) as f:
+                part = json.load(f)
+            self.spans.extend(part["spans"])
+            self.stacks.update(part["stacks"])
+        shutil.rmtree(self.child_dir, ignore_errors=True)
+        self.child_dir = None
+        os.environ.pop(ENV_DIR, None)
+        os.environ.pop(ENV_PROFILE, None)
+
+    # function that builds the run report
+    def report(self, **extra):
+        spans = sorted(self.spans, key=lambda s: s["start"])
+        origin = spans[0]["start"] if spans else time.time()
+        for s in spans:
+            s["offset_seconds"] = s["start"] - origin
+        return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), **extra, "spans": spans}
+
+    def write_report(self, path: str, **extra):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.report(**extra), f, indent=1, default=str)
+        return path
+
+    # function that writes the spans in the Chrome trace event format
+    def write_chrome_trace(self, path: str):
+        events = []
+        for s in self.spans:
+            args = {k: v for k, v in s.items() if k not in ("name", "category", "pid", "tid", "start") and v is not None}
+            events.append({"name": s["name"], "cat": s["category"], "ph": "X", "ts": s["start"]*1e6,
+                           "dur": s["wall_seconds"]*1e6, "pid": s["pid"], "tid": s["tid"] % 2**31, "args": args})
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+    # function that writes the sampled stacks as folded stacks, one "stack count" per line
+    def write_profile(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+# function that starts recording in this process
+def start(profile: bool = False, profile_only: list = None):
+    global _RECORDER
+    _RECORDER = Recorder(profile, profile_only)
+    return _RECORDER
+
+def get_recorder():
+    return _RECORDER
+
+# function that stops recording in this process and returns the recorder
+def stop():
+    global _RECORDER
+    rec, _RECORDER = _RECORDER, None
+    return rec
+
+# decorator that records every call of a function as a span of the given
+# category, with the rows of its frame arguments and of its result
+def step(category: str):
+    def wrap(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            if _RECORDER is None:
+                return func(*args, **kwargs)
+            with _RECORDER.span(func.__qualname__, category) as rec:
+                rows = [r for r in map(rows_of, list(args) + list(kwargs.values())) if r is not None]
+                rec["rows_in"] = sum(rows) if rows else None
+                result = func(*args, **kwargs)
+                rec["rows_out"] = rows_of(result)
+                return result
+        return run
+    return wrap
+
+# function that runs func(*args, **kwargs) in a worker process of an
+# instrumented run, recorded as a span of the given category together with the
+# steps it calls. The worker records with a recorder of its own (a forked
+# worker's copy of the parent's recorder is set aside) and leaves the spans in
+# the directory the parent collects.
+def run_recorded(name: str, category: str, profile: bool, func, args: tuple = (), kwargs: dict = None):
+    global _RECORDER
+    kwargs = kwargs or {}
+    directory = os.environ.get(ENV_DIR)
+    if not directory:
+        return func(*args, **kwargs)
+    rec = Recorder(profile)
+    previous, _RECORDER = _RECORDER, rec
+    try:
+        with rec.span(name, category) as span:
+            rows = [r for r in map(rows_of, args) if r is not None]
+            span["rows_in"] = sum(rows) if rows else None
+            result = func(*args, **kwargs)
+            span["rows_out"] = rows_of(result)
+    finally:
+        _RECORDER = previous
+        with open(os.path.join(directory, f"{os.getpid()}-{time.time_ns()}.json"), "w") as f:
+            json.dump({"spans": rec.spans, "stacks": rec.stacks}, f, default=str)
+    return result
+
+# child processes started by an instrumented run record their steps, plus one
+# span for the whole process, and leave them for the parent to collect
+def _activate_from_env():
+    directory = os.environ.get(ENV_DIR)
+    if not directory or _RECORDER is not None:
+        return
+    rec = start(profile=os.environ.get(ENV_PROFILE) == "1")
+    name = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "child"
+    whole = rec.span(name, "script")
+    whole.__enter__()
+    def flush():
+        with contextlib.suppress(Exception):
+            whole.__exit__(None, None, None)
+        with open(os.path.join(directory, f"{os.getpid()}.json"), "w") as f:
+            json.dump({"spans": rec.spans, "stacks": rec.stacks}, f, default=str)
+    atexit.register(flush)
+
+_activate_from_env()
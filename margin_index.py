@@ -0,0 +1,164 @@
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+import schema
+
+# index of the margins of every contest, across offices and years: one row
+# per (office, year, state) contest, or per district with the house district
+# table. The margins and costs are laid out once as arrays, and the positions
+# of every (office, year) are grouped up front, so a query only looks at the
+# contests of its filter. Rankings use partial selection (np.argpartition)
+# and only sort the k contests they return, never a whole office or year.
+
+MARGIN_FILES = {"president": "presidential/presidential_margins.csv",
+                "senate": "senate/senate_margins.csv",
+                "house": "house/house_margins.csv"}
+DISTRICT_FILE = "house/house_district_margins.csv"
+BANDS = [0, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1]
+K = 5
+
+# function that returns the positions of the k smallest values (NaN last), smallest first
+def smallest(values: np.ndarray, k: int):
+    k = min(k, len(values))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    part = np.argpartition(values, k - 1)[:k] if k < len(values) else np.arange(len(values))
+    return part[np.argsort(values[part], kind="stable")]
+
+# function that turns a filter value (None, a value or a list of values) into a set, or None for no filter
+def _values(value):
+    if value is None:
+        return None
+    return set(value) if isinstance(value, (list, tuple, set, np.ndarray)) else {value}
+
+class MarginIndex:
+    # frame: one row per contest, with office, year, state_po, margin, num_ballots
+    # and procedural_cost columns (other columns, e.g. district, are kept)
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        self.margin = frame["margin"].to_numpy(dtype=float)
+        self.cost = frame["procedural_cost"].to_numpy(dtype=float)
+        self.ballots = frame["num_ballots"].to_numpy(dtype=float)
+        self.groups = {(office, int(year)): np.asarray(pos)
+                       for (office, year), pos in frame.groupby(["office", "year"], sort=True).indices.items()}
+
+    # function that indexes the results of every office, {office: results frame}.
+    # the frames keep their own index, so the rows a query returns can be traced back.
+    @classmethod
+    def from_frames(cls, frames: dict):
+        parts = []
+        for office, frame in frames.items():
+            frame = frame.reset_index() if "year" not in frame.columns else frame
+            frame = frame.drop(columns=[c for c in frame.columns if c.startswith("Unnamed")])
+            parts.append(frame.assign(office=office)[["office"] + [c for c in frame.columns if c != "office"]])
+        return cls(pd.concat(parts))
+
+    # function that indexes the margin files of the offices (with districts,
+    # the house districts instead of the house state-years, once written)
+    @classmethod
+    def from_files(cls, margin_files: dict = MARGIN_FILES, districts: bool = False):
+        files = dict(margin_files)
+        if districts and "house" in files:
+            files["house"] = DISTRICT_FILE
+        return cls.from_frames({office: schema.read_csv(path, schema.MARGINS) for office, path in files.items()})
+
+    # the offices and years in the index
+    @property
+    def offices(self):
+        return sorted({office for office, _ in self.groups})
+
+    @property
+    def years(self):
+        return sorted({year for _, year in self.groups})
+
+    # function that returns the positions of the contests of some offices and years (every one without a filter)
+    def select(self, office=None, year=None):
+        offices, years = _values(office), _values(year)
+        parts = [pos for (o, y), pos in self.groups.items()
+                 if (offices is None or o in offices) and (years is None or y in years)]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+
+    def _rows(self, pos: np.ndarray):
+        return self.frame.iloc[pos]
+
+    # function that returns the k closest contests (smallest margins), closest first
+    def closest(self, k: int = K, office=None, year=None):
+        pos = self.select(office, year)
+        return self._rows(pos[smallest(self.margin[pos], k)])
+
+    # function that returns the k least close contests (largest margins), widest first
+    def widest(self, k: int = K, office=None, year=None):
+        pos = self.select(office, year)
+        pos = pos[~np.isnan(self.margin[pos])]
+        return self._rows(pos[smallest(-self.margin[pos], k)])
+
+    # function that counts the contests, ballots and cost of every margin band
+    # (bands are the band edges; margins outside them are left out)
+    def histogram(self, bands: list = BANDS, office=None, year=None):
+        pos = self.select(office, year)
+        margin = self.margin[pos]
+        band = np.searchsorted(bands, margin, side="right") - 1
+        # a margin on the last edge belongs to the last band
+        band[margin == bands[-1]] = len(bands) - 2
+        ok = (band >= 0) & (band < len(bands) - 1) & ~np.isnan(margin)
+        n = len(bands) - 1
+        index = pd.IntervalIndex.from_breaks(bands, closed="left", name="margin")
+        return pd.DataFrame({"contests": np.bincount(band[ok], minlength=n),
+                             "num_ballots": np.bincount(band[ok], self.ballots[pos][ok], minlength=n),
+                             "procedural_cost": np.bincount(band[ok], self.cost[pos][ok], minlength=n).round(2)},
+                            index=index)
+
+    # function that returns the fewest contests that drive a share of the
+    # procedural cost: the costliest contests, costliest first, until their
+    # cost reaches share of the total. The k costliest are selected partially,
+    # doubling k until they reach the share.
+    def cost_drivers(self, share: float = 0.5, office=None, year=None):
+        pos = self.select(office, year)
+        cost = np.nan_to_num(self.cost[pos])
+        target = share*cost.sum()
+        k = K
+        while True:
+            top = smallest(-cost, k)
+            cum = np.cumsum(cost[top])
+            if len(top) == len(pos) or (len(cum) and cum[-1] >= target):
+                n = min(int(np.searchsorted(cum, target, side="left")) + 1, len(top))
+                rows = self._rows(pos[top[:n]])
+                return rows.assign(cost_share=cum[:n]/cost.sum() if cost.sum() else np.nan)
+            k *= 2
+
+    # function that compares the average procedural cost of the k closest
+    # contests with that of the k least close, for every (office, year) at once
+    def swing_vs_nonswing(self, k: int = K, office=None, year=None):
+        offices, years = _values(office), _values(year)
+        rows = []
+        for (o, y), pos in self.groups.items():
+            if (offices is None or o in offices) and (years is None or y in years):
+                margin = self.margin[pos]
+                held = pos[~np.isnan(margin)]
+                rows.append({"office": o, "year": y,
+                             "avg_cost_closest": self.cost[pos[smallest(margin, k)]].mean(),
+                             "avg_cost_widest": self.cost[held[smallest(-self.margin[held], k)]].mean()})
+        return pd.DataFrame(rows, columns=["office", "year", "avg_cost_closest", "avg_cost_widest"])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank the closest contests of every office and year.")
+    parser.add_argument("--office", choices=list(MARGIN_FILES), action="append", default=None)
+    parser.add_argument("--year", type=int, action="append", default=None)
+    parser.add_argument("-k", type=int, default=K, help="contests per ranking")
+    parser.add_argument("--share", type=float, default=0.5, help="share of the cost for the cost drivers")
+    parser.add_argument("--districts", action="store_true", help="rank the house districts instead of states")
+    parser.add_argument("--out", default="intermediate_data")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    index = MarginIndex.from_files(districts=args.districts)
+    print(f"indexed {len(index.frame)} contests in {time.perf_counter() - start:.2f}s")
+    print(index.closest(args.k, args.office, args.year).to_string(index=False))
+    print(index.histogram(office=args.office, year=args.year).to_string())
+    drivers = index.cost_drivers(args.share, args.office, args.year)
+    print(f"{len(drivers)} contests drive {args.share:.0%} of the procedural cost")
+    comparison = index.swing_vs_nonswing(args.k, args.office, args.year)
+    os.makedirs(args.out, exist_ok=True)
+    comparison.to_csv(os.path.join(args.out, "swing_vs_nonswing.csv"), index=False)
+    print(comparison.to_string(index=False))
@@ -0,0 +1,62 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+# partitioned writers for the state-by-state outputs. The frame is grouped once
+# (row positions per key, in their original order) and every partition is
+# written from its slice in a thread pool, instead of re-filtering the whole
+# frame with a boolean mask per state. write_dataset stores the same rows as a
+# single parquet dataset partitioned by key, so one state can be read without
+# touching the others.
+
+WORKERS = 8
+
+# function that writes one CSV per value of key. path_template is formatted
+# with the key value (e.g. "state-by-state/senate_margins_{}.csv"); each
+# partition keeps the original row order and gets a fresh 0..n-1 index, as
+# frame[frame[key] == value].reset_index(drop=True).to_csv(path) would (with
+# index=False, the index is not written).
+# With only, just the partitions of those key values (and partitions whose
+# file does not exist yet) are written; the other files are left untouched.
+def write_partitions(frame: pd.DataFrame, key: str, path_template: str, workers: int = WORKERS, only=None,
+                     index: bool = True):
+    directory = os.path.dirname(path_template)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    groups = frame.groupby(key, sort=False, observed=True).indices
+    if only is not None:
+        only = set(only)
+        groups = {v: p for v, p in groups.items() if v in only or not os.path.exists(path_template.format(v))}
+    def write(item):
+        value, positions = item
+        path = path_template.format(value)
+        frame.take(positions).reset_index(drop=True).to_csv(path, index=index)
+        return path
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(write, groups.items()))
+
+# function that writes the frame as one parquet dataset partitioned by key (hive layout: key=value/)
+def write_dataset(frame: pd.DataFrame, root: str, key: str = "state_po"):
+    if pq is None:
+        raise ImportError("writing a partitioned dataset requires pyarrow")
+    table = pa.Table.from_pandas(frame.reset_index(drop=True), preserve_index=False)
+    ds.write_dataset(table, root, format="parquet", partitioning=[key], partitioning_flavor="hive",
+                     existing_data_behavior="delete_matching")
+    return root
+
+# function that reads the rows of one (or several) partitions of a dataset written by write_dataset
+def read_dataset(root: str, key: str = "state_po", values=None, columns: list = None):
+    if pq is None:
+        raise ImportError("reading a partitioned dataset requires pyarrow")
+    dataset = ds.dataset(root, format="parquet", partitioning="hive")
+    flt = None
+    if values is not None:
+        values = [values] if isinstance(values, str) else list(values)
+        flt = ds.field(key).isin(values)
+    return dataset.to_table(columns=columns, filter=flt).to_pandas()
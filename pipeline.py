@@ -0,0 +1,305 @@
+import glob
+import hashlib
+import inspect
+import json
+import os
+import pickle
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable
+import instrumentation
+
+# a small, declarative stage graph for the RLA cost pipeline.
+# every stage is keyed on the hashes of its input files, its parameters,
+# its code and the keys of the stages whose values it consumes (`deps`, passed
+# to the stage function positionally). the code of a stage is its own source,
+# the source of every function of its module it calls (transitively) and the
+# files of every module of the repository it uses, with their own imports. an
+# output can be a glob pattern (e.g. the files of a partitioned write), which
+# stands for every file it matches. a stage that reads a
+# file written by another stage is ordered after it automatically. when the key
+# recorded in the manifest still matches (and the outputs are untouched),
+# the stage is skipped and its cached value is only loaded if a downstream
+# stage actually has to run. when instrumentation is recording, every stage
+# that runs is recorded as a span of its category.
+# stages marked concurrent run in a pool of worker processes as soon as their
+# dependencies are done, while the other stages keep running in this process;
+# their values are passed back (pickled) like any other stage value.
+
+CACHE_DIR = ".pipeline_cache"
+MANIFEST = "manifest.json"
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable
+    deps: list = field(default_factory=list)
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+    category: str = "stage"
+    concurrent: bool = False
+
+# function that hashes a file, reusing the previous digest when neither the
+# size nor the modification time of the file changed
+def hash_file(path: str, seen: dict):
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    if path in seen and seen[path]["stamp"] == stamp:
+        return seen[path]["sha256"]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    seen[path] = {"stamp": stamp, "sha256": h.hexdigest()}
+    return seen[path]["sha256"]
+
+# function that returns the source of a stage function (falls back to its name)
+def _source_of(func: Callable):
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return getattr(func, "__qualname__", repr(func))
+
+# function that returns a module of the repository (itself, or the module an
+# object was defined in) and its source file, or (None, None) for anything else
+def _local_module(obj):
+    module = obj if inspect.ismodule(obj) else inspect.getmodule(obj)
+    path = getattr(module, "__file__", None)
+    if (path is None or not path.endswith(".py") or "site-packages" in path
+            or not os.path.abspath(path).startswith(ROOT + os.sep)):
+        return None, None
+    return module, os.path.abspath(path)
+
+# function that collects the source files of a module of the repository and
+# of every module of the repository it imports, transitively
+def _module_files(module, files: set):
+    module, path = _local_module(module)
+    if path is None or path in files:
+        return
+    files.add(path)
+    for value in list(vars(module).values()):
+        if inspect.ismodule(value) or inspect.isfunction(value) or inspect.isclass(value):
+            _module_files(value, files)
+
+# function that returns every global name a code object (or the code nested in it) refers to
+def _code_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+# function that returns the code a stage function depends on: the sources of
+# the function and of the functions of its own module it calls (transitively),
+# and the source files of the other modules of the repository it uses
+def code_dependencies(func: Callable):
+    sources, files, seen = [], set(), set()
+    def visit(f):
+        f = inspect.unwrap(f)
+        if id(f) in seen:
+            return
+        seen.add(id(f))
+        sources.append(_source_of(f))
+        code, namespace = getattr(f, "__code__", None), getattr(f, "__globals__", {})
+        if code is None:
+            return
+        for name in sorted(_code_names(code)):
+            value = namespace.get(name)
+            module, path = _local_module(value) if value is not None else (None, None)
+            if module is None:
+                continue
+            if inspect.isfunction(value) and value.__module__ == f.__module__:
+                visit(value)
+            else:
+                _module_files(module, files)
+    visit(func)
+    return sources, sorted(files)
+
+# function that returns the files an output stands for (a glob pattern matches any number of files)
+def _expand(path: str):
+    return sorted(glob.glob(path)) if glob.has_magic(path) else [path]
+
+class Pipeline:
+    def __init__(self, stages: list, cache_dir: str = CACHE_DIR):
+        self.stages = {s.name: s for s in stages}
+        # value dependencies plus the producers of every input file
+        writers = {p: s.name for s in stages for p in s.outputs}
+        self.after = {s.name: s.deps + [writers[p] for p in s.inputs if p in writers and writers[p] != s.name]
+                      for s in stages}
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, MANIFEST)
+        self.manifest = {"stages": {}, "files": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        self.keys = {}
+        self.values = {}
+        self.ran = []
+        self.skipped = []
+
+    # function that orders the stages so that dependencies always come first
+    def order(self, targets: list = None):
+        ordered, visiting = [], set()
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"cycle in pipeline at stage '{name}'")
+            visiting.add(name)
+            for dep in self.after[name]:
+                visit(dep)
+            visiting.discard(name)
+            ordered.append(name)
+        for name in (targets or list(self.stages)):
+            visit(name)
+        return ordered
+
+    # function that computes the cache key of a stage
+    def stage_key(self, stage: Stage):
+        files = self.manifest["files"]
+        h = hashlib.sha256()
+        h.update(stage.name.encode())
+        sources, modules = code_dependencies(stage.func)
+        for source in sources:
+            h.update(source.encode())
+        for path in modules:
+            h.update(os.path.relpath(path, ROOT).encode())
+            h.update(hash_file(path, files).encode())
+        h.update(json.dumps(stage.params, sort_keys=True, default=str).encode())
+        for path in stage.inputs:
+            h.update(path.encode())
+            h.update(hash_file(path, files).encode() if os.path.exists(path) else b"missing")
+        for dep in stage.deps:
+            h.update(self.keys[dep].encode())
+        return h.hexdigest()
+
+    def _value_path(self, name: str):
+        return os.path.join(self.cache_dir, f"{name}.pkl")
+
+    # function that hashes every output of a stage (None for an output without any file)
+    def _output_digests(self, stage: Stage):
+        out = {}
+        for pattern in stage.outputs:
+            paths = [p for p in _expand(pattern) if os.path.exists(p)]
+            if not paths:
+                out[pattern] = None
+            elif glob.has_magic(pattern):
+                h = hashlib.sha256()
+                for path in paths:
+                    h.update(path.encode())
+                    h.update(hash_file(path, self.manifest["files"]).encode())
+                out[pattern] = h.hexdigest()
+            else:
+                out[pattern] = hash_file(paths[0], self.manifest["files"])
+        return out
+
+    # function that checks whether the cached result of a stage is still valid
+    def is_fresh(self, stage: Stage, key: str):
+        entry = self.manifest["stages"].get(stage.name)
+        if entry is None or entry["key"] != key:
+            return False
+        current = self._output_digests(stage)
+        for path in stage.outputs:
+            digest = entry["outputs"].get(path)
+            if digest is None or current[path] != digest:
+                return False
+        return not entry["has_value"] or os.path.exists(self._value_path(stage.name))
+
+    # function that returns the value of a stage, loading it from the cache if it was skipped
+    def value(self, name: str):
+        if name not in self.values:
+            entry = self.manifest["stages"][name]
+            if entry["has_value"]:
+                with open(self._value_path(name), "rb") as f:
+                    self.values[name] = pickle.load(f)
+            else:
+                self.values[name] = None
+        return self.values[name]
+
+    def _execute(self, stage: Stage, key: str):
+        args = [self.value(dep) for dep in stage.deps]
+        recorder = instrumentation.get_recorder()
+        if recorder is None:
+            result = stage.func(*args, **stage.params)
+        else:
+            with recorder.span(stage.name, stage.category) as rec:
+                rows = [r for r in map(instrumentation.rows_of, args) if r is not None]
+                rec["rows_in"] = sum(rows) if rows else None
+                result = stage.func(*args, **stage.params)
+                rec["rows_out"] = instrumentation.rows_of(result)
+        self._finish(stage, key, result)
+
+    # function that starts a stage in the worker pool, recorded there when this process records
+    def _submit(self, pool: ProcessPoolExecutor, stage: Stage):
+        args = tuple(self.value(dep) for dep in stage.deps)
+        recorder = instrumentation.get_recorder()
+        if recorder is None:
+            return pool.submit(stage.func, *args, **stage.params)
+        return pool.submit(instrumentation.run_recorded, stage.name, stage.category,
+                           recorder._profiles(stage.name), stage.func, args, stage.params)
+
+    # function that keeps the value of a stage that ran and records its key and outputs
+    def _finish(self, stage: Stage, key: str, result):
+        self.values[stage.name] = result
+        if result is not None:
+            with open(self._value_path(stage.name), "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        outputs = {p: d for p, d in self._output_digests(stage).items() if d is not None}
+        self.manifest["stages"][stage.name] = {"key": key, "outputs": outputs,
+                                               "has_value": result is not None}
+
+    # function that runs the pipeline, skipping any stage whose cache is still
+    # valid. Concurrent stages run in a pool of worker processes (none with
+    # workers=0, where every stage runs in order in this process).
+    def run(self, targets: list = None, force: bool = False, workers: int = None):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        pending, done, running = self.order(targets), set(), {}
+        pool = None
+        def finish(name):
+            done.add(name)
+            self.ran.append(name)
+            self.save()
+        try:
+            while pending or running:
+                ready = [n for n in pending if all(d in done for d in self.after[n])]
+                # the concurrent stages are started first, so that they run while this process works
+                ready.sort(key=lambda n: not (self.stages[n].concurrent and workers != 0))
+                for name in ready:
+                    stage = self.stages[name]
+                    pending.remove(name)
+                    key = self.stage_key(stage)
+                    self.keys[name] = key
+                    if not force and self.is_fresh(stage, key):
+                        self.skipped.append(name)
+                        done.add(name)
+                    elif stage.concurrent and workers != 0:
+                        pool = pool or ProcessPoolExecutor(max_workers=workers)
+                        running[self._submit(pool, stage)] = (stage, key)
+                    else:
+                        self._execute(stage, key)
+                        finish(name)
+                        break
+                # wait for a worker when nothing else can run in the meantime
+                finished, _ = wait(running, timeout=None if running and not ready else 0,
+                                   return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, key = running.pop(future)
+                    self._finish(stage, key, future.result())
+                    finish(stage.name)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        self.save()
+        return self
+
+    def save(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    # function that returns the value of a stage after the pipeline ran
+    def result(self, name: str) -> Any:
+        return self.value(name)
@@ -0,0 +1,112 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+# headless plotting. matplotlib is only imported (on the Agg backend) by the
+# process that draws a figure, every figure is drawn on its own Figure object
+# from an in-memory frame, and render() builds a list of figures in worker
+# processes, so the summary plots and the per-state plots are drawn in
+# parallel and a run that does not plot never imports matplotlib.
+
+WORKERS = os.cpu_count() or 1
+
+# function that imports pyplot on the Agg backend
+def pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def _save(fig, path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fig.savefig(path)
+    pyplot().close(fig)
+    return path
+
+# function that draws a yearly cost line, with the cost of every step-th year annotated in millions
+def _yearly_cost(data: pd.DataFrame, column: str, color: str, title: str, step: int, path: str):
+    plt = pyplot()
+    fig, ax = plt.subplots()
+    ax.plot(data["year"], data[column], color=color)
+    ax.set_xticks(data["year"])
+    ax.set_xlabel("Year")
+    ax.set_ylabel("Cost (Millions of $)")
+    for y, c in zip(data["year"], data[column]):
+        if 2000 <= y <= 2024 and (y - 2000) % step == 0:
+            ax.annotate(text=f"${round(c/1e6, 2)}M", xy=(y, c))
+    ax.set_title(title)
+    return _save(fig, path)
+
+# line plot of the combined total cost of an RLA for presidential years
+def total_cost_figure(data: pd.DataFrame, path: str = "plots/total_presidential_plot_1.png"):
+    return _yearly_cost(data, "cost_total", "orange", "Combined Total Cost for Presidential Election Years", 4, path)
+
+# line plot of the combined total cost of an RLA (excluding the president) for every election year
+def total_cost_non_presidential_figure(data: pd.DataFrame, path: str = "plots/total_allyr_plot_2.png"):
+    return _yearly_cost(data, "cost_total_excl_pres", "lightblue", "Combined Total Cost for Election Years", 2, path)
+
+# bar plot of the average procedural cost of the top 5 vs. bottom 5 closest 2024 presidential contests
+def swing_vs_nonswing_figure(avgtop5: float, avgbottom5: float, path: str = "plots/top5_bottom5_plot_5.png"):
+    plt = pyplot()
+    fig, ax = plt.subplots()
+    fig.set_figheight(9)
+    fig.set_figwidth(8)
+    bars = ax.bar(["Top 5", "Bottom 5"], [avgtop5, avgbottom5], color='seagreen')
+    ax.set_ylabel("Average Procedural Cost ($)")
+    ax.set_title("Avg. Cost of Top 5 vs. Bottom 5 Closest Contests in 2024 President Election")
+    for bar in bars:
+        ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height(),
+                f'${bar.get_height():.2f}', ha='center', va='bottom', fontsize=12)
+    return _save(fig, path)
+
+# grouped bar plot of the average procedural cost of the k closest vs. the k
+# least close contests of every election year, one panel per office
+def swing_vs_nonswing_by_year_figure(table: pd.DataFrame, k: int = 5,
+                                     path: str = "plots/swing_vs_nonswing_by_year_plot_6.png"):
+    plt = pyplot()
+    offices = list(dict.fromkeys(table["office"]))
+    fig, axes = plt.subplots(len(offices), 1, squeeze=False)
+    fig.set_figheight(4*len(offices))
+    fig.set_figwidth(10)
+    for ax, office in zip(axes[:, 0], offices):
+        data = table[table["office"] == office]
+        x = range(len(data))
+        ax.bar([i - 0.2 for i in x], data["avg_cost_closest"], width=0.4, color="seagreen", label=f"Top {k}")
+        ax.bar([i + 0.2 for i in x], data["avg_cost_widest"], width=0.4, color="lightblue", label=f"Bottom {k}")
+        ax.set_xticks(list(x))
+        ax.set_xticklabels(data["year"])
+        ax.set_ylabel("Average Procedural Cost ($)")
+        ax.set_title(f"Avg. Cost of Top {k} vs. Bottom {k} Closest Contests ({office})")
+        ax.legend()
+    fig.tight_layout()
+    return _save(fig, path)
+
+# line plot of one state's yearly RLA cost, with and without the presidential contest
+def state_cost_figure(data: pd.DataFrame, state_po: str, path: str):
+    plt = pyplot()
+    fig, ax = plt.subplots()
+    ax.plot(data["year"], data["cost_total"], color="orange", marker="o", label="all contests")
+    ax.plot(data["year"], data["cost_total_excl_pres"], color="lightblue", marker="o", label="excluding president")
+    ax.set_xticks(data["year"])
+    ax.set_xlabel("Year")
+    ax.set_ylabel("Cost ($)")
+    ax.set_title(f"RLA Cost by Election Year ({state_po})")
+    ax.legend()
+    return _save(fig, path)
+
+# function that returns one state_cost_figure job per state of the state-year table
+def state_jobs(all_data: pd.DataFrame, directory: str = "plots/state-by-state"):
+    cols = ["year", "cost_total", "cost_total_excl_pres"]
+    return [(state_cost_figure, {"data": frame[cols].sort_values("year").reset_index(drop=True),
+                                 "state_po": po, "path": os.path.join(directory, f"cost_{po}.png")})
+            for po, frame in all_data.groupby("state_po", sort=True, observed=True)]
+
+# function that draws (func, kwargs) figure jobs in worker processes; returns the paths written
+def render(jobs: list, workers: int = WORKERS):
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as pool:
+        futures = [pool.submit(func, **kwargs) for func, kwargs in jobs]
+        return [f.result() for f in futures]
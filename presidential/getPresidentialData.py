@@ -1,5 +1,24 @@
 import pandas as pd
+import numpy as np
 import os
+import sys
+
+# the shared cost model lives at the top level of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asn_tables
+import cost_model
+import dataverse_cache
+import streaming_ingest
+import partitioned_writer
+import instrumentation
+import results_store
+import results_parser
+import dataframe_backend
+import schema
+import state_registry
+from state_registry import get_registry
+import argparse
+import functools
 # pull presidential election data
 # data source citations (BibTeX, website)
 pd.set_option('display.max_colwidth', None)
@@ -21,104 +40,137 @@ https://doi.org/10.7910/DVN/42MVDX, Harvard Dataverse, V8, UNF:6:F0opd1IRbeYI9Qy
 # for 2024: https://apps.npr.org/2024-election-results/ (data), https://www.scouting.org/resources/los/states/ (state abbr.)
 # in 2020, it seems that Michigan's risk limit was 0.07139%.
 
+# the presidential pipeline reads its sources from and writes its results to one
+# directory (by default, the one of this script)
+HERE = os.path.dirname(os.path.abspath(__file__))
+MEDSL_CSV = "dataverse_files/1976-2020-president.csv"
+TEXT_2024 = "dataverse_files/2024_US_President.txt"
+# every candidate's votes in every state in 2024, which add up to the ballots cast there
+VOTES_2024 = "dataverse_files/2024_votes.tsv"
+# the code that turns the sources into results: this script and the modules its loaders use
+LOADER_CODE = [os.path.abspath(__file__)] + [m.__file__ for m in (asn_tables, cost_model, dataframe_backend,
+                                                                   dataverse_cache, streaming_ingest, results_parser,
+                                                                   state_registry)] \
+              + [state_registry.ABBR_PATH]
+
 # function that calculates the margins and number of ballots (2000-2020)
-def calculate_margins_and_num_ballots_from_2000_to_2020():
+# (with a chunksize, the source is streamed in bounded chunks instead of read whole;
+# otherwise the scan and the per-party counts run on the given dataframe backend)
+@instrumentation.step("load")
+def calculate_margins_and_num_ballots_from_2000_to_2020(chunksize: int = None,
+                                                        path: str = os.path.join(HERE, MEDSL_CSV),
+                                                        backend: str = None):
+    if chunksize:
+        return streaming_ingest.presidential_margins(path, years=(2000, 2020), chunksize=chunksize)
     # years we are looking at (2000-2024). We also don't care about independent parties and write-in
-    pres_elec_df = pd.read_csv("dataverse_files/1976-2020-president.csv")
-
-    pres_elec_df = pres_elec_df[pres_elec_df["year"] >= 2000]
-    pres_elec_df['writein'] = pres_elec_df['writein'].astype(dtype=bool)
-    pres_elec_df = pres_elec_df[pres_elec_df["party_simplified"].isin(['DEMOCRAT', 'REPUBLICAN']) & ~pres_elec_df['writein']]
+    # only the years, columns and rows we need are read from the columnar cache
+    be = dataframe_backend.get_backend(backend)
+    pres_elec_df = be.scan(path, columns=['year', 'state', 'state_po', 'candidatevotes', 'totalvotes',
+                                          'party_simplified'],
+                           years=(2000, 2020),
+                           where=[("party_simplified", "in", ['DEMOCRAT', 'REPUBLICAN']), ("writein", "==", False)])
+    # one row per election year, state and party (sorted by year and state)
+    pres_elec_df = be.to_pandas(be.group_agg(pres_elec_df, ['year', 'state', 'state_po', 'party_simplified'],
+                                             {'candidatevotes': "max", 'totalvotes': "max"}))
 
     # for each election year from 2000-2024, and state combination, find the margin
     republican = pres_elec_df[pres_elec_df['party_simplified'].str.startswith("R")]
     democrat = pres_elec_df[pres_elec_df['party_simplified'].str.startswith("D")]
     margin = (republican['candidatevotes'].reset_index(drop=True)-democrat['candidatevotes'].reset_index(drop=True)).abs()/republican['totalvotes'].reset_index(drop=True)
-    five_pct_rla_ballots = ((7/margin)+1).astype(int).reset_index(drop=True)
+    five_pct_rla_ballots = cost_model.margin_sample_sizes(margin, "president").reset_index(drop=True)
     FINAL = pd.concat([republican['year'].reset_index(drop=True), republican['state'].reset_index(drop=True), republican['state_po'].reset_index(drop=True),
-                    margin, five_pct_rla_ballots], ignore_index=True, axis=1).reset_index(drop=True)
-    FINAL.rename(mapper={0: "year", 1: "state", 2: "state_po", 3: "margin", 4:"num_ballots"}, inplace=True, axis=1)
+                    margin, five_pct_rla_ballots, republican['totalvotes'].reset_index(drop=True)],
+                      ignore_index=True, axis=1).reset_index(drop=True)
+    FINAL.rename(mapper={0: "year", 1: "state", 2: "state_po", 3: "margin", 4:"num_ballots", 5: "totalvotes"},
+                 inplace=True, axis=1)
     return FINAL
 
 # function to extract the data from the text file containing 2024 election data
-def extract_textfile_data(state_shorts: pd.DataFrame):
-    preselec24 = {"year": [], "state": [], "state_po": [], "margin": [], "num_ballots": []}
-    lines = []
-    with open("dataverse_files/2024_US_President.txt") as datafile:
-        for line in datafile:
-            lines.append(line.strip().replace("\n",""))
-    # Remove any lines that say "Flip", as well as the title lines
-    lines = lines[5:]
-    flipCount = lines.count("Flip")
-    for _ in range(flipCount):
-        lines.remove("Flip")
-    # we know how many states there are, so assign that many 2024s
-    preselec24['year'] = [2024]*51
-    # now begins main process
-    # 1st line is state (short form)
-    # 2nd line is electoral vote [ignore]
-    # 3rd line is Harris %
-    # 4th line is Trump %
-    # 5th line is percent in [ignore]
-    for i in range(0, len(lines), 5):
-        # get the batch of 5
-        sstate, _, dpct, rpct, _ = lines[i:i+5]
-        # process 1st line
-        sstate_row = state_shorts[state_shorts.Standard == sstate].reset_index()
-        # for Maine and Nebrasks, only consider them as whole states, and skip individual districts
-        if len(sstate_row) == 0:
-            continue
-        long, abbr = sstate_row.iloc[0].State, sstate_row.iloc[0].Postal
-        preselec24['state'].append(long)
-        preselec24['state_po'].append(abbr)
-        # process 3rd and 4th lines
-        thisMargin = eval(f"{dpct.replace("%", "")} - {rpct.replace("%", "")}")
-        thisMargin /= 100
-        preselec24['margin'].append(abs(thisMargin))
-    # we can calculate number of ballots from the margin
-    preselec24['num_ballots'] = list(map(lambda marg: int(7/marg)+1, preselec24['margin']))
-    preselec24_df = pd.DataFrame(preselec24)
-    # for consistency, all state names are uppercase
-    preselec24_df['state'] = preselec24_df['state'].str.upper()
+# (or the data of another cycle published in the same format); with totals, the
+# ballots cast in every state are looked up in that table of every candidate's votes
+@instrumentation.step("load")
+def extract_textfile_data(path: str = os.path.join(HERE, TEXT_2024), year: int = 2024, totals: str = None):
+    registry = get_registry()
+    # every record is a state (short form), its electoral votes, Harris %, Trump % and percent in
+    records = results_parser.read_text_results(path)
+    # the short forms are mapped to state ids in one lookup
+    sids = registry.ids(records["label"], "standard", missing="ignore")
+    # for Maine and Nebrasks, only consider them as whole states, and skip individual districts
+    keep = sids >= 0
+    margin = np.abs((records["first"][keep] - records["second"][keep])/100)
+    states = registry.take(sids[keep], "name")
+    totalvotes = (results_parser.read_totals(totals).rename(str.upper).reindex(states).to_numpy(np.float64)
+                  if totals else np.full(len(states), np.nan))
+    preselec24_df = pd.DataFrame({"year": np.full(keep.sum(), year), "state": states,
+                                  "state_po": registry.take(sids[keep], "postal"), "margin": margin,
+                                  # we can calculate number of ballots from the margin
+                                  "num_ballots": cost_model.margin_sample_sizes(margin, "president"), "totalvotes": totalvotes})
     return preselec24_df
 
-# 2024 data
-def add_margins_and_num_ballots_from_2024(_2000_to_2020: pd.DataFrame):
-    # state abbreviations and short forms
-    stateShortForms = pd.read_csv("dataverse_files/state_abbr.tsv", sep="\t")
-    for col in list(stateShortForms.columns):
-        stateShortForms[col] = stateShortForms[col].str.strip()
-    # get the resultant dataFrame for 2024 data
-    _24_data = extract_textfile_data(state_shorts=stateShortForms)
-    _00_to_24_ALL = pd.concat([_2000_to_2020.reset_index(drop=True), _24_data.reset_index(drop=True)], axis=0)
-    _00_to_24_ALL.reset_index(inplace=True, drop=True)
-    return _00_to_24_ALL
+# function that adds every source under directory not ingested yet to the
+# results store; only new or changed rows are appended. extra holds (year, path)
+# of further cycles in the 2024 text format. A source is parsed again when the
+# loader code, the cost model or the options changed. With an audit (see
+# cost_model.AUDITS), its average sample numbers replace 7/margin, and the 2024
+# ballots cast are read from VOTES_2024. returns the keys appended.
+@instrumentation.step("load")
+def ingest_sources(store: results_store.ResultsStore, directory: str = HERE, chunksize: int = None,
+                   extra: list = (), backend: str = None, audit: str = None):
+    medsl, text, votes = (os.path.join(directory, p) for p in (MEDSL_CSV, TEXT_2024, VOTES_2024))
+    totals = [votes] if audit else []
+    sources = [(medsl, functools.partial(calculate_margins_and_num_ballots_from_2000_to_2020, chunksize, medsl,
+                                         backend), None, []),
+               (text, functools.partial(extract_textfile_data, text, 2024, *totals), None, totals)]
+    sources += [(path, functools.partial(extract_textfile_data, path, year), year, []) for year, path in extra]
+    params = {"chunksize": chunksize, "backend": backend, "audit": audit, "cost_model": cost_model.constants()}
+    return pd.concat([store.ingest_file("president", path, lambda: calculate_procedural_costs(load(), audit),
+                                        results_store.fingerprint(LOADER_CODE + files, dict(params, year=year)))
+                      for path, load, year, files in sources], ignore_index=True)
 
-# function that applies the procedural cost model
-# Procedural Total: (# of ballots needed for RLA *  "minutely" wage of county clerk * time per ballot)
-def procedural_cost(nbals: int):
-    minutesWage = 0.35
-    minutes_balTime = 2
-    return nbals*minutesWage*minutes_balTime
+# function that reads the latest presidential results of every year from the results store
+@instrumentation.step("merge")
+def read_results(store: results_store.ResultsStore):
+    return schema.apply(store.read("president")[["year", "state", "state_po", "margin", "num_ballots",
+                                                 "procedural_cost"]], schema.MARGINS)
 
 # calculate procedural costs for each state
-def calculate_procedural_costs(data: pd.DataFrame):
+# (with an audit, of its average sample numbers instead of 7/margin, with
+# escalations costed as a full hand count of the state's ballots cast)
+@instrumentation.step("transform")
+def calculate_procedural_costs(data: pd.DataFrame, audit: str = None):
+    data["num_ballots"] = cost_model.audit_sample_sizes(data["margin"], data["num_ballots"], audit,
+                                                        ballots_cast=data["totalvotes"])
     # add the procdural cost according to our model: 1.5min/ballot, 0.35USD/ballot
-    data["procedural_cost"] = data["num_ballots"].apply(lambda nb: procedural_cost(nbals=nb)).round(2)
+    data["procedural_cost"] = cost_model.procedural_cost(data["num_ballots"]).round(2)
     return data
 
 # write final results all together, as well as state-by-state
-def write_results(FINAL: pd.DataFrame):
-    FINAL.to_csv("presidential_margins.csv")
-    if not os.path.exists("state-by-state"):
-        os.makedirs("state-by-state")
-    for state_abbr in set(FINAL['state_po']):
-        state_data = FINAL[FINAL['state_po'] == state_abbr].reset_index(drop=True)
-        state_data.to_csv(f"state-by-state/presidential_margins_{state_abbr}.csv")
-        
+# (with states, only the files of those states, and of states without a file, are rewritten)
+@instrumentation.step("write")
+def write_results(FINAL: pd.DataFrame, directory: str = HERE, states: list = None):
+    schema.write_csv(FINAL, os.path.join(directory, "presidential_margins.csv"), schema.MARGINS)
+    partitioned_writer.write_partitions(FINAL, "state_po", os.path.join(directory,
+                                        "state-by-state/presidential_margins_{}.csv"), only=states, index=False)
+
+# function that runs the whole presidential pipeline on the sources under
+# directory, writes its results there and returns them
+def run(directory: str = HERE, chunksize: int = None, extra: list = (), store: results_store.ResultsStore = None,
+        backend: str = None, audit: str = None):
+    store = store or results_store.ResultsStore()
+    # 2000-2020 and 2024 data (and any added cycle), each parsed only once
+    appended = ingest_sources(store, directory, chunksize, extra, backend, audit)
+    fres = read_results(store)
+    write_results(fres, directory, states=appended["state_po"].unique().tolist())
+    return fres
 
 if __name__ == '__main__':
-    fres = calculate_margins_and_num_ballots_from_2000_to_2020()
-    fres = add_margins_and_num_ballots_from_2024(fres)
-    fres = calculate_procedural_costs(fres)
-    write_results(fres)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunksize", type=int, default=None, help="stream the source CSV in chunks of this many rows")
+    parser.add_argument("--add", nargs=2, action="append", default=[], metavar=("YEAR", "PATH"),
+                        help="also ingest the results of another cycle, in the 2024 text format")
+    parser.add_argument("--backend", choices=dataframe_backend.BACKENDS, default=None,
+                        help="dataframe engine of the heavy steps (default: pandas)")
+    parser.add_argument("--audit", choices=cost_model.AUDITS, default=None,
+                        help="use the average sample numbers of this audit instead of 7/margin")
+    args = parser.parse_args()
+    run(chunksize=args.chunksize, extra=[(int(y), p) for y, p in args.add], backend=args.backend, audit=args.audit)
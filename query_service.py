@@ -0,0 +1,265 @@
+import argparse
+import functools
+import json
+import os
+import socketserver
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import cost_model
+from state_registry import get_registry
+from state_year_cube import StateYearCube
+
+# long-running local query service for RLA cost what-ifs. The margins, vote
+# totals and county counts are loaded into a StateYearCube once; every set of
+# model parameters is evaluated over the whole cube in one vectorized pass
+# (office x year x state cost components) and reduced, per office selection,
+# to every cell, yearly, per-state and national answer. Both are kept in LRU
+# caches, so a query over recent parameters is an index lookup; a batch
+# evaluates each of its distinct parameter sets once.
+#
+#   GET  /cost?state=PA&year=2024&office=senate&risk_limit=0.01&clerk_wage_hr=25
+#   POST /cost   {"state": "PA", "year": 2024, "office": "senate", "risk_limit": 0.01}
+#   POST /batch  {"queries": [{...}, {...}, ...]}
+#   GET  /health, GET /params
+#
+# A query without a state sums over every state; a query without a year
+# averages over the election years (only presidential years when the
+# president's contest is included), as calculate_national_rla_cost and
+# calculate_state_by_state_rla_cost do. office is "all" (default),
+# "excl_pres", one office or a comma-separated list of offices.
+
+PARAMS = ("clerk_wage_hr", "hrs_to_idx", "minutes_wage", "minutes_bal_time", "central", "risk_limit")
+DEFAULTS = {"clerk_wage_hr": cost_model.CLERK_WAGE_HR, "hrs_to_idx": cost_model.HRS_TO_IDX,
+            "minutes_wage": cost_model.MINUTES_WAGE, "minutes_bal_time": cost_model.MINUTES_BAL_TIME,
+            "central": cost_model.CENTRAL_COST, "risk_limit": cost_model.RISK_LIMIT}
+QUERY_KEYS = {"state", "year", "office"}
+ANSWERS = ("procedural_cost", "prep_cost", "central_cost", "cost_total", "num_ballots")
+CACHE_SIZE = 256
+HOST, PORT = "127.0.0.1", 8765
+
+class QueryError(ValueError):
+    pass
+
+class CostService:
+    def __init__(self, cube: StateYearCube = None, cache_size: int = CACHE_SIZE):
+        self.cube = cube if cube is not None else StateYearCube.from_files()
+        self.present = self.cube.present
+        self.is_pres = self.cube.years % 4 == 0
+        self._year_index = {int(y): i for i, y in enumerate(self.cube.years)}
+        self._evaluate = functools.lru_cache(maxsize=cache_size)(self._components)
+        self._tables = functools.lru_cache(maxsize=cache_size)(self._reduce)
+
+    # function that evaluates one parameter set over the whole cube
+    def _components(self, params: tuple):
+        p = dict(zip(PARAMS, params))
+        cube = self.cube
+        ballots = np.where(cube.contested, cost_model.rescale_num_ballots(cube.num_ballots, p["risk_limit"]), 0)
+        costs = cost_model.all_costs(ballots, cube.num_counties[None, :], cube.totalvotes, present=self.present,
+                                     minutes_wage=p["minutes_wage"], minutes_bal_time=p["minutes_bal_time"],
+                                     clerk_wage_hr=p["clerk_wage_hr"], hrs_to_idx=p["hrs_to_idx"],
+                                     central=p["central"])
+        return {"num_ballots": ballots, "procedural_cost": costs["procedural_cost"],
+                "prep_cost": costs["prep_cost_total"], "central_cost": costs["central_cost_total"]}
+
+    # function that turns the model parameters of a query into a hashable, complete parameter set.
+    # the risk limit must be in (0, 1), the wages, times and central cost finite and not negative.
+    @staticmethod
+    def params_of(query: dict):
+        unknown = set(query) - set(PARAMS) - QUERY_KEYS
+        if unknown:
+            raise QueryError(f"unknown query field(s): {sorted(unknown)}")
+        try:
+            params = tuple(float(query.get(p, DEFAULTS[p])) for p in PARAMS)
+        except (TypeError, ValueError) as e:
+            raise QueryError(f"model parameters must be numbers: {e}")
+        for name, value in zip(PARAMS, params):
+            if name == "risk_limit":
+                if not 0 < value < 1:
+                    raise QueryError(f"risk_limit must be between 0 and 1 (exclusive), got {value}")
+            elif not (np.isfinite(value) and value >= 0):
+                raise QueryError(f"{name} must be a finite, non-negative number, got {value}")
+        return params
+
+    # function that resolves a state in any form (name, short form, postal code or FIPS code) to its id
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def state_id(state):
+        registry = get_registry()
+        text = str(state).strip()
+        forms = ["fips"] if text.isdigit() else (["postal"] if len(text) == 2 else ["name", "standard"])
+        for form in forms:
+            sid = registry.ids([text], form, missing="ignore")[0]
+            if sid >= 0:
+                return int(sid)
+        raise QueryError(f"unknown state '{state}'")
+
+    @staticmethod
+    def offices_of(office):
+        if office in (None, "", "all"):
+            return tuple(range(len(cost_model.OFFICES)))
+        if office == "excl_pres":
+            return tuple(i for i, o in enumerate(cost_model.OFFICES) if o != "president")
+        names = office if isinstance(office, (list, tuple)) else str(office).split(",")
+        if not all(isinstance(n, str) for n in names):
+            raise QueryError(f"offices must be names, got {office!r}")
+        try:
+            return tuple(sorted({cost_model.OFFICES.index(n.strip().lower()) for n in names}))
+        except ValueError:
+            raise QueryError(f"unknown office '{office}', expected one of {cost_model.OFFICES}, all or excl_pres")
+
+    # function that reduces the components of one parameter set and office selection
+    # to every answer a query can ask for: per state-year cell, per year (summed
+    # over states), per state (averaged over years) and national (both)
+    def _reduce(self, params: tuple, offices: tuple):
+        comp = self._evaluate(params)
+        parts = {"procedural_cost": comp["procedural_cost"][list(offices)].sum(axis=0),
+                 "prep_cost": comp["prep_cost"], "central_cost": comp["central_cost"],
+                 "num_ballots": comp["num_ballots"][list(offices)].sum(axis=0)}
+        parts["cost_total"] = parts["central_cost"] + parts["prep_cost"] + parts["procedural_cost"]
+        # without a year, only presidential years count when the president's contest is included
+        years = self.is_pres if cost_model.OFFICES.index("president") in offices else np.ones_like(self.is_pres)
+        cells = self.present
+        held_years = cells.any(axis=1)
+        state_years = (cells & years[:, None]).sum(axis=0)
+        nat_years = held_years & years
+        out = {"cell_n": cells.astype(int), "year_n": held_years.astype(int),
+               "state_n": state_years, "national_n": int(nat_years.sum())}
+        for k, v in parts.items():
+            v = np.where(cells, v, 0.0)
+            by_year = v.sum(axis=1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                by_state = np.where(state_years > 0, (v*years[:, None]).sum(axis=0)/state_years, 0.0)
+            out[k] = {"cell": v, "year": by_year, "state": by_state,
+                      "national": float(by_year[nat_years].mean()) if nat_years.any() else 0.0}
+        return out
+
+    # function that answers one query
+    def query(self, query: dict):
+        if not isinstance(query, dict):
+            raise QueryError(f"a query must be a JSON object, got {type(query).__name__}")
+        tables = self._tables(self.params_of(query), self.offices_of(query.get("office")))
+        year, state = query.get("year"), query.get("state")
+        if year is not None:
+            yi = self._year_index.get(int(year))
+            if yi is None:
+                raise QueryError(f"no elections in {year}")
+        if state is not None:
+            si = self.state_id(state)
+        if year is not None and state is not None:
+            n, pick = tables["cell_n"][yi, si], lambda t: t["cell"][yi, si]
+        elif year is not None:
+            n, pick = tables["year_n"][yi], lambda t: t["year"][yi]
+        elif state is not None:
+            n, pick = tables["state_n"][si], lambda t: t["state"][si]
+        else:
+            n, pick = tables["national_n"], lambda t: t["national"]
+        out = {k: float(pick(tables[k])) for k in ANSWERS}
+        out["years"] = int(n)
+        return out
+
+    # function that answers a batch of queries; failed queries get an error entry
+    def batch(self, queries: list):
+        answers = []
+        for q in queries:
+            try:
+                answers.append(self.query(q))
+            except (QueryError, KeyError, ValueError, TypeError, AttributeError) as e:
+                answers.append({"error": str(e)})
+        return answers
+
+    def cache_info(self):
+        return {"parameter_sets": self._evaluate.cache_info()._asdict(),
+                "reductions": self._tables.cache_info()._asdict()}
+
+def make_handler(service: CostService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _answer(self, func, arg):
+            start = time.perf_counter()
+            try:
+                body = func(arg)
+            except (QueryError, ValueError, TypeError, AttributeError) as e:
+                return self._reply(400, {"error": str(e)})
+            return self._reply(200, {"result": body, "elapsed_ms": 1e3*(time.perf_counter() - start)})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                return self._reply(200, {"status": "ok", "cache": service.cache_info()})
+            if url.path == "/params":
+                return self._reply(200, {"defaults": DEFAULTS, "offices": list(cost_model.OFFICES),
+                                         "years": service.cube.years.tolist()})
+            if url.path == "/cost":
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                return self._answer(service.query, query)
+            return self._reply(404, {"error": f"no route {url.path}"})
+
+        def do_POST(self):
+            try:
+                body = self._read_json()
+            except ValueError as e:
+                return self._reply(400, {"error": f"invalid JSON: {e}"})
+            if not isinstance(body, dict):
+                return self._reply(400, {"error": f"expected a JSON object, got {type(body).__name__}"})
+            path = urlparse(self.path).path
+            if path == "/cost":
+                return self._answer(service.query, body)
+            if path == "/batch":
+                if not isinstance(body.get("queries"), list):
+                    return self._reply(400, {"error": "expected {\"queries\": [...]}"})
+                return self._answer(service.batch, body["queries"])
+            return self._reply(404, {"error": f"no route {path}"})
+
+        # unix-socket clients have no address
+        def address_string(self):
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+# function that serves the service over TCP (host, port) or a Unix socket
+def serve(service: CostService, host: str = HOST, port: int = PORT, unix: str = None):
+    handler = make_handler(service)
+    if unix:
+        if os.path.exists(unix):
+            os.remove(unix)
+        server = ThreadingUnixHTTPServer(unix, handler)
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve RLA cost what-if queries.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="parameter sets kept in the LRU cache")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    svc = CostService(cache_size=args.cache_size)
+    svc.query({})
+    print(f"loaded {int(svc.present.sum())} state-years in {time.perf_counter() - start:.2f}s; "
+          f"listening on {args.unix or f'http://{args.host}:{args.port}'}")
+    serve(svc, args.host, args.port, args.unix)
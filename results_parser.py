@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+# one parser for the scraped results dumps: the NPR/NBC text dumps
+# (2024_US_President.txt, 2024_senate.txt) and the BBC/Ballotpedia tables
+# (2024_votes.tsv, 2022_senate.tsv). Files are streamed in blocks of lines;
+# the lines of a block are classified and converted with vectorized string
+# operations, and records are assembled from the classified lines with array
+# operations, so no Python code runs per line.
+#
+# A text dump is a sequence of records: a label line (state, district or
+# county), followed by its value lines: counts ("54"), percentages ("58.6%")
+# and the share of the expected vote counted ("98% in"). Lines that only mark
+# the previous record (e.g. "Flip"), blank lines and labels without any value
+# (title lines) are skipped. The first two percentages of a record are the
+# leading candidates' shares; a third percentage, if there is no "% in" line,
+# is the share counted.
+
+MARKERS = ["Flip"]
+PCT_SUFFIX, REPORTING_SUFFIX = "%", "% in"
+BLOCK = 1 << 22
+CHUNKSIZE = 100_000
+
+# line kinds
+LABEL, COUNT, PCT, REPORTING = range(4)
+
+# function that tells which strings only hold the given characters (and are not empty)
+def _only(strings: np.ndarray, chars: str):
+    return (np.char.str_len(strings) > 0) & (np.char.str_len(np.char.lstrip(strings, chars)) == 0)
+
+# function that classifies the lines of a text stream, one block of lines at a
+# time: yields the kind and value of every value or label line of the block,
+# and the text of its labels
+def tokenize(stream, block: int = BLOCK):
+    while True:
+        lines = stream.readlines(block)
+        if not lines:
+            return
+        lines = np.char.strip(np.array(lines))
+        lines = lines[(lines != "") & ~np.isin(lines, MARKERS)]
+        if not len(lines):
+            continue
+        # a line is a value when what precedes its suffix is a number, and a label otherwise
+        kind = np.full(len(lines), LABEL, dtype=np.int8)
+        value = np.full(len(lines), np.nan)
+        for k, cand, strip in [(REPORTING, np.char.endswith(lines, REPORTING_SUFFIX), len(REPORTING_SUFFIX)),
+                               (PCT, np.char.endswith(lines, PCT_SUFFIX), len(PCT_SUFFIX))]:
+            cand = np.flatnonzero(cand & (kind == LABEL))
+            num = np.char.rstrip(lines[cand], " in%" if k == REPORTING else PCT_SUFFIX)
+            ok = _only(num, "-.0123456789")
+            kind[cand[ok]] = k
+            try:
+                value[cand[ok]] = num[ok].astype(np.float64)
+            except ValueError as e:
+                raise ValueError(f"{getattr(stream, 'name', 'stream')}: malformed number ({e})")
+        cand = np.flatnonzero((kind == LABEL) & _only(lines, ",0123456789"))
+        kind[cand] = COUNT
+        if len(cand):
+            value[cand] = np.char.replace(lines[cand], ",", "").astype(np.int64)
+        yield kind, value, lines[kind == LABEL].astype(object)
+
+# function that places the tokens of a kind into one slot per record:
+# the rank-th token of every record that has one (NaN elsewhere)
+def _slot(rec: np.ndarray, value: np.ndarray, records: int, rank: int = 0):
+    out = np.full(records, np.nan)
+    within = np.arange(len(rec)) - np.searchsorted(rec, rec)
+    out[rec[within == rank]] = value[within == rank]
+    return out
+
+# function that assembles the records of classified lines (see read_text_results)
+def _records(path: str, kind: np.ndarray, value: np.ndarray, labels: np.ndarray):
+    # every line belongs to the record of the last label before it (values before the first label to none)
+    rec = np.cumsum(kind == LABEL) - 1
+    records = len(labels)
+    tok = (kind != LABEL) & (rec >= 0)
+    n_values = np.bincount(rec[tok], minlength=records)
+    cols = {}
+    for k in (PCT, REPORTING, COUNT):
+        sel = tok & (kind == k)
+        cols[k] = (rec[sel], value[sel])
+    n_pcts = np.bincount(cols[PCT][0], minlength=records)
+    keep = n_values > 0
+    bad = keep & (n_pcts < 2)
+    if bad.any():
+        raise ValueError(f"{path}: {', '.join(map(repr, labels[bad][:5]))} "
+                         f"{'has' if bad.sum() == 1 else 'have'} fewer than 2 percentages")
+    reporting = _slot(*cols[REPORTING], records)
+    reporting = np.where(np.isnan(reporting), _slot(*cols[PCT], records, 2), reporting)
+    count = _slot(*cols[COUNT], records)[keep]
+    return {"label": labels[keep], "first": _slot(*cols[PCT], records)[keep],
+            "second": _slot(*cols[PCT], records, 1)[keep], "reporting": reporting[keep],
+            "count": pd.arrays.IntegerArray(np.nan_to_num(count).astype(np.int64), np.isnan(count))}
+
+# function that parses a text dump into typed arrays: label, first and second
+# (the two leading percentages), reporting (share counted, NaN if missing) and
+# count (the record's first count, e.g. electoral votes; a nullable Int64 array,
+# missing where there is none). The records of every block are assembled as it
+# is read; only the last record of a block, which may go on in the next one,
+# is carried over.
+def read_text_results(path: str, block: int = BLOCK):
+    carry = (np.empty(0, np.int8), np.empty(0), np.empty(0, dtype=object))
+    parts = []
+    with open(path) as f:
+        for tokens in tokenize(f, block):
+            kind, value, labels = (np.concatenate(p) for p in zip(carry, tokens))
+            labels_at = np.flatnonzero(kind == LABEL)
+            cut = labels_at[-1] if len(labels_at) else 0
+            if cut:
+                parts.append(_records(path, kind[:cut], value[:cut], labels[:-1]))
+            carry = (kind[cut:], value[cut:], labels[-1:])
+    parts.append(_records(path, *carry))
+    return {name: _concat([p[name] for p in parts], "count" if name == "count" else "value") for name in parts[0]}
+
+# converters of table columns: text, counts with thousands separators
+# (parsed by the CSV reader itself, into nullable Int64 arrays: missing counts
+# stay missing and are skipped by sums), percentages
+def _count(col: pd.Series):
+    return pd.array(col, dtype="Int64")
+
+def _pct(col: pd.Series):
+    return pd.to_numeric(col.str.strip().str.rstrip("%").replace("", np.nan)).to_numpy(np.float64)
+
+CONVERTERS = {"text": lambda col: col.str.strip().to_numpy(object), "count": _count, "pct": _pct}
+
+# function that parses the given columns of a tab-separated table into typed
+# arrays, streaming it in chunks; columns maps a header name to "text", "count" or "pct"
+# (counts are nullable Int64 arrays)
+def read_tsv(path: str, columns: dict, chunksize: int = CHUNKSIZE):
+    parts = {name: [] for name in columns}
+    dtypes = {name: str for name, kind in columns.items() if kind != "count"}
+    for chunk in pd.read_csv(path, sep="\t", usecols=list(columns), dtype=dtypes, thousands=",",
+                             keep_default_na=False, na_values={n: [""] for n in columns if n not in dtypes},
+                             skipinitialspace=True, chunksize=chunksize):
+        for name, kind in columns.items():
+            parts[name].append(CONVERTERS[kind](chunk[name]))
+    return {name: _concat(p, columns[name]) for name, p in parts.items()}
+
+# function that joins the converted chunks of a column of the given kind
+def _concat(parts: list, kind: str):
+    if kind == "count":
+        return pd.concat(map(pd.Series, parts), ignore_index=True).array if parts else pd.array([], dtype="Int64")
+    return np.concatenate(parts) if parts else np.empty(0, dtype=object if kind == "text" else None)
+
+# function that sums a count column of a table per label (e.g. every candidate's
+# votes into the ballots cast in a state); missing counts are skipped.
+# returns a Series of the sums indexed by label
+def read_totals(path: str, label: str = "State", count: str = "Votes"):
+    table = read_tsv(path, {label: "text", count: "count"})
+    return pd.Series(table[count]).groupby(table[label], sort=False).sum(min_count=1).astype(np.float64)
@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# append-only store of the office results (margin, number of ballots and
+# procedural cost of every contest), keyed by (year, office, state). Every
+# ingest of a source file appends, per (office, year), one new partition with
+# only the rows that are new or changed, tagged with the source file, its
+# sha256 and the partition version; existing partitions are never rewritten.
+# An ingest is keyed on the content of its source file and on a fingerprint of
+# how the results are computed from it (the loader's code, the constants of
+# the cost model and the loader's options, see fingerprint). A source whose
+# last ingest had the same key is skipped without being parsed, so adding an
+# election cycle (or refreshing one as results come in) only parses the new
+# file, while a change of the model, of the code or of the options (or a
+# source reverted to earlier content) recomputes the results of the source
+# and appends the rows that changed. Readers see the latest version of every
+# key; the generation of each ingest tells which keys changed since a given
+# point. Ingests hold an exclusive lock on the store, so the office pipelines
+# can run side by side in separate processes.
+#
+#   results_store/manifest.json
+#   results_store/<office>/<year>/v<version>.csv
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(ROOT, "results_store")
+MANIFEST = "manifest.json"
+LOCK = "manifest.lock"
+KEY = ["year", "office", "state"]
+VALUES = ["state_po", "margin", "num_ballots", "procedural_cost"]
+
+def _sha256(path: str):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# function that fingerprints how the results of a source are computed: the
+# content of the code files of its loader and the loader's parameters (which
+# hold the constants of the model and the options of the run)
+def fingerprint(files: list, params: dict = None):
+    h = hashlib.sha256()
+    for path in files:
+        h.update(os.path.basename(path).encode())
+        h.update(_sha256(path).encode())
+    h.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+# function that returns the key of an ingest: the source content and the fingerprint of its loader
+def _ingest_key(sha256: str, fingerprint: str = ""):
+    return hashlib.sha256(f"{sha256}:{fingerprint}".encode()).hexdigest() if fingerprint else sha256
+
+class ResultsStore:
+    def __init__(self, root: str = STORE_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST)
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {"generation": 0, "sources": {}, "partitions": []}
+        # the key of the last ingest of every source file, by office and path
+        self.manifest.setdefault("latest", {})
+
+    @property
+    def generation(self):
+        return self.manifest["generation"]
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    # context manager that holds the store's lock (where the platform has
+    # one) and reloads the manifest, so that ingests of other processes are seen
+    @contextlib.contextmanager
+    def _locked(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK), "w") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            self._load()
+            yield
+
+    @staticmethod
+    def _source_name(office: str, path: str):
+        return f"{office}:{os.path.relpath(os.path.abspath(path), ROOT)}"
+
+    # function that checks whether the last ingest of a source file was of its
+    # current content, with a loader of the same fingerprint
+    def has_source(self, office: str, path: str, fingerprint: str = ""):
+        return self.manifest["latest"].get(self._source_name(office, path)) == _ingest_key(_sha256(path), fingerprint)
+
+    # function that returns the partitions of an office (or every office), in (office, year, version) order
+    def partitions(self, office: str = None, years=None):
+        parts = [p for p in self.manifest["partitions"]
+                 if (office is None or p["office"] == office) and (years is None or p["year"] in years)]
+        return sorted(parts, key=lambda p: (p["office"], p["year"], p["version"]))
+
+    # function that reads the latest version of every key. Rows keep the
+    # position their key first had; keys added by later versions follow.
+    def read(self, office: str = None, years=None):
+        parts = self.partitions(office, years)
+        if not parts:
+            return pd.DataFrame(columns=KEY + VALUES + ["source", "version"])
+        frame = pd.concat([pd.read_csv(os.path.join(self.root, p["path"]), float_precision="round_trip",
+                                       dtype={"office": str, "state": str, "state_po": str},
+                                       keep_default_na=False, na_values=[""])
+                           for p in parts], ignore_index=True)
+        first = frame.groupby(KEY, sort=False).ngroup().to_numpy()
+        latest = frame.drop_duplicates(KEY, keep="last")
+        latest = latest.iloc[np.argsort(first[latest.index.to_numpy()], kind="stable")]
+        return latest.reset_index(drop=True)
+
+    # function that appends the rows of frame (columns year, state and VALUES)
+    # that are new or changed; returns the (year, office, state, state_po) keys appended
+    def ingest(self, frame: pd.DataFrame, office: str, source: str, sha256: str = None, fingerprint: str = ""):
+        sha256 = sha256 or _sha256(source)
+        key = _ingest_key(sha256, fingerprint)
+        name = self._source_name(office, source)
+        frame = frame.reset_index()[["year", "state"] + VALUES].copy()
+        frame.insert(1, "office", office)
+        with self._locked():
+            current = self.read(office, set(frame["year"].tolist()))
+            merged = frame.merge(current[KEY + VALUES], on=KEY, how="left", suffixes=("", "_old"), indicator=True)
+            changed = (merged["_merge"] == "left_only").to_numpy()
+            for col in VALUES:
+                new, old = merged[col], merged[f"{col}_old"]
+                changed |= ~((new == old) | (new.isna() & old.isna())).to_numpy()
+            rows = frame[changed]
+            self.manifest["generation"] += 1
+            gen = self.manifest["generation"]
+            source = os.path.relpath(os.path.abspath(source), ROOT)
+            for year, part in rows.groupby("year", sort=True):
+                version = 1 + max([p["version"] for p in self.partitions(office, {int(year)})], default=0)
+                rel = os.path.join(office, str(year), f"v{version}.csv")
+                path = os.path.join(self.root, rel)
+                if os.path.exists(path):
+                    raise FileExistsError(f"{path} already exists; the results store is append-only")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                part = part.assign(source=source, version=version)
+                part.to_csv(path + ".tmp", index=False)
+                os.replace(path + ".tmp", path)
+                self.manifest["partitions"].append({"office": office, "year": int(year), "version": version,
+                                                    "path": rel, "rows": len(part), "generation": gen,
+                                                    "source": source, "source_sha256": sha256,
+                                                    "fingerprint": fingerprint})
+            self.manifest["sources"][key] = {"path": source, "office": office, "generation": gen,
+                                             "source_sha256": sha256, "fingerprint": fingerprint,
+                                             "rows": len(frame), "appended": int(changed.sum()),
+                                             "ingested": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self.manifest["latest"][name] = key
+            self._save()
+        return rows[["year", "office", "state", "state_po"]].reset_index(drop=True)
+
+    # function that ingests a source file with loader() (which returns its
+    # results frame), unless the last ingest of the file was of the same
+    # content with a loader of the same fingerprint; returns the keys appended
+    def ingest_file(self, office: str, path: str, loader, fingerprint: str = ""):
+        sha256 = _sha256(path)
+        if self.manifest["latest"].get(self._source_name(office, path)) == _ingest_key(sha256, fingerprint):
+            return pd.DataFrame(columns=["year", "office", "state", "state_po"])
+        return self.ingest(loader(), office, path, sha256, fingerprint)
+
+    # function that returns the keys appended after the given generation
+    def changes(self, since: int = 0, office: str = None):
+        parts = [p for p in self.partitions(office) if p["generation"] > since]
+        if not parts:
+            return pd.DataFrame(columns=["year", "office", "state", "state_po"])
+        frame = pd.concat([pd.read_csv(os.path.join(self.root, p["path"]), usecols=["year", "office", "state", "state_po"],
+                                       dtype=str, keep_default_na=False)
+                           for p in parts], ignore_index=True)
+        frame["year"] = frame["year"].astype(int)
+        return frame.drop_duplicates().reset_index(drop=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the append-only results store.")
+    parser.add_argument("--office", default=None)
+    parser.add_argument("--since", type=int, default=None, help="list the keys appended after this generation")
+    args = parser.parse_args()
+    store = ResultsStore()
+    if args.since is not None:
+        print(store.changes(args.since, args.office).to_string(index=False))
+    else:
+        print(f"generation {store.generation}")
+        for p in store.partitions(args.office):
+            print(f"{p['office']:10s} {p['year']} v{p['version']:<3d} {p['rows']:4d} rows  "
+                  f"gen {p['generation']:<3d} {p['source']}")
@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import pandas as pd
+from state_registry import get_registry
+
+# typed layout of the tables the pipeline passes around and writes: the
+# per-office margins, the vote totals and the merged state-year table. State
+# keys are categoricals over the registry (so a column of names is one small
+# integer code per row), years, ballot counts, vote totals and county counts
+# are narrow integers, and costs are floats held at a fixed precision of
+# COST_DECIMALS decimals: every cost of the model is a whole number of mills
+# (ballots*0.7, counties*169.84, votes/250, the central cost), so rounding to
+# mills only drops the float noise of the sums. Frames are cast once, when
+# they are built or read; the CSV readers parse straight into these dtypes
+# and the writers write them without an index column, so a table reads back
+# with the dtypes it was written with.
+
+COST_DECIMALS = 3
+
+# column kinds: a numpy or pandas dtype (e.g. the nullable "Int64"), "cost", or
+# "state"/"state_po" (categorical state keys)
+MARGINS = {"year": "int16", "state": "state", "state_po": "state_po", "district": "int16",
+           "margin": "float64", "num_ballots": "int32", "procedural_cost": "cost",
+           "totalvotes": "Int64", "rounded": "bool", "unopposed": "bool"}
+TOTALS = {"year": "int16", "state": "state", "state_po": "state_po", "totalvotes": "int64"}
+STATE_YEAR = {"year": "int16", "state": "state", "state_po": "state_po",
+              **{f"{measure}_{office}": kind for office in ("house", "senate", "president")
+                 for measure, kind in [("num_ballots", "int32"), ("procedural_cost", "cost")]},
+              "num_ballots_total": "int32", "procedural_cost_total": "cost", "procedural_cost_excl_pres": "cost",
+              "totalvotes": "int64", "num_counties": "int16", "prep_cost_total": "cost",
+              "central_cost_total": "cost", "cost_total": "cost", "cost_total_excl_pres": "cost"}
+
+# the categorical dtypes of the state keys, over every state of the registry (in sorted order)
+def state_dtypes():
+    registry = get_registry()
+    return {"state": pd.CategoricalDtype(sorted(registry.forms["name"])),
+            "state_po": pd.CategoricalDtype(sorted(registry.forms["postal"]))}
+
+# function that returns the pandas dtype of every column of a schema
+def dtypes(columns: dict):
+    states = state_dtypes()
+    return {col: states[kind] if kind in states else pd.api.types.pandas_dtype("float64" if kind == "cost" else kind)
+            for col, kind in columns.items()}
+
+# function that casts the columns of frame that are in the schema (in place),
+# drops leftover index columns ("Unnamed: 0") and returns the frame
+def apply(frame: pd.DataFrame, columns: dict):
+    frame.drop(columns=[c for c in frame.columns if str(c).startswith("Unnamed")], inplace=True)
+    types = dtypes(columns)
+    for col in frame.columns.intersection(list(columns)):
+        if columns[col] == "cost":
+            frame[col] = frame[col].to_numpy(dtype=np.float64).round(COST_DECIMALS)
+        elif frame[col].dtype != types[col]:
+            frame[col] = frame[col].astype(types[col])
+    return frame
+
+# function that reads a CSV written by write_csv (or an older one with an
+# index column), parsing the schema's columns straight into their dtypes
+def read_csv(path: str, columns: dict, usecols: list = None, **kwargs):
+    frame = pd.read_csv(path, usecols=usecols, dtype={c: t for c, t in dtypes(columns).items()
+                                                      if columns[c] != "cost" and (usecols is None or c in usecols)},
+                        **kwargs)
+    return apply(frame, columns)
+
+# function that writes a frame as CSV without an index column (named index
+# levels, e.g. year/state/state_po, are written as columns)
+def write_csv(frame: pd.DataFrame, path: str, columns: dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if any(name is not None for name in frame.index.names):
+        frame = frame.reset_index()
+    apply(frame, columns).to_csv(path, index=False)
+    return path
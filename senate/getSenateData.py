@@ -1,8 +1,25 @@
 import pandas as pd
 import os
 from functools import reduce
-import re
 import numpy as np
+import sys
+
+# the shared cost model lives at the top level of the repository
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asn_tables
+import cost_model
+import dataverse_cache
+import streaming_ingest
+import partitioned_writer
+import instrumentation
+import results_store
+import results_parser
+import dataframe_backend
+import schema
+import state_registry
+from state_registry import get_registry
+import argparse
+import functools
 # pull senate election data
 # data source citations (BibTeX, website)
 pd.set_option('display.max_columns', None)
@@ -27,136 +44,175 @@ https://doi.org/10.7910/DVN/PEJ5QU, Harvard Dataverse, V7, UNF:6:NFZ83YH7C/fCm6x
 # 2022 senate data: https://ballotpedia.org/United_States_Senate_elections,_2022 
 # state abbr. table:  https://www.scouting.org/resources/los/states/ 
 
+# the senate pipeline reads its sources from and writes its results to one
+# directory (by default, the one of this script)
+HERE = os.path.dirname(os.path.abspath(__file__))
+MEDSL_CSV = "dataverse_files/1976-2020-senate.csv"
+TABLE_2022 = "dataverse_files/2022_senate.tsv"
+TEXT_2024 = "dataverse_files/2024_senate.txt"
+# the ballots cast in every state in 2024 (no senate source has them, so the presidential returns stand in)
+VOTES_2024 = "../presidential/dataverse_files/2024_votes.tsv"
+# the code that turns the sources into results: this script and the modules its loaders use
+LOADER_CODE = [os.path.abspath(__file__)] + [m.__file__ for m in (asn_tables, cost_model, dataframe_backend,
+                                                                   dataverse_cache, streaming_ingest, results_parser,
+                                                                   state_registry)] \
+              + [state_registry.ABBR_PATH]
+
 # function to prepare 2024 senate data
-def prepare_2024_senate_data():
-    # processing of data
-    datafile = open("dataverse_files/2024_senate.txt")
-    data = datafile.read()
-    data = np.array(data.split("\n"))
-    datafile.close()
-
-    # split apart states and percents
-    is_state = np.array([type(re.search(pattern=r"\d+\.\d+%", string=dp))!=re.Match for dp in data])
-    states = np.char.upper(data[is_state])
-    pcts = np.char.replace(data[~is_state], "%", "").astype(float)/100
-    margins = np.abs((pcts[::3]-pcts[1::3]))
-    num_ballots = np.ceil(7/margins).astype(int)
+# (or the data of another cycle published in the same format); with totals, the
+# ballots cast in every state are looked up in that table of every candidate's votes
+@instrumentation.step("load")
+def prepare_2024_senate_data(path: str = os.path.join(HERE, TEXT_2024), year: int = 2024, totals: str = None):
+    # every record is a state followed by the two leading candidates' percents and the percent in
+    records = results_parser.read_text_results(path)
+    states = np.char.upper(records["label"].astype(str))
+    margins = np.abs(records["first"]/100 - records["second"]/100)
+    num_ballots = cost_model.margin_sample_sizes(margins, "senate")
 
     # add state abbreviations
-    state_abbr = pd.read_csv("dataverse_files/state_abbr.tsv", sep="\t")
-    state_abbr["State"] = state_abbr["State"].str.upper()
-    sabbr = list(map(lambda st: state_abbr[state_abbr['State']==st]['Postal'].item(), states))
+    sabbr = get_registry().convert(states, "name", "postal")
 
     # create dataFrame
-    final_df_data = {"year": [2024]*len(margins), "state": states, "state_po": sabbr, 
-                             "margin": margins, "num_ballots": num_ballots}
+    totalvotes = (results_parser.read_totals(totals).rename(str.upper).reindex(states).to_numpy(np.float64)
+                  if totals else np.full(len(states), np.nan))
+    final_df_data = {"year": [year]*len(margins), "state": states, "state_po": sabbr, 
+                             "margin": margins, "num_ballots": num_ballots, "totalvotes": totalvotes}
     final_df = pd.DataFrame(final_df_data)
     return final_df
 
 # function that calculates the margins and number of ballots (2000-2020)
-def calculate_margins_and_num_ballots_from_2000_to_2020():
+# (with a chunksize, the source is streamed in bounded chunks instead of read whole;
+# otherwise the scan and the per-party maxima run on the given dataframe backend)
+@instrumentation.step("load")
+def calculate_margins_and_num_ballots_from_2000_to_2020(chunksize: int = None,
+                                                        path: str = os.path.join(HERE, MEDSL_CSV),
+                                                        backend: str = None):
+    if chunksize:
+        all3 = streaming_ingest.senate_margins(path, years=(2000, 2020), chunksize=chunksize)
+        return all3.reset_index()
     # years we are looking at (2000-2024). We also don't care about independent parties and write-in
-    sen_elec_df = pd.read_csv("dataverse_files/1976-2020-senate.csv")
-
-    sen_elec_df = sen_elec_df[sen_elec_df["year"].between(2000,2020)]
-    sen_elec_df['writein'] = sen_elec_df['writein'].astype(dtype=bool)
-    sen_elec_df = sen_elec_df[(sen_elec_df["party_simplified"] != "OTHER") & ~sen_elec_df['writein']]
-
-    # drop some unnecessary columns
-    sen_elec_df.drop(columns=['mode', 'writein', 'district', 'special', 'unofficial', 'stage', 'version', 'party_detailed', 'office', 'state_ic', 'state_cen', 'state_fips', 'candidate'], inplace=True)
-    
-    # for each election year from 2000-2020, and state combination, find the margin
-    republican = sen_elec_df[sen_elec_df['party_simplified'].str.startswith("R")].groupby(by=['year','state','state_po']).max()
-    democrat = sen_elec_df[sen_elec_df['party_simplified'].str.startswith("D")].groupby(by=['year','state','state_po']).max()
-    libertaraian = sen_elec_df[sen_elec_df['party_simplified'].str.startswith("L")].groupby(by=['year','state','state_po']).max()
+    # only the years, columns and rows we need are read from the columnar cache
+    be = dataframe_backend.get_backend(backend)
+    sen_elec_df = be.scan(path, columns=['year', 'state', 'state_po', 'candidatevotes', 'totalvotes',
+                                         'party_simplified'],
+                          years=(2000, 2020), where=[("party_simplified", "!=", "OTHER"), ("writein", "==", False)])
+
+    # for each election year from 2000-2020, state and party combination, find the largest vote counts
+    parties = be.to_pandas(be.group_agg(sen_elec_df, ['year', 'state', 'state_po', 'party_simplified'],
+                                        {'candidatevotes': "max", 'totalvotes': "max"}))
+    republican, democrat, libertaraian = (parties[parties['party_simplified'].str.startswith(p)]
+                                          .drop(columns=['party_simplified']).set_index(['year', 'state', 'state_po'])
+                                          .add_suffix(f"_{p.lower()}") for p in "RDL")
     all3 = reduce(lambda L,R: pd.merge(L,R,on=['year','state','state_po'],how='outer'),[republican,democrat,libertaraian])
-    all3 = all3.rename(mapper=dict(zip(['writein_x', 'candidatevotes_x', 'totalvotes_x',
-                                        'party_simplified_x', 'writein_y', 'candidatevotes_y',
-                                        'totalvotes_y', 'party_simplified_y', 'writein',
-                                        'candidatevotes', 'totalvotes', 'party_simplified'],
-                                        ['writein_r', 'candidatevotes_r', 'totalvotes_r',
-                                        'party_simplified_r', 'writein_d', 'candidatevotes_d',
-                                        'totalvotes_d', 'party_simplified_d', 'writein_l',
-                                        'candidatevotes_l', 'totalvotes_l', 'party_simplified_l'])), axis=1)
     for pt in "rdl":
         all3[f"candidatevotes_{pt}"] = all3[f"candidatevotes_{pt}"].replace(float("nan"), 0)
         all3[f"totalvotes_{pt}"] = all3[f"totalvotes_{pt}"].replace(float("nan"), 0)
         all3[f"{pt}pct"] = all3[f"candidatevotes_{pt}"]/all3[f"totalvotes_{pt}"]
         all3[f"{pt}pct"] = all3[f"{pt}pct"].replace(float("nan"), 0)
     all3["margin"] = (all3['rpct']-all3['dpct']-all3['lpct']).abs()
-    all3["num_ballots"] = np.ceil(7/all3["margin"]).astype(int)
+    all3["num_ballots"] = cost_model.margin_sample_sizes(all3["margin"], "senate")
+    all3["totalvotes"] = all3[["totalvotes_r", "totalvotes_d", "totalvotes_l"]].max(axis=1)
     for col in all3.columns.to_list():
-        if col not in ["margin", "num_ballots"]:
+        if col not in ["margin", "num_ballots", "totalvotes"]:
             all3.drop(columns=[col], inplace=True)
-    all3.to_csv("dataverse_files/senate_margins_0020.csv")
-    return    
+    return all3.reset_index()
 
 # function to prepare 2022 senate data
-def prepare_2022_senate_data():
-    # read in csv, and remove irrelevant rows
-    data = pd.read_csv("dataverse_files/2022_senate.tsv", sep="\t")
+@instrumentation.step("load")
+def prepare_2022_senate_data(path: str = os.path.join(HERE, TABLE_2022)):
+    # the only columns we need are state, votes cast and margin
+    data = pd.DataFrame(results_parser.read_tsv(path, {"State": "text", "Votes-cast": "count", "Margin(%)": "pct"}))
+    data["Votes-cast"] = data["Votes-cast"].astype(np.float64)
+    # remove irrelevant rows
     data = data[~data["State"].str.contains(pat="special", case=False)]
-    
-    # the only columns we need are state and margin
-    cols = data.columns.tolist()
-    for col in cols:
-        if col not in ['State', 'Margin(%)']:
-            data.drop(columns=[col], inplace=True)
 
     # transfrom the data appropriately
     data['State'] = data['State'].str.replace(pat="U.S. Senate, ", repl="").str.upper()
     data['year'] = [2022]*len(data)
-    data['Margin(%)'] = data['Margin(%)'].str.replace(pat="%", repl="").astype(float)/100
-    data['num_ballots'] = np.ceil(7/data['Margin(%)']).astype(int)
+    data['Margin(%)'] = data['Margin(%)']/100
+    data['num_ballots'] = cost_model.margin_sample_sizes(data['Margin(%)'], "senate")
 
-    # add state abbreviations
-    state_abbr = pd.read_csv("dataverse_files/state_abbr.tsv", sep="\t")
-    state_abbr["State"] = state_abbr["State"].str.upper()
-    data = pd.merge(data, state_abbr, how='inner', on=['State'])
+    # add state abbreviations (states missing from the registry are dropped)
+    ids = get_registry().ids(data['State'], "name", missing="ignore")
+    data = data[ids >= 0].reset_index(drop=True)
+    data['Postal'] = get_registry().take(ids[ids >= 0], "postal")
 
-    # rename columns appropriately, and drop unnecessary columns
-    data.drop(columns=["Standard"], inplace=True)
+    # rename columns appropriately
     data = data.rename(mapper={'State':'state', 'Margin(%)':'margin', "year": "year", 
-                               "num_ballots": "num_ballots", "Postal": "state_po"}, axis=1)
+                               "num_ballots": "num_ballots", "Postal": "state_po", "Votes-cast": "totalvotes"}, axis=1)
     # final data
     return data
 
-# function that applies the procedural cost model
-# Procedural Total: (# of ballots needed for RLA *  "minutely" wage of county clerk * time per ballot)
-def procedural_cost(nbals: int):
-    minutesWage = 0.35
-    minutes_balTime = 2.
-    return nbals*minutesWage*minutes_balTime
-
-def join_data_and_add_procedural_cost(df22: pd.DataFrame, df24: pd.DataFrame):
-    # re-read 2000-20
-    _00_to_20 = pd.read_csv("dataverse_files/senate_margins_0020.csv")
-    # simply concatenate the other 2 as is
-    final = pd.concat([_00_to_20, df22, df24], axis=0).reset_index(drop=True)
-    # add the procdural cost according to our model
-    final["procedural_cost"] = final["num_ballots"].apply(lambda nb: procedural_cost(nbals=nb)).round(2)
-    return final
-
-def write_results(allData: pd.DataFrame):
-    allData.to_csv("senate_margins.csv")
-    if not os.path.exists("state-by-state"):
-        os.mkdir("state-by-state")
-    state_abbrs = set(allData['state_po'].to_list())
-    for sa in state_abbrs:
-        state_specific = allData[allData['state_po']==sa].reset_index(drop=True)
-        state_specific.to_csv(f"state-by-state/senate_margins_{sa}.csv")
+# function that adds the procedural cost according to our model
+# (with an audit, of its average sample numbers instead of 7/margin, with
+# escalations costed as a full hand count of the state's ballots cast)
+@instrumentation.step("transform")
+def add_procedural_cost(data: pd.DataFrame, audit: str = None):
+    data["num_ballots"] = cost_model.audit_sample_sizes(data["margin"], data["num_ballots"], audit,
+                                                        ballots_cast=data["totalvotes"])
+    data["procedural_cost"] = cost_model.procedural_cost(data["num_ballots"]).round(2)
+    return data
+
+# function that adds every source under directory not ingested yet to the
+# results store; only new or changed rows are appended. extra holds (year, path)
+# of further cycles in the 2024 text format. A source is parsed again when the
+# loader code, the cost model or the options changed. With an audit (see
+# cost_model.AUDITS), its average sample numbers replace 7/margin, and the 2024
+# ballots cast are read from VOTES_2024. returns the keys appended.
+@instrumentation.step("load")
+def ingest_sources(store: results_store.ResultsStore, directory: str = HERE, chunksize: int = None,
+                   extra: list = (), backend: str = None, audit: str = None):
+    medsl, table, text, votes = (os.path.join(directory, p) for p in (MEDSL_CSV, TABLE_2022, TEXT_2024, VOTES_2024))
+    totals = [votes] if audit else []
+    sources = [(medsl, functools.partial(calculate_margins_and_num_ballots_from_2000_to_2020, chunksize, medsl,
+                                         backend), None, []),
+               (table, functools.partial(prepare_2022_senate_data, table), None, []),
+               (text, functools.partial(prepare_2024_senate_data, text, 2024, *totals), None, totals)]
+    sources += [(path, functools.partial(prepare_2024_senate_data, path, year), year, [])
+                for year, path in extra]
+    params = {"chunksize": chunksize, "backend": backend, "audit": audit, "cost_model": cost_model.constants()}
+    return pd.concat([store.ingest_file("senate", path, lambda: add_procedural_cost(load(), audit),
+                                        results_store.fingerprint(LOADER_CODE + files, dict(params, year=year)))
+                      for path, load, year, files in sources], ignore_index=True)
+
+# function that reads the latest senate results of every year from the results store
+@instrumentation.step("merge")
+def read_results(store: results_store.ResultsStore):
+    return schema.apply(store.read("senate")[["year", "state", "state_po", "margin", "num_ballots", "procedural_cost"]],
+                        schema.MARGINS)
+
+# (with states, only the files of those states, and of states without a file, are rewritten)
+@instrumentation.step("write")
+def write_results(allData: pd.DataFrame, directory: str = HERE, states: list = None):
+    schema.write_csv(allData, os.path.join(directory, "senate_margins.csv"), schema.MARGINS)
+    partitioned_writer.write_partitions(allData, "state_po",
+                                        os.path.join(directory, "state-by-state/senate_margins_{}.csv"), only=states,
+                                        index=False)
     return
 
+# function that runs the whole senate pipeline on the sources under directory,
+# writes its results there and returns them
+def run(directory: str = HERE, chunksize: int = None, extra: list = (), store: results_store.ResultsStore = None,
+        backend: str = None, audit: str = None):
+    store = store or results_store.ResultsStore()
+    # 2000-2020, 2022 and 2024 senate data (and any added cycle), each parsed only once
+    appended = ingest_sources(store, directory, chunksize, extra, backend, audit)
+    # every year's latest results
+    full_data = read_results(store)
+    # add the total df to the files directory
+    # additionally calculate state specific margins (only the states that changed are rewritten)
+    write_results(full_data, directory, states=appended["state_po"].unique().tolist())
+    return full_data
+
 # main process
 if __name__ == "__main__":
-    # 2000-2020 senate data
-    calculate_margins_and_num_ballots_from_2000_to_2020()
-    # obtain 2024 data
-    df24 = prepare_2024_senate_data()
-    # obtain 2022 senate 
-    df22 = prepare_2022_senate_data()
-    # add the two dataframs to the 2000-20 df and calculate procedural cost
-    full_data = join_data_and_add_procedural_cost(df22=df22,df24=df24)
-    # add the total df to the files directory
-    # additionally calculate state specific margins
-    write_results(allData=full_data)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunksize", type=int, default=None, help="stream the source CSV in chunks of this many rows")
+    parser.add_argument("--add", nargs=2, action="append", default=[], metavar=("YEAR", "PATH"),
+                        help="also ingest the results of another cycle, in the 2024 text format")
+    parser.add_argument("--backend", choices=dataframe_backend.BACKENDS, default=None,
+                        help="dataframe engine of the heavy steps (default: pandas)")
+    parser.add_argument("--audit", choices=cost_model.AUDITS, default=None,
+                        help="use the average sample numbers of this audit instead of 7/margin")
+    args = parser.parse_args()
+    run(chunksize=args.chunksize, extra=[(int(y), p) for y, p in args.add], backend=args.backend, audit=args.audit)
\ No newline at end of file
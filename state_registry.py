@@ -0,0 +1,102 @@
+import os
+import numpy as np
+import pandas as pd
+
+# single registry of the reference data about states: full name, standard
+# (newspaper) short form, postal code, FIPS code and number of counties. It is
+# read once per process (get_registry) and every name form is indexed to a
+# dense integer state id, so whole columns of names map to ids, and ids to any
+# other form, in one vectorized lookup instead of a boolean scan per row.
+#
+# State ids are the join key wherever tables meet as arrays: StateYearCube
+# places every office, the vote totals and the county counts at (year, state
+# id), and the query service resolves every state it is asked about to an id
+# first. The frames themselves carry no id column; they keep the state name and
+# postal code columns every output file has, so the few merges of whole frames
+# (e.g. bravo.load_contests, the county model) still key on those, and ids are
+# taken at the lookup boundaries.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ABBR_PATH = os.path.join(ROOT, "state_abbr.tsv")
+COUNTIES_PATH = os.path.join(ROOT, "counties_by_state.tsv")
+
+# FIPS state codes by postal code
+FIPS = {"AL": 1, "AK": 2, "AZ": 4, "AR": 5, "CA": 6, "CO": 8, "CT": 9, "DE": 10, "DC": 11, "FL": 12,
+        "GA": 13, "HI": 15, "ID": 16, "IL": 17, "IN": 18, "IA": 19, "KS": 20, "KY": 21, "LA": 22, "ME": 23,
+        "MD": 24, "MA": 25, "MI": 26, "MN": 27, "MS": 28, "MO": 29, "MT": 30, "NE": 31, "NV": 32, "NH": 33,
+        "NJ": 34, "NM": 35, "NY": 36, "NC": 37, "ND": 38, "OH": 39, "OK": 40, "OR": 41, "PA": 42, "RI": 44,
+        "SC": 45, "SD": 46, "TN": 47, "TX": 48, "UT": 49, "VT": 50, "VA": 51, "WA": 53, "WV": 54, "WI": 55,
+        "WY": 56, "GU": 66, "PR": 72, "VI": 78, "CZ": 80}
+FORMS = ("name", "standard", "postal", "fips")
+
+_REGISTRY = None
+
+class StateRegistry:
+    def __init__(self, abbr_path: str = ABBR_PATH, counties_path: str = COUNTIES_PATH):
+        abbr = pd.read_csv(abbr_path, sep="\t", dtype=str)
+        for col in abbr.columns:
+            abbr[col] = abbr[col].str.strip()
+        # attribute arrays, indexed by state id
+        self.forms = {"name": abbr["State"].str.upper().to_numpy(dtype=object),
+                      "standard": abbr["Standard"].to_numpy(dtype=object),
+                      "postal": abbr["Postal"].to_numpy(dtype=object)}
+        self.forms["fips"] = np.array([FIPS.get(p, -1) for p in self.forms["postal"]], dtype=np.int64)
+        # number of counties, -1 where the source has no count (territories)
+        counties = pd.read_csv(counties_path, sep="\t")
+        counts = pd.Series(counties["Total Number of Counties"].to_numpy(),
+                           index=counties["State"].str.strip().str.upper())
+        self.num_counties = counts.reindex(self.forms["name"]).fillna(-1).to_numpy(dtype=np.int64)
+        # hash index of every name form
+        self._index = {form: pd.Index(values) for form, values in self.forms.items()}
+
+    def __len__(self):
+        return len(self.forms["name"])
+
+    # function that normalizes raw values of a name form the way the index stores them
+    @staticmethod
+    def _normalize(values, form: str):
+        values = pd.Series(np.asarray(values, dtype=object).ravel())
+        if form == "fips":
+            return pd.to_numeric(values, errors="coerce").fillna(-1).astype(np.int64)
+        values = values.astype(str).str.strip()
+        return values if form == "standard" else values.str.upper()
+
+    # function that maps a whole array of names (in one form) to state ids.
+    # unknown names raise a KeyError, or map to -1 with missing="ignore".
+    def ids(self, values, form: str = "name", missing: str = "raise"):
+        if form not in FORMS:
+            raise ValueError(f"unknown name form '{form}', expected one of {FORMS}")
+        # a categorical column is looked up once per category
+        if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+            codes = np.asarray(values.cat.codes)
+            keys = self._normalize(values.cat.categories, form)
+            idx = np.where(codes >= 0, self._index[form].get_indexer(keys)[codes], -1)
+            keys = keys.to_numpy()[codes]
+        else:
+            keys = self._normalize(values, form)
+            idx = self._index[form].get_indexer(keys)
+        if missing == "raise" and (idx < 0).any():
+            raise KeyError(f"unknown states {sorted(set(keys[idx < 0]))}")
+        return idx
+
+    # function that maps state ids to one name form (or "num_counties")
+    def take(self, ids, to: str = "postal"):
+        ids = np.asarray(ids, dtype=np.int64)
+        if to == "num_counties":
+            counts = self.num_counties[ids]
+            if (counts < 0).any():
+                missing = sorted(set(self.forms["name"][ids[counts < 0]]))
+                raise KeyError(f"no county count for {missing}")
+            return counts
+        return self.forms[to][ids]
+
+    # function that converts a whole array of names from one form to another
+    def convert(self, values, form: str = "name", to: str = "postal"):
+        return self.take(self.ids(values, form), to)
+
+# function that returns the process-wide registry, reading it on first use
+def get_registry():
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = StateRegistry()
+    return _REGISTRY
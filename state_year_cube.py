@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import cost_model
+import schema
+from state_registry import get_registry
+
+# dense (office x year x state) cube of the per-contest measures. The office
+# margins files and the vote totals are placed straight into typed arrays by
+# integer (office, year, state id) index, so joining them is index placement
+# and the office totals are reductions over the office axis. The cube exports
+# to the all_data_by_state_yr.csv schema; national and per-state aggregates
+# are sums and means over the year or state axis of the present cells.
+
+MARGIN_FILES = {"house": "house/house_margins.csv",
+                "senate": "senate/senate_margins.csv",
+                "president": "presidential/presidential_margins.csv"}
+TOTALS_PATH = "intermediate_data/totals.csv"
+
+class StateYearCube:
+    def __init__(self, years):
+        registry = get_registry()
+        self.years = np.asarray(years, dtype=np.int64)
+        shape = (len(self.years), len(registry))
+        offices = len(cost_model.OFFICES)
+        # per-office measures, and whether the office was on the ballot
+        self.contested = np.zeros((offices,) + shape, dtype=bool)
+        self.num_ballots = np.zeros((offices,) + shape)
+        self.procedural_cost = np.zeros((offices,) + shape)
+        # per state-year measures
+        self.has_votes = np.zeros(shape, dtype=bool)
+        self.totalvotes = np.zeros(shape)
+        # per state measures
+        self.num_counties = registry.num_counties
+
+    # every state-year that has a contest or a vote total
+    @property
+    def present(self):
+        return self.contested.any(axis=0) | self.has_votes
+
+    # function that turns the (year, state) columns of a frame into cube indices
+    def _cells(self, frame: pd.DataFrame):
+        years = frame["year"].to_numpy()
+        yi = np.searchsorted(self.years, years)
+        if (yi >= len(self.years)).any() or (self.years[np.minimum(yi, len(self.years) - 1)] != years).any():
+            raise KeyError(f"years outside the cube: {sorted(set(years) - set(self.years))}")
+        return yi, get_registry().ids(frame["state"], "name")
+
+    # function that places the contests of one office (year, state, num_ballots, procedural_cost rows)
+    def place(self, office: str, frame: pd.DataFrame):
+        o = cost_model.OFFICES.index(office)
+        yi, si = self._cells(frame)
+        self.contested[o, yi, si] = True
+        self.num_ballots[o, yi, si] = frame["num_ballots"].to_numpy()
+        self.procedural_cost[o, yi, si] = frame["procedural_cost"].to_numpy()
+
+    # function that places the ballots cast (year, state, totalvotes rows)
+    def place_votes(self, frame: pd.DataFrame):
+        yi, si = self._cells(frame)
+        self.has_votes[yi, si] = True
+        self.totalvotes[yi, si] = frame["totalvotes"].to_numpy()
+
+    # function that reads the office margins files
+    @staticmethod
+    def read_margins(margin_files: dict = MARGIN_FILES):
+        return {office: schema.read_csv(path, schema.MARGINS,
+                                        usecols=["year", "state", "num_ballots", "procedural_cost"])
+                for office, path in margin_files.items()}
+
+    # function that builds the cube from the office results (year, state,
+    # num_ballots, procedural_cost frames) and the vote totals
+    @classmethod
+    def from_frames(cls, frames: dict, totals: pd.DataFrame):
+        cube = cls(np.unique(np.concatenate([f["year"].to_numpy() for f in frames.values()]
+                                            + [totals["year"].to_numpy()])))
+        for office, frame in frames.items():
+            cube.place(office, frame)
+        cube.place_votes(totals)
+        return cube
+
+    # function that builds the cube from the office margins files and the vote totals
+    @classmethod
+    def from_files(cls, margin_files: dict = MARGIN_FILES, totals_path: str = TOTALS_PATH):
+        return cls.from_frames(cls.read_margins(margin_files),
+                               schema.read_csv(totals_path, schema.TOTALS, usecols=["year", "state", "totalvotes"]))
+
+    # function that sums an office measure over a subset of offices
+    def office_total(self, measure: np.ndarray, offices: tuple = cost_model.OFFICES):
+        return measure[[cost_model.OFFICES.index(o) for o in offices]].sum(axis=0)
+
+    # function that sums a (year x state) measure over the present states of every year
+    def national(self, values: np.ndarray):
+        return np.where(self.present, values, 0).sum(axis=1)
+
+    # function that averages a (year x state) measure over the present years of every state
+    def state_average(self, values: np.ndarray, years=None):
+        mask = self.present if years is None else self.present & np.isin(self.years, years)[:, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(mask, values, 0).sum(axis=0)/mask.sum(axis=0)
+
+    # function that exports the present cells in the all_data_by_state_yr.csv schema
+    # (ordered by year, then state), typed as in schema.STATE_YEAR
+    def to_frame(self):
+        registry = get_registry()
+        names = registry.forms["name"]
+        order = np.argsort(names, kind="stable")
+        yi, k = np.nonzero(self.present[:, order])
+        si = order[k]
+        out = {"year": self.years[yi], "state": names[si], "state_po": registry.forms["postal"][si]}
+        for o, office in enumerate(cost_model.OFFICES):
+            out[f"num_ballots_{office}"] = self.num_ballots[o, yi, si]
+            out[f"procedural_cost_{office}"] = self.procedural_cost[o, yi, si]
+        non_pres = tuple(o for o in cost_model.OFFICES if o != "president")
+        out["num_ballots_total"] = self.office_total(self.num_ballots)[yi, si]
+        out["procedural_cost_total"] = self.office_total(self.procedural_cost)[yi, si]
+        out["procedural_cost_excl_pres"] = self.office_total(self.procedural_cost, non_pres)[yi, si]
+        out["totalvotes"] = self.totalvotes[yi, si]
+        return schema.apply(pd.DataFrame(out), schema.STATE_YEAR)
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import cost_model
+
+# chunked, out-of-core ingestion of MEDSL-style returns. Sources are read in
+# bounded-size chunks with explicit dtypes and usecols; every chunk is reduced
+# to per-group partial aggregates (sum/max/min, all of which merge across
+# chunks) and folded into a running accumulator keyed by
+# (year, state, office, jurisdiction). Peak memory is set by the chunk size and
+# the number of groups, not by the size of the file.
+
+CHUNKSIZE = 250_000
+
+# explicit dtypes of the MEDSL columns the loaders use
+MEDSL_DTYPES = {"year": "int16", "state": "category", "state_po": "category", "office": "category",
+                "district": "string", "party_simplified": "category", "writein": "string",
+                "candidatevotes": "int64", "totalvotes": "int64", "votes": "int64",
+                "county_name": "category", "county_fips": "string", "jurisdiction_name": "category",
+                "precinct": "string", "mode": "category", "stage": "category"}
+
+# function that folds one chunk's partial aggregates into the accumulator
+def _fold(acc: pd.DataFrame, part: pd.DataFrame, aggs: dict):
+    if acc is None:
+        return part
+    both = pd.concat([acc, part])
+    return both.groupby(level=list(range(both.index.nlevels)), observed=True, sort=False).agg(aggs)
+
+# function that streams a CSV and aggregates it by keys. aggs maps each value
+# column to a mergeable reduction ("sum", "max" or "min"); row_filter is applied
+# to every chunk before it is reduced.
+def stream_aggregate(path: str, keys: list, aggs: dict, row_filter=None, chunksize: int = CHUNKSIZE,
+                     extra_columns: list = (), sep: str = ","):
+    usecols = list(dict.fromkeys(list(keys) + list(aggs) + list(extra_columns)))
+    dtype = {c: MEDSL_DTYPES[c] for c in usecols if c in MEDSL_DTYPES}
+    acc = None
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize, sep=sep):
+        if row_filter is not None:
+            chunk = row_filter(chunk)
+        if len(chunk) == 0:
+            continue
+        part = chunk.groupby(keys, observed=True, sort=False)[list(aggs)].agg(aggs)
+        acc = _fold(acc, part, aggs)
+    if acc is None:
+        return pd.DataFrame(columns=list(keys) + list(aggs)).set_index(list(keys))
+    return acc.sort_index()
+
+# function that turns the writein column (read as text) into the bool the office scripts use
+def _writein(chunk: pd.DataFrame):
+    # missing values count as write-ins, as with astype(bool) on the raw column
+    return chunk["writein"].fillna("True").str.lower().eq("true")
+
+def _years(chunk: pd.DataFrame, years: tuple):
+    return chunk["year"].between(*years)
+
+# function that reproduces the senate 2000-2020 margins (as getSenateData.py computes them) from a stream
+def senate_margins(path: str, years: tuple = (2000, 2020), chunksize: int = CHUNKSIZE):
+    def keep(chunk):
+        return chunk[_years(chunk, years) & (chunk["party_simplified"] != "OTHER") & ~_writein(chunk)]
+    acc = stream_aggregate(path, ["year", "state", "state_po", "party_simplified"],
+                           {"candidatevotes": "max", "totalvotes": "max"},
+                           row_filter=keep, chunksize=chunksize, extra_columns=["writein"])
+    # republican, democrat and libertarian are told apart by their first letter
+    acc = acc.reset_index()
+    acc["party"] = acc["party_simplified"].astype(str).str[0]
+    acc = acc.groupby(["year", "state", "state_po", "party"], observed=True)[["candidatevotes", "totalvotes"]].max()
+    wide = acc.unstack("party")
+    margin = 0
+    for pt, sign in (("R", 1), ("D", -1), ("L", -1)):
+        if ("candidatevotes", pt) not in wide.columns:
+            continue
+        pct = wide[("candidatevotes", pt)].fillna(0)/wide[("totalvotes", pt)].fillna(0)
+        margin = margin + sign*pct.fillna(0)
+    out = pd.DataFrame({"margin": np.abs(margin)})
+    out["num_ballots"] = cost_model.margin_sample_sizes(out["margin"], "senate")
+    out["totalvotes"] = wide["totalvotes"].fillna(0).max(axis=1)
+    return out
+
+# function that reproduces the presidential 2000-2020 margins from a stream
+def presidential_margins(path: str, years: tuple = (2000, 2020), chunksize: int = CHUNKSIZE):
+    def keep(chunk):
+        return chunk[_years(chunk, years) & chunk["party_simplified"].isin(["DEMOCRAT", "REPUBLICAN"]) & ~_writein(chunk)]
+    acc = stream_aggregate(path, ["year", "state", "state_po", "party_simplified"],
+                           {"candidatevotes": "sum", "totalvotes": "max"},
+                           row_filter=keep, chunksize=chunksize, extra_columns=["writein"])
+    wide = acc.unstack("party_simplified")
+    rep, dem = wide[("candidatevotes", "REPUBLICAN")], wide[("candidatevotes", "DEMOCRAT")]
+    margin = (rep - dem).abs()/wide[("totalvotes", "REPUBLICAN")]
+    out = margin.rename("margin").reset_index()
+    out["num_ballots"] = cost_model.margin_sample_sizes(out["margin"], "president")
+    out["totalvotes"] = wide[("totalvotes", "REPUBLICAN")].to_numpy(np.float64)
+    for col in ["state", "state_po"]:
+        out[col] = out[col].astype(object)
+    out["year"] = out["year"].astype(np.int64)
+    return out
+
+# function that reproduces the 2000-2022 house vote totals per state (as in get_total_votes_cast):
+# every district's total is counted once, however many candidate rows repeat it
+def house_totals(path: str, years: tuple = (2000, 2022), chunksize: int = CHUNKSIZE):
+    districts = stream_aggregate(path, ["year", "state", "state_po", "district", "totalvotes"],
+                                 {"candidatevotes": "max"},
+                                 row_filter=lambda c: c[_years(c, years)], chunksize=chunksize)
+    totals = districts.reset_index().groupby(["year", "state", "state_po"], observed=True)[["totalvotes"]].sum()
+    return totals
+
+# function that aggregates precinct- or county-level returns into
+# (year, state, office, jurisdiction) candidate and total votes. jurisdiction
+# is the column that identifies the unit to keep (county_name, jurisdiction_name, ...).
+def jurisdiction_totals(path: str, jurisdiction: str = "county_name", votes: str = "votes",
+                        chunksize: int = CHUNKSIZE, years: tuple = None):
+    keys = ["year", "state", "state_po", "office", jurisdiction]
+    def keep(chunk):
+        chunk = chunk if years is None else chunk[_years(chunk, years)]
+        return chunk.assign(party_simplified=chunk["party_simplified"].astype(str)
+                            .where(chunk["party_simplified"].isin(["DEMOCRAT", "REPUBLICAN"]), "OTHER"))
+    acc = stream_aggregate(path, keys + ["party_simplified"], {votes: "sum"},
+                           row_filter=keep, chunksize=chunksize)
+    wide = acc[votes].unstack("party_simplified", fill_value=0)
+    for party in ["DEMOCRAT", "REPUBLICAN", "OTHER"]:
+        if party not in wide.columns:
+            wide[party] = 0
+    out = pd.DataFrame({"votes_dem": wide["DEMOCRAT"], "votes_rep": wide["REPUBLICAN"],
+                        "totalvotes": wide[["DEMOCRAT", "REPUBLICAN", "OTHER"]].sum(axis=1)})
+    out["margin"] = ((out["votes_rep"] - out["votes_dem"]).abs()/out["totalvotes"]).fillna(0)
+    return out
@@ -0,0 +1,143 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+import cost_model
+import schema
+
+# what-if evaluator over the RLA cost model. Sample sizes, total votes and
+# county counts are laid out once as dense (year x state) arrays; every
+# combination of model parameters is then evaluated with broadcasting.
+# The total cost of a state-year is linear in the parameters:
+#   central + clerk_wage_hr*8*num_counties + hrs_to_idx*totalvotes/500
+#           + minutes_wage*minutes_bal_time*num_ballots(risk_limit)
+# so the national and per-state aggregates are reduced per component first
+# and never need the full (grid x year x state) cube.
+
+PARAMS = ("clerk_wage_hr", "hrs_to_idx", "minutes_wage", "minutes_bal_time", "central", "risk_limit")
+DEFAULTS = {"clerk_wage_hr": cost_model.CLERK_WAGE_HR, "hrs_to_idx": cost_model.HRS_TO_IDX,
+            "minutes_wage": cost_model.MINUTES_WAGE, "minutes_bal_time": cost_model.MINUTES_BAL_TIME,
+            "central": cost_model.CENTRAL_COST, "risk_limit": cost_model.RISK_LIMIT}
+
+# function that lays out the merged state-year table as dense (year x state) arrays
+def load_base(all_data: pd.DataFrame):
+    years = np.sort(all_data["year"].unique())
+    states = all_data[["state", "state_po"]].drop_duplicates().sort_values("state")
+    yi = np.searchsorted(years, all_data["year"].to_numpy())
+    si = pd.Index(states["state"]).get_indexer(all_data["state"])
+    shape = (len(years), len(states))
+    present = np.zeros(shape, dtype=bool)
+    present[yi, si] = True
+    num_ballots = np.zeros((len(cost_model.OFFICES),) + shape)
+    for o, office in enumerate(cost_model.OFFICES):
+        num_ballots[o, yi, si] = all_data[f"num_ballots_{office}"].to_numpy()
+    totalvotes = np.zeros(shape)
+    totalvotes[yi, si] = all_data["totalvotes"].to_numpy()
+    num_counties = np.zeros(shape)
+    num_counties[yi, si] = all_data["num_counties"].to_numpy()
+    return {"years": years, "state": states["state"].to_numpy(), "state_po": states["state_po"].to_numpy(),
+            "present": present, "num_ballots": num_ballots,
+            "totalvotes": totalvotes, "num_counties": num_counties}
+
+# function that reads the base arrays from the written state-year table
+def load_base_from_csv(path: str = "important-data/all_data_by_state_yr.csv"):
+    return load_base(schema.read_csv(path, schema.STATE_YEAR))
+
+# function that reshapes the values of one parameter so that they broadcast along its grid axis
+def _along(values: np.ndarray, axis: int, ndim: int, trailing: int):
+    shape = [1]*ndim + [1]*trailing
+    shape[axis] = len(values)
+    return values.reshape(shape)
+
+# function that combines the linear cost components for the whole grid.
+# every component is an array with the same trailing shape; ballots carries a
+# leading risk-limit axis.
+def _combine(grid: list, present, counties, votes, ballots):
+    ndim = len(grid)
+    trailing = np.ndim(present)
+    clerk, hrs, mwage, mtime, central, _ = [_along(g, i, ndim, trailing) for i, g in enumerate(grid)]
+    ballots = ballots.reshape((1,)*(ndim-1) + ballots.shape)
+    return (central*present + clerk*(cost_model.PREP_HRS_PER_COUNTY*counties)
+            + hrs*(votes/cost_model.BALLOTS_PER_BATCH) + mwage*mtime*ballots)
+
+# function that evaluates the cost model over the full parameter grid. Every
+# keyword takes a scalar or a sequence of values; anything omitted stays at its
+# default. Returns the grid axes, the (grid x year x state) cost cube (unless
+# keep_full is False) and the aggregates calculate_national_rla_cost and
+# calculate_state_by_state_rla_cost report, as float64 so that they match
+# those tables to the cent. dtype=np.float32 halves the memory of the results
+# of a huge grid, at the price of the cents of the national totals.
+def sweep(base: dict, keep_full: bool = True, dtype=np.float64, **ranges):
+    unknown = set(ranges) - set(PARAMS)
+    if unknown:
+        raise TypeError(f"unknown sweep parameter(s): {sorted(unknown)}")
+    grid = [np.atleast_1d(np.asarray(ranges.get(p, DEFAULTS[p]), dtype=float)) for p in PARAMS]
+    present = base["present"].astype(float)
+    is_pres = base["years"] % 4 == 0
+    counties = base["num_counties"]*present
+    votes = base["totalvotes"]
+    # sample sizes only depend on the risk limit: (risk x office x year x state)
+    ballots = cost_model.rescale_num_ballots(base["num_ballots"][None],
+                                             grid[-1].reshape(-1, 1, 1, 1))
+    nonpres = [i for i, o in enumerate(cost_model.OFFICES) if o != "president"]
+    ballots_all = ballots.sum(axis=1)
+    ballots_nopres = ballots[:, nonpres].sum(axis=1)
+
+    # national totals per year: reduce every component over states first
+    def by_year(arr):
+        return arr.sum(axis=-1)
+    nat_pres = _combine(grid, by_year(present), by_year(counties), by_year(votes), by_year(ballots_all))[..., is_pres]
+    nat_nopres = _combine(grid, by_year(present), by_year(counties), by_year(votes), by_year(ballots_nopres))
+    # per-state means: over presidential years, and over every year the state held an election
+    def by_state(arr, mask):
+        return (arr*mask[:, None]).sum(axis=-2)
+    ones = np.ones_like(is_pres)
+    n_pres = by_state(present, is_pres)
+    n_all = by_state(present, ones)
+    state_pres = _combine(grid, by_state(present, is_pres), by_state(counties, is_pres),
+                          by_state(votes, is_pres), by_state(ballots_all, is_pres))/n_pres
+    state_nopres = _combine(grid, by_state(present, ones), by_state(counties, ones),
+                            by_state(votes, ones), by_state(ballots_nopres, ones))/n_all
+    result = {"params": PARAMS, "grid": dict(zip(PARAMS, grid)),
+              "years": base["years"], "state": base["state"], "state_po": base["state_po"],
+              "total_yearly_cost_president": nat_pres.astype(dtype),
+              "total_yearly_cost_no_president": nat_nopres.astype(dtype),
+              "national_avg_president": nat_pres.mean(axis=-1).astype(dtype),
+              "national_avg_no_president": nat_nopres.mean(axis=-1).astype(dtype),
+              "avg_state_cost_president": state_pres.astype(dtype),
+              "avg_state_cost_no_president": state_nopres.astype(dtype)}
+    if keep_full:
+        result["cost_total"] = _combine(grid, present, counties, votes, ballots_all).astype(dtype)
+        result["cost_total_excl_pres"] = _combine(grid, present, counties, votes, ballots_nopres).astype(dtype)
+    return result
+
+# function that flattens the national averages of a sweep into a table, one row per grid point
+def sweep_table(result: dict):
+    mesh = np.meshgrid(*[result["grid"][p] for p in result["params"]], indexing="ij")
+    table = pd.DataFrame({p: m.ravel() for p, m in zip(result["params"], mesh)})
+    table["national_avg_president"] = result["national_avg_president"].ravel()
+    table["national_avg_no_president"] = result["national_avg_no_president"].ravel()
+    return table
+
+# function that parses "start:stop:num" into an evenly spaced range (or a single value)
+def parse_range(text: str):
+    parts = [float(p) for p in text.split(":")]
+    if len(parts) == 1:
+        return np.array(parts)
+    return np.linspace(parts[0], parts[1], int(parts[2]) if len(parts) == 3 else 2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the RLA cost model over a parameter grid.")
+    for p in PARAMS:
+        parser.add_argument(f"--{p}", type=parse_range, default=None,
+                            help=f"value or start:stop:num (default {DEFAULTS[p]})")
+    parser.add_argument("--data", default="important-data/all_data_by_state_yr.csv")
+    parser.add_argument("--out", default="important-data/sweep_national_avg.csv")
+    parser.add_argument("--float32", action="store_true", help="keep the results as float32 (huge grids)")
+    args = parser.parse_args()
+    ranges = {p: getattr(args, p) for p in PARAMS if getattr(args, p) is not None}
+    start = time.perf_counter()
+    res = sweep(load_base_from_csv(args.data), keep_full=False, dtype=np.float32 if args.float32 else np.float64,
+                **ranges)
+    sweep_table(res).to_csv(args.out, index=False)
+    print(f"evaluated {res['national_avg_president'].size} grid points in {time.perf_counter() - start:.2f}s")
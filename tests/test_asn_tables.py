@@ -0,0 +1,38 @@
+import itertools
+import numpy as np
+import pytest
+import asn_tables
+
+# the stopping-time distribution of every draw sequence of up to max_draws, enumerated
+def brute_force(a, b, q, alpha, max_draws):
+    t = np.log(1/alpha)
+    pmf = np.zeros(max_draws + 1)
+    escalate = 0.0
+    for bad in itertools.product([0, 1], repeat=max_draws):
+        p = np.prod([q if x else 1 - q for x in bad])
+        k = np.cumsum(bad)
+        n = np.arange(1, max_draws + 1)
+        stopped = np.flatnonzero(n*a - k*b >= t)
+        if len(stopped):
+            pmf[stopped[0] + 1] += p
+        else:
+            escalate += p
+    return pmf, escalate
+
+@pytest.mark.parametrize("method,margin,alpha", [("bravo", 0.4, 0.1), ("bravo", 0.6, 0.05),
+                                                 ("comparison", 0.9, 0.1)])
+def test_stopping_distribution_matches_enumeration(method, margin, alpha):
+    params = asn_tables.walk_params(margin, method, overstatement_rate=0.2)
+    pmf, escalate = asn_tables.stopping_distribution(*params, alpha, 14)
+    want, want_escalate = brute_force(*params, alpha, 14)
+    np.testing.assert_allclose(pmf, want, atol=1e-12)
+    assert escalate == pytest.approx(want_escalate, abs=1e-12)
+
+def test_without_bad_draws_the_audit_stops_at_the_boundary():
+    a, b, q = asn_tables.walk_params(0.5, "comparison", overstatement_rate=0.0)
+    pmf, escalate = asn_tables.stopping_distribution(a, b, q, 0.05, 100)
+    assert escalate == 0.0 and pmf[int(np.ceil(np.log(20)/a))] == 1.0
+
+def test_unknown_methods_are_rejected():
+    with pytest.raises(ValueError):
+        asn_tables.walk_params(0.1, "polling")
@@ -0,0 +1,47 @@
+import hashlib
+import numpy as np
+import pytest
+import ballot_sampler
+
+# Rivest's reference sampler: ticket t of a seed draws ballot SHA-256("seed,t") mod population, plus one
+def reference(seed, population, tickets):
+    return [int(hashlib.sha256(f"{seed},{t}".encode()).hexdigest(), 16) % population + 1 for t in tickets]
+
+def test_tickets_match_the_reference_sampler():
+    out = ballot_sampler.draw_tickets("20241105", 1_234_567, 1, 200)
+    assert out.tolist() == reference("20241105", 1_234_567, range(1, 201))
+
+def test_a_fixed_seed_draws_the_same_sample():
+    first = ballot_sampler.draw("seed", 10_000, 500)
+    second = ballot_sampler.draw("seed", 10_000, 500)
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    assert not np.array_equal(first[1], ballot_sampler.draw("other", 10_000, 500)[1])
+
+def test_without_replacement_every_ballot_is_the_first_draw_of_its_ticket():
+    population = 50
+    tickets, ballots = ballot_sampler.draw("seed", population, 40)
+    assert len(set(ballots.tolist())) == 40
+    assert np.all(np.diff(tickets) > 0)
+    # walking the reference tickets in order and skipping repeats gives the same sample
+    drawn = reference("seed", population, range(1, int(tickets[-1]) + 1))
+    seen, want = set(), []
+    for t, b in enumerate(drawn, start=1):
+        if b not in seen:
+            seen.add(b)
+            want.append((t, b))
+    assert list(zip(tickets.tolist(), ballots.tolist())) == want
+
+def test_escalating_extends_the_previous_sample():
+    first = ballot_sampler.draw("seed", 1_000, 100)
+    second = ballot_sampler.draw("seed", 1_000, 300, previous=first)
+    assert np.array_equal(second[1][:100], first[1])
+    assert np.array_equal(second[1], ballot_sampler.draw("seed", 1_000, 300)[1])
+
+def test_with_replacement_the_tickets_are_the_ballots():
+    tickets, ballots = ballot_sampler.draw("seed", 100, 300, replace=True)
+    assert tickets.tolist() == list(range(1, 301))
+    assert ballots.tolist() == reference("seed", 100, range(1, 301))
+
+def test_more_distinct_ballots_than_cast_are_rejected():
+    with pytest.raises(ValueError):
+        ballot_sampler.draw("seed", 10, 11)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+import cost_model
+
+def test_margin_sample_sizes_round_the_way_each_office_always_has():
+    margins = np.array([0.125, 0.25, 0.3])
+    assert cost_model.margin_sample_sizes(margins, "senate").tolist() == [56, 28, 24]
+    assert cost_model.margin_sample_sizes(margins, "house").tolist() == [56, 28, 24]
+    assert cost_model.margin_sample_sizes(margins, "president").tolist() == [57, 29, 24]
+
+def test_margin_sample_sizes_keep_the_index_of_a_series():
+    margins = pd.Series([0.5, 0.25], index=[3, 7])
+    assert cost_model.margin_sample_sizes(margins, "president").to_dict() == {3: 15, 7: 29}
+
+def test_margin_sample_sizes_follow_the_factor():
+    assert cost_model.margin_sample_sizes(np.array([0.1]), "senate", factor=14).tolist() == [140]
+
+def test_unknown_offices_are_rejected():
+    with pytest.raises(ValueError):
+        cost_model.margin_sample_sizes(np.array([0.1]), "mayor")
+
+def test_without_an_audit_the_sample_sizes_are_unchanged():
+    num_ballots = np.array([10, 20])
+    assert cost_model.audit_sample_sizes(np.array([0.7, 0.35]), num_ballots) is num_ballots
+
+def test_all_costs_add_up():
+    costs = cost_model.all_costs(np.array([[10.0], [20.0], [30.0]]), np.array([5.0]), np.array([10_000.0]))
+    procedural = cost_model.procedural_cost(60.0)
+    prep = cost_model.prep_cost(5.0, 10_000.0)
+    assert costs["procedural_cost_total"][0] == pytest.approx(procedural)
+    assert costs["cost_total"][0] == pytest.approx(procedural + prep + cost_model.CENTRAL_COST)
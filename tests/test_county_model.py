@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+from county_model import allocate
+
+def test_allocate_sums_exactly_to_every_group_total():
+    rng = np.random.default_rng(0)
+    groups = pd.Series(rng.integers(0, 40, 2_000))
+    weights = pd.Series(rng.integers(1, 10_000, 2_000))
+    totals = groups.map(pd.Series(rng.integers(0, 5_000, 40)))
+    out = allocate(totals, weights, [groups])
+    assert (out >= 0).all()
+    assert (out.groupby(groups).sum() == totals.groupby(groups).first()).all()
+
+def test_allocate_is_proportional_up_to_one_ballot():
+    weights = pd.Series([1, 2, 3, 4])
+    out = allocate(pd.Series([101]*4), weights, [pd.Series(["a"]*4)])
+    assert out.sum() == 101
+    assert (np.abs(out - 101*weights/weights.sum()) < 1).all()
+
+def test_allocate_splits_a_group_without_weight_evenly():
+    groups = [pd.Series(["a", "a", "a", "b"])]
+    out = allocate(pd.Series([10, 10, 10, 7]), pd.Series([0, 0, 0, 3]), groups)
+    assert out.tolist() == [4, 3, 3, 7]
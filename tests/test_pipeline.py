@@ -0,0 +1,70 @@
+import importlib
+import sys
+import pytest
+import pipeline
+from pipeline import Pipeline, Stage
+
+# every test works on modules of its own scratch repository
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "ROOT", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield tmp_path
+    for name in ("stages_mod", "helper_mod"):
+        sys.modules.pop(name, None)
+
+def write(path, text):
+    path.write_text(text)
+    importlib.invalidate_caches()
+
+def run(stages):
+    p = Pipeline(stages, cache_dir=".pipeline_cache")
+    p.run(workers=0)
+    return p
+
+def test_stage_is_skipped_when_nothing_changed(repo):
+    write(repo / "stages_mod.py", "def answer():\n    return 42\n")
+    import stages_mod
+    assert run([Stage("answer", stages_mod.answer)]).ran == ["answer"]
+    p = run([Stage("answer", stages_mod.answer)])
+    assert p.skipped == ["answer"] and p.value("answer") == 42
+
+def test_stage_reruns_when_a_helper_of_another_module_changes(repo):
+    write(repo / "helper_mod.py", "def scale(x):\n    return 2*x\n")
+    write(repo / "stages_mod.py", "import helper_mod\n\ndef doubled():\n    return helper_mod.scale(21)\n")
+    import stages_mod
+    assert run([Stage("doubled", stages_mod.doubled)]).ran == ["doubled"]
+    write(repo / "helper_mod.py", "def scale(x):\n    return 3*x + 0\n")
+    importlib.reload(sys.modules["helper_mod"])
+    p = run([Stage("doubled", stages_mod.doubled)])
+    assert p.ran == ["doubled"] and p.value("doubled") == 63
+
+def test_stage_reruns_when_a_helper_of_its_own_module_changes(repo):
+    write(repo / "stages_mod.py", "def helper():\n    return 1\n\ndef outer():\n    return helper()\n")
+    import stages_mod
+    assert run([Stage("outer", stages_mod.outer)]).ran == ["outer"]
+    write(repo / "stages_mod.py", "def helper():\n    return 1 + 1\n\ndef outer():\n    return helper()\n")
+    stages_mod = importlib.reload(stages_mod)
+    p = run([Stage("outer", stages_mod.outer)])
+    assert p.ran == ["outer"] and p.value("outer") == 2
+
+def test_stage_reruns_when_an_input_or_parameter_changes(repo):
+    write(repo / "stages_mod.py", "def read(path, suffix=''):\n    return open(path).read() + suffix\n")
+    import stages_mod
+    (repo / "in.txt").write_text("a")
+    def stage(suffix):
+        return Stage("read", stages_mod.read, inputs=["in.txt"], params={"path": "in.txt", "suffix": suffix})
+    run([stage("")])
+    assert run([stage("")]).skipped == ["read"]
+    (repo / "in.txt").write_text("bb")
+    assert run([stage("")]).value("read") == "bb"
+    assert run([stage("!")]).value("read") == "bb!"
+
+def test_a_stage_reading_a_written_file_runs_after_its_writer(repo):
+    write(repo / "stages_mod.py", "def write():\n    open('out.txt', 'w').write('x')\n\n"
+                                  "def read():\n    return open('out.txt').read()\n")
+    import stages_mod
+    p = run([Stage("read", stages_mod.read, inputs=["out.txt"]),
+             Stage("write", stages_mod.write, outputs=["out.txt"])])
+    assert p.ran == ["write", "read"] and p.value("read") == "x"
@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+import cost_model
+from query_service import CostService, QueryError
+from state_year_cube import StateYearCube
+
+@pytest.fixture(scope="module")
+def service():
+    def office(rows):
+        return pd.DataFrame(rows, columns=["year", "state", "num_ballots", "procedural_cost"])
+    frames = {"house": office([(2020, "OHIO", 100, 70.0), (2022, "OHIO", 50, 35.0)]),
+              "senate": office([(2022, "OHIO", 20, 14.0)]),
+              "president": office([(2020, "OHIO", 10, 7.0)])}
+    totals = pd.DataFrame({"year": [2020, 2022], "state": ["OHIO", "OHIO"], "totalvotes": [5_000, 4_000]})
+    return CostService(StateYearCube.from_frames(frames, totals))
+
+def test_a_cell_answers_with_the_model_at_the_default_parameters(service):
+    out = service.query({"state": "OH", "year": 2022, "office": "house,senate"})
+    assert out["num_ballots"] == 70
+    assert out["procedural_cost"] == pytest.approx(float(cost_model.procedural_cost(70)))
+    assert out["years"] == 1
+
+def test_states_resolve_in_every_form(service):
+    answers = [service.query({"state": s, "year": 2020}) for s in ("OH", "Ohio", "39")]
+    assert answers[0] == answers[1] == answers[2]
+
+@pytest.mark.parametrize("query", [{"office": ["senate", 3]}, {"office": "mayor"}, {"risk_limit": 1.5},
+                                   {"clerk_wage_hr": "lots"}, {"state": "Atlantis"}, {"year": 1999},
+                                   {"color": "red"}])
+def test_invalid_queries_raise_query_errors(service, query):
+    with pytest.raises(QueryError):
+        service.query(query)
+
+def test_queries_must_be_objects(service):
+    with pytest.raises(QueryError):
+        service.query(["senate"])
+
+def test_a_batch_answers_every_valid_query_and_reports_the_others(service):
+    out = service.batch([{"year": 2020}, ["not", "a", "query"], {"office": [None]}, "senate"])
+    assert "cost_total" in out[0]
+    assert all(set(o) == {"error"} for o in out[1:])
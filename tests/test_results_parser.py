@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+import results_parser
+
+DUMP = "Results\nOhio\n54.1%\n44.2%\n17\n99% in\nFlip\nUtah\n1,204\n60.0%\n38.5%\n95.0%\nVermont\n70.2%\n27.9%\n"
+
+@pytest.fixture
+def dump(tmp_path):
+    path = tmp_path / "dump.txt"
+    path.write_text(DUMP)
+    return str(path)
+
+def test_text_records_are_parsed(dump):
+    out = results_parser.read_text_results(dump)
+    assert out["label"].tolist() == ["Ohio", "Utah", "Vermont"]
+    assert out["first"].tolist() == [54.1, 60.0, 70.2]
+    assert out["second"].tolist() == [44.2, 38.5, 27.9]
+    np.testing.assert_array_equal(out["reporting"], [99.0, 95.0, np.nan])
+    assert out["count"].tolist() == [17, 1204, pd.NA]
+
+@pytest.mark.parametrize("block", [1, 7, 20, 64])
+def test_records_spanning_blocks_are_parsed_whole(dump, block):
+    whole, split = results_parser.read_text_results(dump), results_parser.read_text_results(dump, block)
+    for name in whole:
+        assert pd.Series(split[name]).equals(pd.Series(whole[name]))
+
+def test_a_record_with_fewer_than_two_percentages_is_rejected(tmp_path):
+    path = tmp_path / "bad.txt"
+    path.write_text("Ohio\n54.1%\n99% in\n")
+    with pytest.raises(ValueError, match="Ohio"):
+        results_parser.read_text_results(str(path))
+
+def test_missing_counts_stay_missing_and_are_skipped_by_totals(tmp_path):
+    path = tmp_path / "votes.tsv"
+    path.write_text("State\tVotes\tShare\nOhio\t1,000\t50%\nOhio\t\t20%\nUtah\t\t\nVermont\t7\t\n")
+    table = results_parser.read_tsv(str(path), {"State": "text", "Votes": "count", "Share": "pct"}, chunksize=2)
+    assert table["Votes"].tolist() == [1000, pd.NA, pd.NA, 7]
+    np.testing.assert_array_equal(table["Share"], [50.0, 20.0, np.nan, np.nan])
+    totals = results_parser.read_totals(str(path))
+    assert totals["Ohio"] == 1000 and totals["Vermont"] == 7 and np.isnan(totals["Utah"])
@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+import results_store
+from results_store import ResultsStore
+
+def frame(margin=0.1):
+    return pd.DataFrame({"year": [2024, 2024], "state": ["OHIO", "UTAH"], "state_po": ["OH", "UT"],
+                         "margin": [margin, 0.2], "num_ballots": [70, 35], "procedural_cost": [49.0, 24.5]})
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultsStore(str(tmp_path / "store"))
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.txt"
+    path.write_text("results")
+    return str(path)
+
+def test_fingerprint_follows_the_content_of_its_files_and_its_params(tmp_path):
+    code = tmp_path / "loader.py"
+    code.write_text("x = 1\n")
+    first = results_store.fingerprint([str(code)], {"audit": None})
+    assert results_store.fingerprint([str(code)], {"audit": None}) == first
+    assert results_store.fingerprint([str(code)], {"audit": "bravo"}) != first
+    code.write_text("x = 2\n")
+    assert results_store.fingerprint([str(code)], {"audit": None}) != first
+
+def test_a_source_is_parsed_again_only_when_its_fingerprint_changes(store, source):
+    calls = []
+    def loader():
+        calls.append(1)
+        return frame()
+    assert len(store.ingest_file("senate", source, loader, "a")) == 2
+    assert store.ingest_file("senate", source, loader, "a").empty
+    assert len(calls) == 1
+    # the same rows under a new fingerprint are parsed again, but nothing is appended
+    assert store.ingest_file("senate", source, loader, "b").empty
+    assert len(calls) == 2
+
+def test_only_changed_rows_are_appended_and_read_back_as_latest(store, source):
+    store.ingest_file("senate", source, frame, "a")
+    appended = store.ingest_file("senate", source, lambda: frame(0.05), "b")
+    assert appended["state_po"].tolist() == ["OH"]
+    latest = store.read("senate").set_index("state_po")
+    assert latest.loc["OH", "margin"] == 0.05 and latest.loc["UT", "margin"] == 0.2
+    assert store.changes(since=1)["state_po"].tolist() == ["OH"]
+
+def test_a_changed_source_is_parsed_again(store, source):
+    calls = []
+    def loader():
+        calls.append(1)
+        return frame()
+    store.ingest_file("senate", source, loader, "a")
+    with open(source, "a") as f:
+        f.write(" and more")
+    store.ingest_file("senate", source, loader, "a")
+    assert len(calls) == 2